@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#Title           :benchmark.py
+#Description     :Forward-model benchmark of pyReef-Core on the shipped BayesReef configurations.
+#Usage           :python benchmark.py [--runs 5] [--configs synth_ oti5] [--history benchmark_history.json]
+#Notes           :Each configuration is run on parameter vectors drawn from the prior with a fixed
+#                 seed. The time of one likelihood evaluation is split into phases using the
+#                 Model phase counters:
+#                     xml         parameter conversion and XmL/forcing files loading
+#                     forcing     sea-level, sediment and flow forcing (getSea, getSed, getFlow)
+#                     production  carbonate production (coralProduction)
+#                     ode         GLV solver and remaining time loop bookkeeping
+#                     depth       time to depth conversion of the core (core_timetodepth)
+#                     likelihood  comparison of the predicted core with the data
+#                 Results are appended to a JSON history and compared with the previous entry of
+#                 each configuration so that regressions in evaluations per second are visible.
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+from pyReefCore.model import Model
+from pyReefCore.sampling import telemetry
+from pyReefCore.forcing import datasetCache
+from pt_singlecore_sixassembledges import MCMC, core_convertbinary
+
+# name: (XmL input, data file, number of communities, binary data file or None)
+configurations = [
+    ('synth_', ('input_synth_.xml', 'data/synth_core.txt', 3, 'data/synth_core_bi.txt')),
+    ('synth_sixassem', ('input_synth_sixassem.xml', 'data/synth_core.txt', 6, None)),
+    ('hi3', ('input_hi3.xml', 'data/hi3.txt', 6, None)),
+    ('oti5', ('input_oti5.xml', 'data/oti5.txt', 6, None)),
+]
+
+phases = ['xml', 'forcing', 'production', 'ode', 'depth', 'likelihood']
+
+def load_configuration(name, simtime=8500):
+
+    xmlinput, datafile, communities, binfile = dict(configurations)[name]
+    core_depths = datasetCache.loadtable(datafile, usecols=0)
+    if binfile is not None:
+        core_data = datasetCache.loadtable(binfile)
+    else:
+        core_data = core_convertbinary(datasetCache.loadtable(datafile, usecols=1))
+    timestep = np.arange(0,simtime+1,50)
+    mcmc = MCMC(simtime, 1, communities, core_data, core_depths, timestep, '.', xmlinput,
+                [False, False], np.zeros(51), 0, 1, 1., 0., 1.)
+    mcmc.telemetry = telemetry.telemetry(console='warning')
+
+    return mcmc
+
+def evaluate(mcmc, reef, v, timer):
+    """
+    Run one likelihood evaluation and split its time into phases.
+    """
+
+    t0 = time.time()
+    reef.convert_vector(mcmc.communities, v, mcmc.sedsim, mcmc.flowsim)
+    reef.load_xml(mcmc.input, mcmc.sedsim, mcmc.flowsim)
+    reef.run_to_time(mcmc.simtime, showtime=100.)
+    output_core = reef.plot.core_timetodepth(mcmc.communities, mcmc.core_depths)
+    counters = reef.get_counters()
+    forcing = counters['sea_time'] + counters['sed_time'] + counters['flow_time']
+    timer['xml'] += time.time() - t0 - counters['run_time'] - counters['depth_time']
+    timer['forcing'] += forcing
+    timer['production'] += counters['production_time']
+    timer['ode'] += counters['run_time'] - forcing - counters['production_time']
+    timer['depth'] += counters['depth_time']
+    timer['ode_steps'] += counters['ode_steps']
+    timer['rhs_calls'] += counters['rhs_calls']
+
+    # Score the core already simulated
+    t0 = time.time()
+    mcmc.run_Model = lambda reef, v: output_core
+    try:
+        result = mcmc.likelihood_func(reef, mcmc.core_data, v)
+    finally:
+        del mcmc.run_Model
+    timer['likelihood'] += time.time() - t0
+
+    return result[0]
+
+def benchmark(name, runs, seed=1):
+    """
+    Time forward runs of a configuration on parameter vectors drawn from the prior.
+    """
+
+    np.random.seed(seed)
+    mcmc = load_configuration(name)
+    vectors = [mcmc.initial_replicaproposal() for r in range(runs+1)]
+
+    keys = phases + ['ode_steps', 'rhs_calls']
+
+    # Warm-up run (imports, file system caches)
+    evaluate(mcmc, Model(), vectors[0], dict([(key, 0.) for key in keys]))
+
+    timer = dict([(key, 0.) for key in keys])
+    likl = []
+    t0 = time.time()
+    for v in vectors[1:]:
+        likl.append(evaluate(mcmc, Model(), v, timer))
+    total = time.time() - t0
+
+    record = {'runs': runs, 'seconds_per_eval': total/runs, 'evals_per_sec': runs/total,
+              'phases': dict([(p, timer[p]/runs) for p in phases]),
+              'ode_steps': timer['ode_steps']/runs, 'rhs_calls': timer['rhs_calls']/runs,
+              'loglikelihood': float(np.mean(likl))}
+
+    return record
+
+def git_revision():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(fname):
+
+    if not os.path.isfile(fname):
+        return []
+    with open(fname, 'r') as infile:
+        return json.load(infile)
+
+def previous_record(history, name):
+
+    for entry in reversed(history):
+        if name in entry['results']:
+            return entry['results'][name]
+
+    return None
+
+def main():
+
+    parser = argparse.ArgumentParser(description='pyReef-Core forward model benchmark.')
+    parser.add_argument('--runs', type=int, default=5, help='timed forward runs per configuration')
+    parser.add_argument('--configs', nargs='+', default=[c[0] for c in configurations],
+                        choices=[c[0] for c in configurations], help='configurations to run')
+    parser.add_argument('--history', default='benchmark_history.json', help='JSON history file')
+    parser.add_argument('--tag', default='', help='free text label stored with the results')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative drop in evaluations per second reported as a regression')
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    entry = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': socket.gethostname(),
+             'python': platform.python_version(), 'numpy': np.__version__,
+             'revision': git_revision(), 'tag': args.tag, 'results': {}}
+
+    regression = False
+    for name in args.configs:
+        record = benchmark(name, args.runs)
+        entry['results'][name] = record
+
+        print '\n%s: %.3f s/eval, %.2f evals/s' %(name, record['seconds_per_eval'], record['evals_per_sec'])
+        for p in phases:
+            print '    %-10s %8.4f s  %5.1f %%' %(p, record['phases'][p],
+                100.*record['phases'][p]/record['seconds_per_eval'])
+        previous = previous_record(history, name)
+        if previous is not None:
+            change = record['evals_per_sec']/previous['evals_per_sec'] - 1.
+            print '    evals/s change since last record: %+.1f %%' %(100.*change)
+            if change < -args.threshold:
+                print '    REGRESSION: evals/s dropped by more than %.0f %%' %(100.*args.threshold)
+                regression = True
+
+    history.append(entry)
+    with open(args.history, 'w') as outfile:
+        json.dump(history, outfile, indent=2, sort_keys=True)
+    print '\nResults appended to %s' %args.history
+
+    if regression:
+        sys.exit(1)
+
+if __name__ == "__main__": main()
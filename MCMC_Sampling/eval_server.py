@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+#Title           :eval_server.py
+#Description     :Socket evaluation server of pyReef-Core for samplers running on other nodes.
+#Usage           :python eval_server.py --config synth_ --address 0.0.0.0:5555 [--workers 8] [--timeout 60]
+#Notes           :The server keeps one warm pyReef-Core model per worker process and streams back
+#                 the log-likelihood, difference score and core codes of each parameter vector.
+#                 A sampler uses it with mcmc.connect_server('host:5555'). The address can also be
+#                 a Unix socket path. There is no authentication: only listen on trusted networks.
+
+import argparse
+
+from benchmark import configurations, load_configuration
+
+def main():
+
+    parser = argparse.ArgumentParser(description='pyReef-Core evaluation server.')
+    parser.add_argument('--config', default='synth_', choices=[c[0] for c in configurations],
+                        help='configuration served')
+    parser.add_argument('--address', default='127.0.0.1:5555', help='host:port or Unix socket path')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPUs)')
+    parser.add_argument('--timeout', type=float, default=None, help='time limit of one forward run (s)')
+    args = parser.parse_args()
+
+    mcmc = load_configuration(args.config)
+    print 'Serving %s on %s' %(args.config, args.address)
+    mcmc.serve(args.address, nworkers=args.workers, timeout=args.timeout)
+
+if __name__ == "__main__": main()
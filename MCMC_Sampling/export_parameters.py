@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+#Title           :export_parameters.py
+#Description     :CSV export of the binary posterior records written by pyReefCore.saveParameters.
+#Usage           :python export_parameters.py results_dir [--names pos_sed pos_flow]
+#Notes           :saveParameters buffers the accepted samples and appends them as typed binary rows
+#                 to results_dir/pos_*.bin (dtype in pos_*.dtype). This tool writes the pos_*.csv
+#                 files with the layout of the previous text records (one row per accepted sample,
+#                 arrays written as lists). An incomplete last row of an interrupted run is skipped.
+
+import argparse
+
+from pyReefCore.saveParameters import exportParameters, readParameters
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Export BayesReef binary posterior records to CSV.')
+    parser.add_argument('results', help='results directory holding the pos_*.bin files')
+    parser.add_argument('--names', nargs='*', default=None, help='records to export (default: all)')
+    args = parser.parse_args()
+
+    names = exportParameters(args.results, args.names)
+    for name in names:
+        print '%-14s %8d rows -> %s/%s.csv' %(name, len(readParameters(args.results, name)), args.results, name)
+
+if __name__ == "__main__": main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#Title           :import_check.py
+#Description     :Cold-start import time of the pyReef-Core modules used by the samplers and workers.
+#Usage           :python import_check.py [--runs 5] [--budget 1.0] [--modules pyReefCore.model]
+#Notes           :Each module is imported in fresh interpreters, as a spawned worker or an evaluation
+#                 server does, and the median import time is reported together with the heavy
+#                 libraries loaded by the import (MPI, plotting, solver). The check fails (exit
+#                 status 1) when a median exceeds the budget or when a forbidden library is loaded,
+#                 these libraries being imported on first use only (plotting functions, odespy
+#                 solver, Model(distributed=True) for MPI).
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+modules = ['pyReefCore', 'pyReefCore.model', 'pyReefCore.remote', 'pyReefCore.evalServer',
+           'pyReefCore.sampling.speculativeMH']
+
+forbidden = ['mpi4py', 'matplotlib', 'pandas', 'skfuzzy', 'odespy', 'numba']
+
+child = '''
+import sys, time, json
+t0 = time.time()
+import %s
+t1 = time.time()
+from pyReefCore.lazyImport import loaded
+print json.dumps({'time': t1-t0, 'loaded': loaded(%r)})
+'''
+
+def measure(module, runs):
+    """
+    Import a module in fresh interpreters, return the import times and the forbidden
+    libraries it loaded.
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p])
+    times = []
+    loaded = set()
+    for run in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', child %(module, forbidden)], env=env)
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded.update([name.split('.')[0] for name in result['loaded']])
+
+    return np.array(times), sorted(loaded)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='pyReef-Core cold-start import check.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('--budget', type=float, default=1.0, help='largest median import time (s)')
+    parser.add_argument('--modules', nargs='+', default=modules, help='modules checked')
+    args = parser.parse_args()
+
+    failed = False
+    print '%-36s %9s %9s  %s' %('module', 'median(s)', 'max(s)', 'heavy libraries')
+    for module in args.modules:
+        times, loaded = measure(module, args.runs)
+        median = np.median(times)
+        print '%-36s %9.3f %9.3f  %s' %(module, median, times.max(), ', '.join(loaded) or '-')
+        if median > args.budget or len(loaded) > 0:
+            failed = True
+
+    if failed:
+        print '\nImport check failed: budget of %.2f s exceeded or heavy library loaded.' %args.budget
+        sys.exit(1)
+    print '\nImport check passed.'
+
+if __name__ == "__main__": main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#Title           :kernel_check.py
+#Description     :Validation of the pyReef-Core forward kernel against the odespy backend.
+#Usage           :python kernel_check.py [--config synth_] [--runs 20] [--seed 1] [--profile default]
+#Notes           :Parameter vectors drawn from the prior are run with the odespy backend (reference)
+#                 and the forward kernel (numba when installed, NumPy otherwise). The report gives
+#                 the cost, the speedup, the fraction of vectors whose predicted core codes change,
+#                 the fraction of changed intervals, the fraction of vectors whose log-likelihood
+#                 changes and the largest log-likelihood difference. The check fails (exit status
+#                 1) when the kernel is not safe or when the odespy library (RKF45 solver) is not
+#                 installed. Once it passes, the kernel can be moved from
+#                 pyReefCore.model.unvalidated to pyReefCore.model.backends.
+
+import sys
+import argparse
+import numpy as np
+
+from benchmark import configurations, load_configuration
+from pyReefCore.simulation import forwardKernel
+
+def main():
+
+    parser = argparse.ArgumentParser(description='pyReef-Core forward kernel validation.')
+    parser.add_argument('--config', default='synth_', choices=[c[0] for c in configurations],
+                        help='configuration checked')
+    parser.add_argument('--runs', type=int, default=20, help='parameter vectors drawn from the prior')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the prior draws')
+    parser.add_argument('--profile', default=None, help='solver accuracy profile of both backends')
+    args = parser.parse_args()
+
+    try:
+        import odespy
+        odespy.RKF45
+    except (ImportError, AttributeError):
+        print 'Kernel check needs the odespy library with its RKF45 solver.'
+        sys.exit(1)
+
+    np.random.seed(args.seed)
+    mcmc = load_configuration(args.config)
+    print 'Forward kernel backend: %s' %forwardKernel.backend()
+    report = mcmc.backend_study(nvalidation=args.runs, profile=args.profile)
+
+    print '\n%-8s %9s %8s %8s %10s %8s %10s  %s' %('backend', 'cost (s)', 'speedup', 'cores',
+                                                   'intervals', 'likl', 'max err', 'safe')
+    for row in report:
+        print '%-8s %9.3f %8.2f %7.1f%% %9.2f%% %7.1f%% %10.3e  %s' %(row['name'], row['cost'],
+            row['speedup'], 100.*row['code_changes'], 100.*row['interval_changes'],
+            100.*row['likelihood_changes'], row['maxerr'], row['safe'])
+    print 'Report written to backends.csv'
+
+    if not all([row['safe'] for row in report]):
+        print '\nKernel check failed: the kernel changes predicted cores or likelihoods.'
+        sys.exit(1)
+    print '\nKernel check passed.'
+
+if __name__ == "__main__": main()
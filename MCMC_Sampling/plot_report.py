@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#Title           :plot_report.py
+#Description     :Posterior diagnostic figures of a stored BayesReef chain.
+#Usage           :python plot_report.py results_dir [--workers 4] [--batch 4] [--maxpoints 0] [--method lttb] [--true data/true_values.txt]
+#Notes           :Reads the chain written by pt_singlecore_sixassembledges.py (results_dir/chain.npz)
+#                 and renders the histogram and trace of each parameter (results_dir/posterior) and
+#                 the sediment, flow and GLV boxplots on a pool of worker processes, without
+#                 sampling again. Traces are decimated to two points per pixel column (min/max
+#                 bucketing) unless --maxpoints is given (0 keeps every point); traces left with
+#                 more than --vector-limit points are rasterised in the PDF files.
+
+import time
+import argparse
+import numpy as np
+
+from pyReefCore.sampling import figureReport
+
+def main():
+
+    parser = argparse.ArgumentParser(description='BayesReef posterior figures of a stored chain.')
+    parser.add_argument('results', help='results directory holding chain.npz')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPUs)')
+    parser.add_argument('--batch', type=int, default=4, help='parameters drawn per job')
+    parser.add_argument('--maxpoints', type=int, default=None, help='points per drawn trace, 0 for all')
+    parser.add_argument('--method', default='minmax', choices=['minmax', 'lttb'], help='trace decimation')
+    parser.add_argument('--vector-limit', type=int, default=20000, help='largest vector trace (points)')
+    parser.add_argument('--true', default=None, help='file of reference parameter values')
+    parser.add_argument('--params', type=int, nargs='*', default=None, help='only draw these parameters')
+    args = parser.parse_args()
+
+    true_values = None
+    if args.true is not None:
+        true_values = np.loadtxt(args.true)
+
+    start = time.time()
+    report = figureReport.figureReport(args.results, '%s/chain.npz' % args.results, true_values,
+                                       nworkers=args.workers, batch=args.batch,
+                                       maxpoints=args.maxpoints, method=args.method,
+                                       vector_limit=args.vector_limit)
+    if args.params is not None:
+        files = report.posterior(args.params)
+    else:
+        nparams = report.chain.nparams
+        files = report.all([('sed', range(0,12), 'Sediment'), ('flow', range(12,24), 'Flow'),
+                            ('glv', range(24,nparams), 'GLV')])
+
+    print '%d figures written in %.1f s' %(len(files), time.time()-start)
+
+if __name__ == "__main__": main()
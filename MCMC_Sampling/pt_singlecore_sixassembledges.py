@@ -14,6 +14,13 @@ import matplotlib.pyplot as plt
 from matplotlib import ticker
 import matplotlib.mlab as mlab
 from pyReefCore.model import Model
+from pyReefCore.sampling import speculativeMH, delayedAcceptance, surrogateGP
+from pyReefCore.forcing import fidelityLevels, datasetCache, xmlParser
+from pyReefCore.sampling import telemetry, chainStore, predictiveSummary, figureReport, snapshotWriter
+from pyReefCore.remote import RemoteModel, RemoteTimeout
+from pyReefCore.simulation.coralGLV import budgetExceeded
+from pyReefCore.simulation.compactCore import compactCore
+from pyReefCore.evalServer import evalServer, evalClient
 import fnmatch
 import matplotlib as mpl
 from cycler import cycler
@@ -32,6 +39,7 @@ class MCMC():
         self.communities = communities
         self.samples = samples       
         self.core_data = core_data
+        self.data_core = compactCore.from_onehot(core_data, core_depths) # uint8 codes of the data
         self.core_depths = core_depths
         self.timestep = timestep
         self.vis = vis
@@ -61,6 +69,19 @@ class MCMC():
         self.burn_in = burn_in
         self.pt_stage = pt_stage
 
+        # Sampler events and periodic progress summaries (see main for the log file)
+        self.telemetry = telemetry.telemetry()
+        # Optional local worker pool running the forward model (see start_remote)
+        self.remote = None
+        # Optional client of an evaluation server scoring the proposals (see connect_server)
+        self.evaluator = None
+        # Per-evaluation budgets and likelihood given to aborted runs (see set_watchdog)
+        self.max_evaltime = None
+        self.max_rhs = None
+        self.penalty = None
+        # Optional background writer of the core snapshots (see start_snapshots)
+        self.snapshots = None
+
         if config ==1:
             self.step_m = 0.1 
             self.step_a = 0.02   
@@ -101,16 +122,85 @@ class MCMC():
 
 
 
+    def set_watchdog(self, max_evaltime=None, max_rhs=None, penalty=None):
+        # abort forward runs exceeding max_evaltime seconds or max_rhs GLV right-hand side
+        # evaluations; they get the penalty log-likelihood (default: lowest attainable value)
+        self.max_evaltime = max_evaltime
+        self.max_rhs = max_rhs
+        self.penalty = penalty
+
+    def penalty_likelihood(self):
+        if self.penalty is not None:
+            return self.penalty
+        # every interval mismatched, see score_core
+        z = 0.1/(1+(1+self.communities)*0.1)
+        return self.core_data.shape[0] * (self.communities+1) * np.log(z)
+
+    def penalize(self, input_v, error):
+        # log the offending vector and return the penalty in the likelihood_func format
+        loglik = self.penalty_likelihood()
+        self.telemetry.warning('budget_exceeded', reason=str(error), vector=input_v)
+        with file(('%s/watchdog.txt' % (self.filename)),'a') as outfile:
+            np.savetxt(outfile, np.array([input_v]), fmt='%1.8e')
+        sediment = np.ones(self.core_data.shape[0]) * (self.communities+1) # sediment only
+        proportions = np.zeros((self.core_data.shape[0], self.communities+1))
+        proportions[:,self.communities] = 1.
+        pred_core = compactCore(sediment, self.core_depths, proportions)
+        return [loglik *(1.0/self.adapttemp), pred_core, 100.]
+
+    def load_reference(self):
+        # sediment and flow curves of the XmL input (the 'True' thresholds of pos_sedflow),
+        # which run_Model only sets when the forward model runs in this process
+        input = xmlParser.xmlParser(self.input, makeUniqueOutputDir=False)
+        self.initial_sed, self.initial_flow = input.enviSed, input.enviFlow
+
+    def start_remote(self, nworkers=None, timeout=None):
+        # forward runs are farmed out to persistent worker processes holding their own Model
+        self.load_reference()
+        if timeout is None:
+            timeout = self.max_evaltime
+        self.remote = RemoteModel(self.input, self.communities, self.core_depths, self.simtime,
+                                  self.sedsim, self.flowsim, nworkers=nworkers, timeout=timeout,
+                                  maxRHS=self.max_rhs)
+        return self.remote
+
+    def stop_remote(self):
+        if self.remote is not None:
+            self.remote.close()
+            self.remote = None
+
+    def serve(self, address, nworkers=None, timeout=None):
+        # evaluation server scoring batches of proposals sent by evalClient instances
+        self.adapttemp = 1
+        remote = self.start_remote(nworkers, timeout)
+        self.remote = None
+        server = evalServer(remote, lambda core: self.score_core(core, self.core_data), address)
+        try:
+            server.serve_forever()
+        finally:
+            remote.close()
+
+    def connect_server(self, address, timeout=None):
+        # likelihood_func then sends the proposals to the evaluation server at address
+        self.load_reference()
+        self.evaluator = evalClient(address, timeout=timeout)
+        return self.evaluator
+
     def run_Model(self, reef, input_vector):
+        if self.remote is not None:
+            return self.remote.run(input_vector)
         reef.convert_vector(self.communities, input_vector, self.sedsim, self.flowsim) #model.py
         self.initial_sed, self.initial_flow = reef.load_xml(self.input, self.sedsim, self.flowsim)
 
 
-        print(self.initial_sed, self.initial_flow , '   * initial sed and initial flow')
-        if self.vis[0] == True:
+        self.telemetry.debug('initial_forcing', sed=self.initial_sed, flow=self.initial_flow)
+        # with a background writer the figures of accepted samples are written by save_core
+        draw = self.snapshots is None
+        if self.vis[0] == True and draw:
             reef.core.initialSetting(size=(8,2.5), size2=(8,3.5)) # View initial parameters
+        reef.set_budget(self.max_evaltime, self.max_rhs)
         reef.run_to_time(self.simtime,showtime=100.)
-        if self.vis[1] == True:
+        if self.vis[1] == True and draw:
             from matplotlib.cm import terrain, plasma
             nbcolors = len(reef.core.coralH)+10
             colors = terrain(np.linspace(0, 1.8, nbcolors))
@@ -122,23 +212,17 @@ class MCMC():
         #return predicted_core 
         return output_core
 
-    def pos_sedflow(self, pos):
+    def pos_sedflow(self, chain):
+        # sediment and flow threshold summaries from the weighted posterior (chainStore)
 
-
-        pos_sed1 = pos[0:3,:]   
-        pos_sed2 = pos[3:6,:]
-        pos_sed3 = pos[6:9,:]
-        pos_sed4 = pos[9:12,:]
-        pos_flow1 = pos[12:15,:]
-        pos_flow2 = pos[15:19,:]
-        pos_flow3 = pos[19:22,:] 
-        pos_flow4 = pos[22:25,:] 
-
-
-        nb_bins=30
-        slen = np.arange(0,pos_sed1.shape[0],1)
- 
- 
+        mean = chain.mean()
+        lb, ub = chain.percentile([5, 95])
+        median = chain.median()
+        mode = chain.mode()
+        # parameter index of threshold k (0 to 3) of community a, see Model.convert_vector
+        nc = self.communities
+        sed = lambda k, a: k*nc + a
+        flow = lambda k, a: (4*nc if self.sedsim else 0) + k*nc + a
 
 
         # PLOT SEDIMENT AND FLOW RESPONSE THRESHOLDS #
@@ -152,43 +236,42 @@ class MCMC():
         sed1_mu, sed1_ub, sed1_lb, sed2_mu, sed2_ub, sed2_lb, sed3_mu, sed3_ub, sed3_lb, sed4_mu, sed4_ub, sed4_lb = (np.zeros(self.communities) for i in range(12))
         if ((self.sedsim != False)):
             for a in range(self.communities):
-                sed1_mu[a] = np.mean(pos_sed1[:,a])
-                sed1_ub[a] = np.percentile(pos_sed1[:,a], 95, axis=0)
-                sed1_lb[a] = np.percentile(pos_sed1[:,a], 5, axis=0)
+                sed1_mu[a] = mean[sed(0,a)]
+                sed1_ub[a] = ub[sed(0,a)]
+                sed1_lb[a] = lb[sed(0,a)]
                 
-                sed2_mu[a] = np.mean(pos_sed2[:,a])
-                sed2_ub[a] = np.percentile(pos_sed2[:,a], 95, axis=0)
-                sed2_lb[a] = np.percentile(pos_sed2[:,a], 5, axis=0)
+                sed2_mu[a] = mean[sed(1,a)]
+                sed2_ub[a] = ub[sed(1,a)]
+                sed2_lb[a] = lb[sed(1,a)]
                 
-                sed3_mu[a] = np.mean(pos_sed3[:,a])
-                sed3_ub[a] = np.percentile(pos_sed3[:,a], 95, axis=0)
-                sed3_lb[a] = np.percentile(pos_sed3[:,a], 5, axis=0)
+                sed3_mu[a] = mean[sed(2,a)]
+                sed3_ub[a] = ub[sed(2,a)]
+                sed3_lb[a] = lb[sed(2,a)]
                 
-                sed4_mu[a] = np.mean(pos_sed4[:,a])
-                sed4_ub[a] = np.percentile(pos_sed4[:,a], 95, axis=0)
-                sed4_lb[a] = np.percentile(pos_sed4[:,a], 5, axis=0)
-
-                sed1_mu_=sed1_mu[a]
-                sed2_mu_=sed2_mu[a]
-                sed3_mu_=sed3_mu[a]
-                sed4_mu_=sed4_mu[a]
-                sed1_min=sed1_lb[a]
-                sed2_min=sed2_lb[a]
-                sed3_min=sed3_lb[a]
-                sed4_min=sed4_lb[a]
-                sed1_max=sed1_ub[a]
-                sed2_max=sed2_ub[a]
-                sed3_max=sed3_ub[a]
-                sed4_max=sed4_ub[a]
-                sed1_med=np.median(pos_sed1[:,a])
-                sed2_med=np.median(pos_sed2[:,a])
-                sed3_med=np.median(pos_sed3[:,a])
-                sed4_med=np.median(pos_sed4[:,a])
-                sed1_mode, count=stats.mode(pos_sed1[:,a])
-                sed2_mode, count=stats.mode(pos_sed2[:,a])
-                sed3_mode, count=stats.mode(pos_sed3[:,a])
-                sed4_mode, count=stats.mode(pos_sed4[:,a])
-
+                sed4_mu[a] = mean[sed(3,a)]
+                sed4_ub[a] = ub[sed(3,a)]
+                sed4_lb[a] = lb[sed(3,a)]
+                
+                sed1_mu_ = sed1_mu[a]
+                sed2_mu_ = sed2_mu[a]
+                sed3_mu_ = sed3_mu[a]
+                sed4_mu_ = sed4_mu[a]
+                sed1_min = sed1_lb[a]
+                sed1_max = sed1_ub[a]
+                sed1_med = median[sed(0,a)]
+                sed2_min = sed2_lb[a]
+                sed2_max = sed2_ub[a]
+                sed2_med = median[sed(1,a)]
+                sed3_min = sed3_lb[a]
+                sed3_max = sed3_ub[a]
+                sed3_med = median[sed(2,a)]
+                sed4_min = sed4_lb[a]
+                sed4_max = sed4_ub[a]
+                sed4_med = median[sed(3,a)]
+                sed1_mode = mode[sed(0,a)]
+                sed2_mode = mode[sed(1,a)]
+                sed3_mode = mode[sed(2,a)]
+                sed4_mode = mode[sed(3,a)]
 
                 with file(('%s/summ_stats.txt' % (self.filename)),'a') as outfile:
                     #outfile.write('\n# Sediment threshold: {0}\n'.format(a_labels[a]))
@@ -232,42 +315,42 @@ class MCMC():
         flow1_mu, flow1_ub,flow1_lb, flow2_mu, flow2_ub,flow2_lb, flow3_mu, flow3_ub,flow3_lb, flow4_mu, flow4_ub,flow4_lb = (np.zeros(self.communities) for i in range(12))
         if (self.flowsim != False):
             for a in range(self.communities):
-                flow1_mu[a] = np.mean(pos_flow1[:,a])
-                flow1_ub[a] = np.percentile(pos_flow1[:,a], 95, axis=0)
-                flow1_lb[a] = np.percentile(pos_flow1[:,a], 5, axis=0)
+                flow1_mu[a] = mean[flow(0,a)]
+                flow1_ub[a] = ub[flow(0,a)]
+                flow1_lb[a] = lb[flow(0,a)]
                 
-                flow2_mu[a] = np.mean(pos_flow2[:,a])
-                flow2_ub[a] = np.percentile(pos_flow2[:,a], 95, axis=0)
-                flow2_lb[a] = np.percentile(pos_flow2[:,a], 5, axis=0)
+                flow2_mu[a] = mean[flow(1,a)]
+                flow2_ub[a] = ub[flow(1,a)]
+                flow2_lb[a] = lb[flow(1,a)]
                 
-                flow3_mu[a] = np.mean(pos_flow3[:,a])
-                flow3_ub[a] = np.percentile(pos_flow3[:,a], 95, axis=0)
-                flow3_lb[a] = np.percentile(pos_flow3[:,a], 5, axis=0)
+                flow3_mu[a] = mean[flow(2,a)]
+                flow3_ub[a] = ub[flow(2,a)]
+                flow3_lb[a] = lb[flow(2,a)]
+                
+                flow4_mu[a] = mean[flow(3,a)]
+                flow4_ub[a] = ub[flow(3,a)]
+                flow4_lb[a] = lb[flow(3,a)]
                 
-                flow4_mu[a] = np.mean(pos_flow4[:,a])
-                flow4_ub[a] = np.percentile(pos_flow4[:,a], 95, axis=0)
-                flow4_lb[a] = np.percentile(pos_flow4[:,a], 5, axis=0)
-
                 flow1_mu_ = flow1_mu[a]
                 flow2_mu_ = flow2_mu[a]
                 flow3_mu_ = flow3_mu[a]
                 flow4_mu_ = flow4_mu[a]
-                flow1_min= flow1_lb[a]
-                flow1_max=flow1_ub[a]
-                flow1_med=np.median(pos_flow1[:,a])
-                flow2_min=flow2_lb[a]
-                flow2_max=flow2_ub[a]
-                flow2_med=np.median(pos_flow2[:,a])
-                flow3_min=flow3_lb[a]
-                flow3_max=flow3_ub[a]
-                flow3_med=np.median(pos_flow3[:,a])
-                flow4_min=flow4_lb[a]
-                flow4_max=flow4_ub[a]
-                flow4_med=np.median(pos_flow4[:,a])
-                flow1_mode, count= stats.mode(pos_flow1[:,a])
-                flow2_mode, count= stats.mode(pos_flow2[:,a])
-                flow3_mode, count= stats.mode(pos_flow3[:,a])
-                flow4_mode, count= stats.mode(pos_flow4[:,a])
+                flow1_min = flow1_lb[a]
+                flow1_max = flow1_ub[a]
+                flow1_med = median[flow(0,a)]
+                flow2_min = flow2_lb[a]
+                flow2_max = flow2_ub[a]
+                flow2_med = median[flow(1,a)]
+                flow3_min = flow3_lb[a]
+                flow3_max = flow3_ub[a]
+                flow3_med = median[flow(2,a)]
+                flow4_min = flow4_lb[a]
+                flow4_max = flow4_ub[a]
+                flow4_med = median[flow(3,a)]
+                flow1_mode = mode[flow(0,a)]
+                flow2_mode = mode[flow(1,a)]
+                flow3_mode = mode[flow(2,a)]
+                flow4_mode = mode[flow(3,a)]
 
                 with file(('%s/summ_stats.txt' % (self.filename)),'a') as outfile:
                     #outfile.write('\n# Water flow threshold: {0}\n'.format(a_labels[a]))
@@ -315,11 +398,10 @@ class MCMC():
         
 
     def convert_core_format(self, core, communities):
-        vec = np.zeros(core.shape[0])
-        for n in range(len(vec)):
-            idx = np.argmax(core[n,:])# get index,
-            vec[n] = idx+1 # +1 so that zero is preserved as 'none'
-        return vec
+        # uint8 dominant codes, +1 so that zero is preserved as 'none'
+        if isinstance(core, compactCore):
+            return core.codes
+        return compactCore.from_onehot(core).codes
 
 
     def diffScore(self, sim_data,synth_data,intervals):
@@ -336,7 +418,6 @@ class MCMC():
         same= np.count_nonzero(z)
         same = float(same)/intervals
         diff = 1-same
-        print 'diff:', diff
         return diff*100
 
     '''def diff_score_new(self, sim_data,synth_data,intervals):
@@ -382,7 +463,6 @@ class MCMC():
         sedprop = np.absolute((self.d_sedprop - p_sedprop)*0.5)'''
 
         diff = np.absolute( p-a)
-        print diff, ' diff abs'
 
         weight_array = self.give_weight(diff)
 
@@ -396,45 +476,76 @@ class MCMC():
 
 
     def likelihood_func(self, reef, core_data, input_v):
-        pred_core = self.run_Model(reef, input_v)
+        try:
+            if self.evaluator is not None:
+                loglik, diff_, codes = self.evaluator.evaluate([input_v])[0]
+            else:
+                pred_core = self.run_Model(reef, input_v)
+        except (budgetExceeded, RemoteTimeout), e:
+            return self.penalize(input_v, e)
+        if self.evaluator is not None:
+            self.telemetry.evaluation(loglik)
+            pred_core = compactCore(codes, self.core_depths, ncols=self.communities+1)
+            return [loglik *(1.0/self.adapttemp), pred_core, diff_]
+        return self.score_core(pred_core, core_data)
+
+    def score_core(self, pred_core, core_data):
+        # scored on the dominant codes of the data and of the prediction; the proportions
+        # are only kept for the posterior predictive summaries (self.predictive)
         pred_core = pred_core.T
         intervals = pred_core.shape[0]
-        z = np.zeros((intervals,self.communities+1))   
-
-        #print(z, intervals, ' is z int') 
-        for n in range(intervals):
-            idx_data = np.argmax(core_data[n,:])
-            idx_model = np.argmax(pred_core[n,:])
-            if ((pred_core[n,self.communities] != 1.) and (idx_data == idx_model)): #where sediment !=1 and max proportions are equal:
-                z[n,idx_data] = 1
+        z = np.zeros((intervals,self.communities+1))
+
+        pred = compactCore.from_proportions(pred_core, self.core_depths)
+        data_codes = self.data_core.codes[:intervals]
+        same = pred.matches(data_codes)
+        #where sediment !=1 and dominant codes are equal:
+        n = np.where((pred_core[:,self.communities] != 1.) & same)[0]
+        z[n,data_codes[n]-1] = 1
         diff = self.diff_score(z,intervals)
 
         #diff = self.diffScore(sim_prop_d,gt_prop_d, intervals)
-        diff_ = self.score_updated(pred_core, core_data)
+        diff_ = self.diff_score(same,intervals)
 
-        print(diff, diff_, ' diff and new diff....')
-        
         z = z + 0.1
         z = z/(1+(1+self.communities)*0.1)
         loss = np.log(z)
         # print 'sum of loss:', np.sum(loss)        
-        return [np.sum(loss) *(1.0/self.adapttemp), pred_core, diff_]
+        self.telemetry.evaluation(np.sum(loss))
+        self.telemetry.debug('likelihood', loglik=np.sum(loss), diff=diff, diff_updated=diff_)
+        return [np.sum(loss) *(1.0/self.adapttemp), pred, diff_]
+
+    def start_snapshots(self, maxsize=4, overflow='coalesce'):
+        # queue the save_core snapshots of the accepted samples to a background writer
+        # process instead of drawing the vis figures in run_Model; when the queue is full
+        # the latest snapshot is kept for later ('coalesce') or discarded ('drop')
+
+        self.snapshots = snapshotWriter.snapshotWriter(self.filename, maxsize, overflow,
+                                                       telemetry=self.telemetry)
+
+        return
+
+    def stop_snapshots(self):
+        # wait for the queued snapshots and record the writer counters
+
+        if self.snapshots is None:
+            return
+        summary = self.snapshots.close()
+        self.snapshots = None
+
+        with file(('%s/description.txt' % (self.filename)),'a') as outfile:
+            outfile.write('\n\tCore snapshots: {0}'.format(summary))
+
+        return summary
 
     def save_core(self,reef,naccept):
-        path = '%s/%s' % (self.filename, naccept)
-        if not os.path.exists(path):
-            os.makedirs(path)
-        
-        #     Initial settings     #
-        reef.core.initialSetting(size=(8,2.5), size2=(8,4.5), dpi=300, fname='%s/a_thres_%s_' % (path, naccept))        
-        #      Community population evolution    #
-        reef.plot.speciesDepth(colors=self.colors, size=(8,4), font=8, dpi=300, fname =('%s/b_popd_%s.png' % (path,naccept)))
-        reef.plot.speciesTime(colors=self.colors, size=(8,4), font=8, dpi=300,fname=('%s/c_popt_%s.png' % (path,naccept)))
-        reef.plot.accomodationTime(size=(8,4), font=8, dpi=300, fname =('%s/d_acct_%s.pdf' % (path,naccept)))
-        
-        #      Draw core      #
-        reef.plot.drawCore(lwidth = 3, colsed=self.colors, coltime = self.colors2, size=(9,8), font=8, dpi=300, 
-                           figname=('%s/e_core_%s' % (path, naccept)), filename=('%s/core_%s.csv' % (path, naccept)), sep='\t')
+        # without a background writer the snapshot is written before sampling resumes
+
+        if self.snapshots is not None:
+            self.snapshots.submit(reef, naccept)
+        else:
+            snapshotWriter.render(reef.core, reef.plot, '%s/%s' % (self.filename, naccept), naccept)
+
         return
         
     
@@ -691,11 +802,11 @@ class MCMC():
         nreplicas = self.num_chains
         samples = total_samples/nreplicas
 
-        data_vec = self.convert_core_format(self.core_data, self.communities)
+        data_vec = self.data_core.codes
 
         temp_ladder = self.assign_temperature()
 
-        print temp_ladder, ' is temp ladder ------------------------------------'
+        self.telemetry.info('temperature_ladder', ladder=temp_ladder)
 
 
 
@@ -725,14 +836,22 @@ class MCMC():
 
 
 
-        # Create space to store fx of all samples
-        list_predcore = np.zeros((nreplicas, samples, self.core_data.shape[0]))
-
         num_param = 3 + (self.communities * 8 )  # 3  for the mal, cim_ax, cim_ay 
 
         replica_pro = np.zeros((nreplicas, num_param)) # proposal for each replica 
-        replicapos_v = np.zeros((nreplicas, samples , num_param)) # pos for each replica 
-        pos_v = np.zeros((total_samples, num_param)) # pos for all replicas 
+        # pos and core codes of each replica, stored as (state, multiplicity) pairs
+        chains = [chainStore.chainStore(num_param, self.core_data.shape[0]) for r in range(nreplicas)]
+        # posterior predictive summaries accumulated after burn-in, from the codes and
+        # proportions of the current core of each replica (penalized cores are sediment
+        # only); the evaluation server only returns the codes, so then the proportions
+        # are not summarized at all
+        ndepths = self.core_data.shape[0]
+        shape = (ndepths, self.communities+1)
+        if self.evaluator is not None:
+            shape = None
+        self.predictive = predictiveSummary.predictiveSummary(ndepths, self.communities+1,
+                                                              shape=shape)
+        current_core = [None] * nreplicas
          
 
         reef = Model() # initiate the pyReef-Core module 
@@ -750,18 +869,19 @@ class MCMC():
 
         for r in range(nreplicas):
             replica_pro[r,:] = self.initial_replicaproposal() 
-            print(replica_pro[r,:], replica_pro[r,:].shape,  ' proposal INIT ')
+            self.telemetry.debug('initial_proposal', replica=r, proposal=replica_pro[r,:])
   
             likelihood, rep_predcore_, rep_diffscore[r,0] = self.likelihood_func(reef, self.core_data, replica_pro[r,:]) 
 
             rep_likelihood[r] = likelihood *(1.0/temp_ladder[r])
 
 
-            replicapos_v[r,0,:] = replica_pro[r,:]
-       
-            list_predcore[r,0,:] = self.convert_core_format(rep_predcore_, self.communities)
+            chains[r].append(replica_pro[r,:], self.convert_core_format(rep_predcore_, self.communities))
+            current_core[r] = rep_predcore_
+            if burnin == 0:
+                self.predictive.add(rep_predcore_.codes, rep_predcore_.proportions)
        
-            print (r,'\tinitial likelihood:', rep_likelihood[r], 'and difference score:', rep_diffscore[r,0])
+            self.telemetry.info('initial_likelihood', replica=r, likelihood=rep_likelihood[r], diff_score=rep_diffscore[r,0])
 
 
 
@@ -770,7 +890,7 @@ class MCMC():
             #count_list.append(0)
  
 
-        print(' begin sampling ....')
+        self.telemetry.info('sampling_start', samples=samples, replicas=nreplicas, pt_stage=pt_stage)
 
         total_accept = 0
         #naccept = 0
@@ -786,7 +906,6 @@ class MCMC():
             for r in range(nreplicas):  
                 #for s in range(swap_interval):  
                 
-                print '\nSample - Replica  ', i, r
 
                 v_proposal = self.proposal_vec(v_current) 
 
@@ -803,7 +922,7 @@ class MCMC():
  
                 #print(v_proposal, ' proposal ')
                 if i == pt_stage and init_count ==0: 
-                    print ' moving to mcmc sampling ------------------  **** ------'
+                    self.telemetry.info('pt_stage_end', sample=i)
                     likelihood, rep_predcore_, diffscore  = self.likelihood_func(reef, self.core_data, v_proposal)
                     rep_likelihood[r] = likelihood
                     init_count = 1
@@ -814,12 +933,13 @@ class MCMC():
 
  
                 diff_likelihood = rep_likelihood_pro[r] - rep_likelihood[r] # to divide probability, must subtract
-                print 'likelihood_proposal:',  rep_likelihood_pro[r] , 'diff_likelihood',diff_likelihood, ' diff_score', diffscore
 
 
                 mh_prob = min(1, math.exp(diff_likelihood))
                 u = random.uniform(0, 1)
-                print 'u', u, 'and mh_probability', mh_prob
+                self.telemetry.debug('proposal', sample=i, replica=r, likelihood=rep_likelihood_pro[r],
+                                     diff_likelihood=diff_likelihood, diff_score=diffscore, u=u, mh_prob=mh_prob)
+                self.telemetry.step(u < mh_prob)
 
                 rep_diffscore[r,i +1] = diffscore
  
@@ -839,11 +959,12 @@ class MCMC():
                     rep_likelihood[r] = likelihood_proposal.copy()
                     replica_pro[r,:]  = v_proposal 
 
-                    replicapos_v[r,i+1,:] = v_proposal
-
-                    list_predcore[r,i+1,:] = self.convert_core_format(rep_predcore_, self.communities)
+                    chains[r].append(v_proposal, self.convert_core_format(rep_predcore_, self.communities))
+                    current_core[r] = rep_predcore_
+                    if self.snapshots is not None and self.remote is None and self.evaluator is None:
+                        self.save_core(reef, '%s_%s' % (r, int(naccept[r])))
                     
-                    print  i, 'likelihood:', likelihood_proposal, ' and difference score:',  diffscore,   naccept[r] , 'accepted'
+                    self.telemetry.debug('accept', sample=i, replica=r, naccept=naccept[r])
 
                     #print v_proposal, ' accepted proposal *** '
 
@@ -851,14 +972,14 @@ class MCMC():
                
                 else: #reject
  
-                    replicapos_v[r,i+1,:] = replicapos_v[r,i,:] 
-
-                    list_predcore[r,i+1,:] = list_predcore[r,i,:]
+                    chains[r].repeat()
                     #rep_diffscore[r,i +1] = rep_diffscore[r,i]
  
-                    print i,  naccept[r] , 'rejected and retained'
+                    self.telemetry.debug('reject', sample=i, replica=r, naccept=naccept[r])
+
+                if i+1 >= burnin:
+                    self.predictive.add(current_core[r].codes, current_core[r].proportions)
 
-            print ' time to check swap --------------------------------------- *'
 
             for s in range(1, nreplicas): 
 
@@ -873,158 +994,183 @@ class MCMC():
 
                 u = np.random.uniform(0,1) 
 
-                print s, lhood1, lhood2, swap_proposal, u , lhood2 - lhood1, '   s, lhood1, lhood2, swap_proposal, u, lhood2 - lhood1 '
+                self.telemetry.debug('swap', replica=s, lhood1=lhood1, lhood2=lhood2, swap_proposal=swap_proposal,
+                                     u=u, swapped=(u < swap_proposal))
+                self.telemetry.swap(u < swap_proposal)
                 if u < swap_proposal:  
                     temp =  replica_pro[s-1,:]   
                     replica_pro[s-1,:] = replica_pro[s,:].copy()
                     replica_pro[s,:] = temp.copy()
 
-                    print s, ' swapped * ++ '
-                else:
-                    print s, ' no swap * ' 
-
   
              
         end = time.time()
 
         total_time = end-start
-        print 'Time elapsed:', total_time
+        accept_ratio = np.sum(naccept)/ (self.samples * 1.0) * 100
 
-        print naccept, ' list accepted '
+        self.telemetry.report()
+        self.telemetry.info('sampling_end', time=total_time, accepted=naccept, accept_ratio=accept_ratio)
 
- 
-        accept_ratio = np.sum(naccept)/ (self.samples * 1.0) * 100
+        self.phase_report(reef)
+
+        # posterior of all replicas after burn-in
+        chain = chainStore.chainStore.merge([c.burn(burnin) for c in chains])
 
-        print  accept_ratio, '% was accepted'
+        #print(rep_diffscore, ' rep_diffscore  ...')  
+
+        #print self.true_values
+
+        diffscore = rep_diffscore[:,burnin:]
+
+
+        self.pos_sedflow(chain)
 
-        burn_pos = replicapos_v[:,burnin:,:] 
-        burn_listpred = list_predcore[:,burnin:,:]
  
 
+        return (rep_diffscore, accept_ratio, chain,  x_data, y_data, data_vec, rep_acceptlist, rep_likelihoodlist, diffscore, total_time/3600)
 
-        posterior = burn_pos.transpose(2,0,1).reshape(num_param,-1) 
+    def phase_report(self, reef, label='pyReef-Core'):
+        # per-run averages of the model phase counters (ODE intervals, RHS calls, time per phase)
 
-        predcore_list = burn_listpred.transpose(2,0,1).reshape(self.core_data.shape[0],-1) 
+        summary = reef.counters.summary()
+        self.telemetry.info('phase_counters', model=label, **summary)
 
-        #print(posterior, ' posterior after burn')  
-        #print(predcore_list, ' predcore_list')  
-        #print(rep_diffscore, ' rep_diffscore  ...')  
+        with file(('%s/description.txt' % (self.filename)),'a') as outfile:
+            outfile.write('\n\t{0} phase counters per run: {1}'.format(label, summary))
 
-        #print self.true_values
+        return summary
 
-        diffscore = rep_diffscore[:,burnin:]
+    def single_chain(self, kernel):
+        # run a single chain kernel (speculativeMH, delayedAcceptance, surrogateMH) at temperature 1
 
+        start = time.time()
 
-        for s in range( 0, num_param):  
-            print self.true_values[s]  
-            
-            self.plot_figure(posterior[s,:], 'pos_distri_'+str(s),  self.true_values[s] , nreplicas ) 
+        list_predcore = np.zeros((self.samples, self.core_data.shape[0]), dtype=np.uint8)
+        rep_diffscore = np.zeros(self.samples)
 
-        self.pos_sedflow(posterior) 
+        def store(i, v, result, accepted):
+            list_predcore[i,:] = self.convert_core_format(result[1], self.communities)
+            rep_diffscore[i] = result[2]
 
- 
+        pos_v, likelihoodlist, accepted = kernel.run(self.initial_replicaproposal(), self.samples, callback=store)
 
-        return (rep_diffscore, accept_ratio, posterior, predcore_list,  x_data, y_data, data_vec, rep_acceptlist, rep_likelihoodlist, diffscore, total_time/3600)
+        total_time = time.time() - start
+        accept_ratio = np.count_nonzero(accepted)/ (self.samples * 1.0) * 100
+        self.telemetry.report()
+        self.telemetry.info('sampling_end', kernel=kernel.__class__.__name__, time=total_time,
+                            accept_ratio=accept_ratio, **kernel.summary())
 
+        with file(('%s/description.txt' % (self.filename)),'a') as outfile:
+            outfile.write('\n\t{0}: {1}'.format(kernel.__class__.__name__, kernel.summary()))
 
-    def plot_figure(self, list, title, real_value, nreplicas  ): 
+        burnin = int(self.burn_in * self.samples)
 
-        list_points =  list
-        fname = self.filename
-         
+        return (pos_v[burnin:,:].T, list_predcore[burnin:,:].T, likelihoodlist, rep_diffscore, accept_ratio, total_time/3600)
 
+    def speculative_sampler(self, depth=3, nworkers=None):
+        # single chain MCMC where the next proposals are pre-fetched on 2^depth-1 workers
 
-        size = 14
+        self.adapttemp = 1
+        reef = Model() # each worker process inherits its own copy
 
-        #fig, ax = plt.subplots()
+        def likelihood(v):
+            return self.likelihood_func(reef, self.core_data, v)
 
+        executor = speculativeMH.speculativeMH(likelihood, self.proposal_vec, depth=depth, nworkers=nworkers)
+        try:
+            return self.single_chain(executor)
+        finally:
+            executor.close()
 
-        '''plt.tick_params(labelsize=size)
-        params = {'legend.fontsize': size, 'legend.handlelength': 2}
-        plt.rcParams.update(params)
-        plt.grid(alpha=0.75)
+    def delayed_acceptance_sampler(self, level='coarse'):
+        # single chain MCMC where proposals are first screened by a coarse pyReef-Core run
+        # level is a fidelityLevels.fidelityLevel or the name of a level of the default ladder
 
-        plt.hist(list_points,  bins = 20, color='#0504aa',
-                            alpha=0.7)   
+        self.adapttemp = 1
+        if not isinstance(level, fidelityLevels.fidelityLevel):
+            level = [l for l in fidelityLevels.ladder(self.input) if l.name == level][0]
+        reef = Model()
+        reef_coarse = Model()
+        level.apply(reef_coarse)
 
-        plt.title("Posterior distribution ", fontsize = size)
-        plt.xlabel(' Parameter value  ', fontsize = size)
-        plt.ylabel(' Frequency ', fontsize = size)
-        if self.problem == 1:
-            plt.axvline(x=real_value, linewidth=2, color='r')
-            print real_value, ' is real'
-        #plt.tight_layout()  
-        #ax.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
-        plt.autoscale()'''
+        def fine(v):
+            return self.likelihood_func(reef, self.core_data, v)
 
+        def coarse(v):
+            return self.likelihood_func(reef_coarse, self.core_data, v)
 
-        fig, ax = plt.subplots()
-   
+        kernel = delayedAcceptance.delayedAcceptance(coarse, fine, self.proposal_vec)
+        results = self.single_chain(kernel)
+        self.phase_report(reef, 'full')
+        self.phase_report(reef_coarse, 'coarse')
 
+        return results
 
-        ax.hist(list_points,    bins=20, rwidth=0.9,   color='#607c8e')
- 
-        ax.tick_params(axis="x", labelsize=14)
-        ax.tick_params(axis="y", labelsize=14)
-        #ax.yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:.3f}')) 
+    def surrogate_sampler(self, min_train=50, max_train=400, retrain=25, max_sd=1.):
+        # single chain MCMC where proposals are first screened by a Gaussian process emulator,
+        # trained during burn-in only and then frozen so that the retained samples are exact
 
+        self.adapttemp = 1
+        reef = Model()
 
-        fmtr = ticker.StrMethodFormatter(('{x:,g}'))
-        ax.yaxis.set_major_formatter(fmtr)
- 
-        ax.yaxis.set_minor_formatter(ticker.StrMethodFormatter('{x:.3f}'))
+        def likelihood(v):
+            return self.likelihood_func(reef, self.core_data, v)
 
-        ax.set_xlabel("Parameter", fontsize=15)
-        ax.set_ylabel("Frequency", fontsize=15) 
+        kernel = surrogateGP.surrogateMH(likelihood, self.proposal_vec, min_train=min_train,
+                                         max_train=max_train, retrain=retrain, max_sd=max_sd,
+                                         freeze=int(self.burn_in * self.samples))
+        results = self.single_chain(kernel)
+        self.phase_report(reef)
 
-        if self.problem == 1:
-            plt.axvline(x=real_value, linewidth=2, color='b')
- 
-        
-        ax.grid(linestyle='-', linewidth='0.2', color='grey')
-        plt.tight_layout()  
-        plt.savefig(fname   +'/posterior/'+ title  + '_posterior.pdf')
-        plt.clf()
+        return results
 
+    def _validation_study(self, levels, csvname, keys=None, nvalidation=20,
+                          study=fidelityLevels.validate):
+        # run each level on the same prior draws with its own Model, compare the levels with
+        # study (fidelityLevels.evaluate or validate) and write the report to csvname
 
-        '''plt.tick_params(labelsize=size)
-        params = {'legend.fontsize': size, 'legend.handlelength': 2}
-        plt.rcParams.update(params)
-        plt.grid(alpha=0.75)
+        self.adapttemp = 1
+        reefs = {}
+        for level in levels:
+            reefs[level.name] = Model()
+            level.apply(reefs[level.name])
 
-        listx = np.asarray(np.split(list_points,  nreplicas ))
-        plt.plot(listx.T)   
+        def likelihood(level, v):
+            return self.likelihood_func(reefs[level.name], self.core_data, v)
 
-        plt.title("Parameter trace plot", fontsize = size)
-        plt.xlabel(' Number of Samples  ', fontsize = size)
-        plt.ylabel(' Parameter value ', fontsize = size)
-        #plt.tight_layout()  
-        plt.autoscale()'''
+        validation = [self.initial_replicaproposal() for k in range(nvalidation)]
+        report, loglik = study(levels, likelihood, validation)
+        fidelityLevels.write_report(report, '%s/%s' % (self.filename, csvname), keys=keys)
 
+        return report
 
-        #p = np.linspace(1000, 500, 100)
-        #T = np.linspace(300, 200, p.size)
+    def fidelity_study(self, nvalidation=20, levels=None):
+        # cost and likelihood discrepancy of lower-fidelity models on prior draws
 
+        if levels is None:
+            levels = fidelityLevels.ladder(self.input)
+        report = self._validation_study(levels, 'fidelity.csv', nvalidation=nvalidation,
+                                        study=fidelityLevels.evaluate)
+        for row in report:
+            self.telemetry.info('fidelity_level', **row)
 
-        fig, ax = plt.subplots()
+        return report
 
-        listx = np.asarray(np.split(list_points,  nreplicas ))
-        ax.plot(listx.T)    
+    def profile_study(self, nvalidation=20, names=['strict', 'default', 'fast']):
+        # how often each solver accuracy profile changes the core codes and likelihood
+        # relative to the strict profile, on prior draws
 
-        ax.tick_params(axis="x", labelsize=14)
-        ax.tick_params(axis="y", labelsize=14)
-        ax.yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:.3f}')) 
- 
-        ax.yaxis.set_minor_formatter( ticker.StrMethodFormatter(('{x:,g}')) )
-  
-        ax.set_xlabel("Iterations", fontsize=15)
-        ax.set_ylabel("Parameter", fontsize=15) 
-        
-        ax.grid(linestyle='-', linewidth='0.2', color='grey')
-        plt.tight_layout()  
+        return self._validation_study(fidelityLevels.profiles(names), 'profiles.csv',
+                                      fidelityLevels.validate_keys, nvalidation)
+
+    def backend_study(self, nvalidation=20, names=['odespy', 'kernel'], profile=None):
+        # cost of the forward kernel and how often it changes the core codes and likelihood
+        # relative to the odespy backend, on prior draws
+
+        return self._validation_study(fidelityLevels.backends(names, profile), 'backends.csv',
+                                      fidelityLevels.validate_keys, nvalidation)
 
-        plt.savefig(fname  +'/posterior/'+ title  + '_trace.pdf')
-        plt.clf()
 
 def make_directory (directory):
     if not os.path.exists(directory):
@@ -1078,8 +1224,8 @@ def main():
     	timestep = np.arange(0,simtime+1,50)
     	xmlinput = 'input_synth_.xml'
     	datafile = 'data/synth_core.txt'
-    	core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-    	core_data = np.loadtxt('data/synth_core_bi.txt')
+    	core_depths = datasetCache.loadtable(datafile, usecols=0) 
+    	core_data = datasetCache.loadtable('data/synth_core_bi.txt')
 
         true_vec_parameters = np.loadtxt('data/true_values.txt')
 
@@ -1094,8 +1240,8 @@ def main():
     	timestep = np.arange(0,simtime+1,50)
     	xmlinput = 'input_hi3_threeasembleges.xml'
     	datafile = 'data/hi3.txt'
-    	core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-    	core_data = np.loadtxt('data/hi3_binary.txt') 
+    	core_depths = datasetCache.loadtable(datafile, usecols=0) 
+    	core_data = datasetCache.loadtable('data/hi3_binary.txt') 
     	nCommunities = 3
 
 
@@ -1104,8 +1250,8 @@ def main():
     	timestep = np.arange(0,simtime+1,50)
     	xmlinput = 'input_synth_sixassem.xml'
     	datafile = 'data/synth_core.txt'
-    	core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-    	core_data =   core_convertbinary(np.genfromtxt(datafile, usecols=(1), unpack = True) )  
+    	core_depths = datasetCache.loadtable(datafile, usecols=0) 
+    	core_data =   core_convertbinary(datasetCache.loadtable(datafile, usecols=1) )  
         true_vec_parameters = np.zeros(51)#np.loadtxt('data/true_values_six.txt')
 
         print true_vec_parameters, ' true values' 
@@ -1120,8 +1266,8 @@ def main():
     	timestep = np.arange(0,simtime+1,50)
     	xmlinput = 'input_hi3.xml'
     	datafile = 'data/hi3.txt'
-    	core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-    	core_data =   core_convertbinary(np.genfromtxt(datafile, usecols=(1), unpack = True) )  
+    	core_depths = datasetCache.loadtable(datafile, usecols=0) 
+    	core_data =   core_convertbinary(datasetCache.loadtable(datafile, usecols=1) )  
         true_vec_parameters = np.zeros(51)#np.loadtxt('data/true_values_six.txt') 
  
     	nCommunities = 6
@@ -1131,8 +1277,8 @@ def main():
     	timestep = np.arange(0,simtime+1,50)
     	xmlinput = 'input_oti5.xml'
     	datafile = 'data/oti5.txt'
-    	core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-    	core_data =   core_convertbinary(np.genfromtxt(datafile, usecols=(1), unpack = True) )  
+    	core_depths = datasetCache.loadtable(datafile, usecols=0) 
+    	core_data =   core_convertbinary(datasetCache.loadtable(datafile, usecols=1) )  
         true_vec_parameters = np.zeros(51)#np.loadtxt('data/true_values_six.txt') 
 
     	nCommunities = 6
@@ -1141,8 +1287,8 @@ def main():
         timestep = np.arange(0,simtime+1,50)
         xmlinput = 'input_oti2.xml'
         datafile = 'data/oti2.txt'
-        core_depths = np.genfromtxt(datafile, usecols=(0), unpack = True) 
-        core_data =   core_convertbinary(np.genfromtxt(datafile, usecols=(1), unpack = True) )  
+        core_depths = datasetCache.loadtable(datafile, usecols=0) 
+        core_data =   core_convertbinary(datasetCache.loadtable(datafile, usecols=1) )  
         true_vec_parameters = np.zeros(51)#np.loadtxt('data/true_values_six.txt') 
 
         nCommunities = 6
@@ -1183,10 +1329,16 @@ def main():
 
     mcmc = MCMC(simtime, samples, nCommunities, core_data, core_depths, timestep,  filename, xmlinput, 
                 vis, true_vec_parameters, problem, num_replica, max_temp, burn_in, pt_stage)
+    mcmc.telemetry = telemetry.telemetry('%s/telemetry.jsonl' % (filename), level='info', console='info')
+    mcmc.set_watchdog(max_evaltime=None, max_rhs=None) # e.g. 120 s, 5e6 evaluations; aborted runs go to watchdog.txt
+    if True in vis:
+        mcmc.start_snapshots(maxsize=4) # figures of the accepted samples written by a background process
 
 
-    rep_diffscore, accept_ratio, pos_v, predcore_list, x_data, y_data, data_vec, rep_acceptlist, rep_likelihoodlist, diffscore, time_taken  = mcmc.sampler()
+    rep_diffscore, accept_ratio, chain, x_data, y_data, data_vec, rep_acceptlist, rep_likelihoodlist, diffscore, time_taken  = mcmc.sampler()
 
+    mcmc.stop_snapshots()
+    mcmc.telemetry.close()
     print 'successfully sampled'
 
     score = diffscore.flatten()
@@ -1220,51 +1372,16 @@ def main():
 
 
     np.savetxt(filename+'/rep_diffscore.txt', diffscore, fmt='%1.2f')  
-    np.savetxt(filename+'/predcore_list.txt', predcore_list, fmt='%1.2f')  
-    np.savetxt(filename+'/posterior.txt', pos_v, fmt='%1.4e')
+    # unique posterior states and core codes, each repeated posterior_counts times in the chain
+    chain.save(filename+'/chain.npz')
+    np.savetxt(filename+'/predcore_list.txt', chain.codes.T, fmt='%d')  
+    np.savetxt(filename+'/posterior.txt', chain.states.T, fmt='%1.4e')
+    np.savetxt(filename+'/posterior_counts.txt', chain.counts, fmt='%d')
 
-    sed_pos = pos_v[0:12,:]
-    #print sed_pos, sed_pos.shape
-    flow_pos = pos_v[12:24,:]
-    glv_pos =   pos_v[24:,]
- 
-
-
-    mpl_fig = plt.figure()
-    ax = mpl_fig.add_subplot(111) 
-    size = 12 
-    ax.tick_params(labelsize=size) 
-    plt.legend(loc='upper right')  
-    ax.boxplot(sed_pos.T) 
-    ax.set_xlabel('Parameter ID', fontsize=size)
-    ax.set_ylabel('Sediment Posterior', fontsize=size) 
-    plt.title("Boxplot of Sediment Posterior", fontsize=size) 
-    plt.savefig(filename+'/sed_pos.pdf')
-    plt.clf()
-
-
-    mpl_fig = plt.figure()
-    ax = mpl_fig.add_subplot(111) 
-    size = 12
-    ax.tick_params(labelsize=size)
-    ax.boxplot(flow_pos.T) 
-    ax.set_xlabel('Parameter ID', fontsize=size)
-    ax.set_ylabel('Flow Posterior', fontsize=size) 
-    plt.title("Boxplot of Flow Posterior", fontsize=size) 
-    plt.savefig(filename+'/flow_pos.pdf')
-    plt.clf()
-
-
-    mpl_fig = plt.figure()
-    ax = mpl_fig.add_subplot(111) 
-    size = 12 
-    ax.tick_params(labelsize=size)
-    ax.boxplot(glv_pos.T) 
-    ax.set_xlabel('Parameter ID', fontsize=size)
-    ax.set_ylabel('GLV Posterior', fontsize=size) 
-    plt.title("Boxplot of GLV Posterior", fontsize=size) 
-    plt.savefig(filename+'/glv_pos.pdf')
-    plt.clf()
+    # histograms, traces and boxplots rendered on a process pool (rerun with plot_report.py)
+    report = figureReport.figureReport(filename, chain, true_vec_parameters if problem == 1 else None)
+    report.all([('sed', range(0,12), 'Sediment'), ('flow', range(12,24), 'Flow'),
+                ('glv', range(24,chain.nparams), 'GLV')])
 
 
 
@@ -1284,9 +1401,9 @@ def main():
 
      
 
-    fx_mu = predcore_list.mean(axis=1)
-    fx_high = np.percentile(predcore_list, 95, axis=1)
-    fx_low = np.percentile(predcore_list, 5, axis=1)
+    # predictive bands accumulated during sampling
+    fx_mu, fx_low, fx_high = mcmc.predictive.bands(5, 95)
+    mcmc.predictive.save(filename)
 
     print data_vec.shape, '   data_vec'
     print x_data.shape, '   x_data'
@@ -1323,7 +1440,7 @@ def main():
 
     fig = plt.figure(figsize=(4,4))
     suptitle = fig.suptitle('')
-    params = {'legend.fontsize': size, 'legend.handlelength': 2}
+    params = {'legend.fontsize': 12, 'legend.handlelength': 2}
     plt.rcParams.update(params)
     ax1 = fig.add_subplot(121)
     ax1.set_facecolor('#f2f2f3')
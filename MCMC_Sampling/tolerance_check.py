@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#Title           :tolerance_check.py
+#Description     :Validation of the pyReef-Core solver accuracy profiles (strict, default, fast).
+#Usage           :python tolerance_check.py [--config synth_] [--runs 20] [--seed 1]
+#Notes           :Each profile is run on parameter vectors drawn from the prior and compared with the
+#                 strict profile. The report gives the cost, the fraction of vectors whose predicted
+#                 core codes (dominant assemblage of each depth interval) change, the fraction of
+#                 changed intervals, the fraction of vectors whose log-likelihood changes and the
+#                 largest log-likelihood difference. A profile is safe when nothing changes; the
+#                 fastest safe profile can then be set in the XmL input (<solver><profile>).
+#                 The profiles only differ by their tolerances, the default profile holds the
+#                 tolerances pyReef-Core has always used. The check needs the odespy library.
+
+import sys
+import argparse
+import numpy as np
+
+from benchmark import configurations, load_configuration
+
+def main():
+
+    parser = argparse.ArgumentParser(description='pyReef-Core solver profile validation.')
+    parser.add_argument('--config', default='synth_', choices=[c[0] for c in configurations],
+                        help='configuration checked')
+    parser.add_argument('--runs', type=int, default=20, help='parameter vectors drawn from the prior')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the prior draws')
+    args = parser.parse_args()
+
+    try:
+        import odespy
+        odespy.RKF45
+    except (ImportError, AttributeError):
+        print 'Tolerance check needs the odespy library with its RKF45 solver.'
+        sys.exit(1)
+
+    np.random.seed(args.seed)
+    mcmc = load_configuration(args.config)
+    report = mcmc.profile_study(nvalidation=args.runs)
+
+    print '\n%-8s %9s %8s %8s %10s %8s %10s  %s' %('profile', 'cost (s)', 'speedup', 'cores',
+                                                   'intervals', 'likl', 'max err', 'safe')
+    for row in report:
+        print '%-8s %9.3f %8.2f %7.1f%% %9.2f%% %7.1f%% %10.3e  %s' %(row['name'], row['cost'],
+            row['speedup'], 100.*row['code_changes'], 100.*row['interval_changes'],
+            100.*row['likelihood_changes'], row['maxerr'], row['safe'])
+
+    safe = [row for row in report if row['safe']]
+    if len(safe) > 0:
+        best = max(safe, key=lambda row: row['speedup'])
+        print '\nFastest safe profile: %s' %best['name']
+    print 'Report written to profiles.csv'
+
+if __name__ == "__main__": main()
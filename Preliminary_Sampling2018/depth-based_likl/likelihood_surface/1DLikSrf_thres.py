@@ -12,6 +12,7 @@ import csv
 import numpy as np
 from numpy import inf
 from pyReefCore.model import Model
+from pyReefCore.sampling import likelihoodGrid
 from cycler import cycler
 
 import matplotlib.pyplot as plt
@@ -273,37 +274,31 @@ class MCMC():
         # Set number and value of iterates
         s_v1 = np.linspace(p1_v1, p2_v1, num=samples, endpoint=False)
         
-        # Create storage for data
-        dimx = s_v1.shape[0]
-        pos_likl = np.zeros(dimx)
-        pos_v1 = np.zeros(samples) 
-        pos_diff = np.zeros(samples)
-        pos_rmse = np.zeros(samples)
-
+        # Proposal to be passed to runModel
+        v_base = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
+        v_base = np.append(v_base,(ax,ay,m))
+        # USER DEFINED: position of the generated variable in the proposal vector (flow4 of the assemblage)
+        indices = [21 + assemblage-1]
+
+        def likelihood(v_proposal):
+            [likl, pred_data, diff, rmse] = self.deterministicLikelihood(reef, self.core_data, v_proposal)
+            return [likl, diff, rmse]
+
+        def progress(key, values, done, total):
+            print 'sample: ', done, '/', total
+            print '%s:' % self.var1, s_v1[key[0]]
+            print 'Likelihood:', values[0], 'and difference score:', values[1]
+            self.save_params(s_v1[key[0]], values[0], values[1], values[2])
+
+        # Grid points are run on a pool of processes, points already stored in grid.txt are skipped
         start = time.time()
-        i = 0
-        for a in range(len(s_v1)):
-            print 'sample: ', i
-            print '%s:' % self.var1, s_v1[a]
-            p_v1 = s_v1[a] # Update parameters
-
-
-            # USER DEFINED: Substitute generated variables into proposal vector 
-            flow4[assemblage-1] = p_v1
-            
-
-            # Proposal to be passed to runModel
-            v_proposal = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
-            v_proposal = np.append(v_proposal,(ax,ay,m))
-            [likelihood, pred_data, diff, rmse] = self.deterministicLikelihood(reef, self.core_data, v_proposal)
-            print 'Likelihood:', likelihood, 'and difference score:', diff
-
-            pos_v1[i] = p_v1
-            pos_likl[i] = likelihood
-            pos_diff[i] = diff
-            pos_rmse[i] = rmse
-            self.save_params(pos_v1[i], pos_likl[i], pos_diff[i], pos_rmse[i])
-            i += 1
+        grid = likelihoodGrid.likelihoodGrid(likelihood, v_base, indices, [s_v1],
+            '%s/grid.txt' % self.filename)
+        pos_likl = grid.run(callback=progress)
+        pos_diff = grid.surface(1)
+        pos_rmse = grid.surface(2)
+        pos_v1 = s_v1
+        i = len(grid.results)
 
         end = time.time()
         total_time = end - start
@@ -358,12 +353,18 @@ def main():
     vis = [False, False] # first for initialisation, second for cores
     sedsim, flowsim = True, True
     
-    run_nb = 0
-    while os.path.exists('1dsurf_thres_%s' % (run_nb)):
-        run_nb+=1
-    if not os.path.exists('1dsurf_thres_%s' % (run_nb)):
-        os.makedirs('1dsurf_thres_%s' % (run_nb))
-    filename = ('1dsurf_thres_%s' % (run_nb))
+    # USER DEFINED: results directory of an interrupted run to complete, None for a new run
+    resume = None
+
+    if resume is not None:
+        filename = resume
+    else:
+        run_nb = 0
+        while os.path.exists('1dsurf_thres_%s' % (run_nb)):
+            run_nb+=1
+        if not os.path.exists('1dsurf_thres_%s' % (run_nb)):
+            os.makedirs('1dsurf_thres_%s' % (run_nb))
+        filename = ('1dsurf_thres_%s' % (run_nb))
 
     #    Save File of Run Description   #
     if not os.path.isfile(('%s/description.txt' % (filename))):
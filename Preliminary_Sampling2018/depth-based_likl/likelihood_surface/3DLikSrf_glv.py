@@ -12,6 +12,7 @@ import csv
 import numpy as np
 from numpy import inf
 from pyReefCore.model import Model
+from pyReefCore.sampling import likelihoodGrid, adaptiveSurface
 from cycler import cycler
 
 import matplotlib.pyplot as plt
@@ -245,7 +246,7 @@ class MCMC():
                 data = [v1, v2, likl, diff, rmse]
                 writer.writerow(data)
                
-    def likelihood_surface(self):
+    def likelihood_surface(self, adaptive=False):
     	samples = self.samples
         assemblage = self.assemblage
         dimension=samples*samples
@@ -275,85 +276,44 @@ class MCMC():
         s_v2 = np.linspace(v2_p1, v2_p2, num=samples, endpoint=True)
         print 's_v1', s_v1
         print 's_v2', s_v2
-        dimx = s_v1.shape[0]
-        dimy = s_v2.shape[0]
-        # Create storage for data
-        pos_likl = np.zeros((dimx,dimy))
-        pos_v1 = np.zeros(dimension)
-        pos_v2 = np.zeros(dimension) 
-        pos_diff = np.zeros(dimension)
-        pos_rmse = np.zeros(dimension)
-        
+        # Proposal to be passed to runModel
+        v_base = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
+        v_base = np.append(v_base,(ax,ay,m))
+        # USER DEFINED: position of the generated variables in the proposal vector (m, ay)
+        indices = [26, 25]
+
+        def likelihood(v_proposal):
+            # [likelihood, diff, rmse, pred_data] = self.likelihoodWithDependence(reef, v_proposal, S_star, cpts_star, ca_props_star)
+            [likl, diff, rmse, pred_data] = self.likelihoodWithProps(reef, self.gt_prop_d, v_proposal)
+            return [likl, diff, rmse]
+
+        def progress(key, values, done, total):
+            print 'sample: ', done, '/', total
+            print 'Variable 1: ', s_v1[key[0]], 'Variable 2: ', s_v2[key[1]]
+            print 'Likelihood:', values[0], 'and difference score:', values[1]
+            self.save_params(s_v1[key[0]], s_v2[key[1]], values[0], values[1], values[2])
+
         # S_star, cpts_star, ca_props_star = self.modelOutputParameters(self.gt_prop_t,self.gt_vec_t,self.gt_timelay)
 
+        # Grid points are run on a pool of processes, points already stored in grid.txt are skipped
         start = time.time()
-        i = 0
-        for a in range(s_v1.shape[0]):
-            for b in range(s_v2.shape[0]):
-                print 'sample: ', i
-                print 'Variable 1: ', s_v1[a], 'Variable 2: ', s_v2[b]
-                # Update parameters
-                p_v1 = s_v1[a]
-                p_v2 = s_v2[b]
-
-                # USER DEFINED: Substitute generated variables into proposal vector 
-                m = p_v1
-                ay = p_v2
-                
-                # Proposal to be passed to runModel
-                v_proposal = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
-                v_proposal = np.append(v_proposal,(ax,ay,m))
-                
-                # [likelihood, diff, rmse, pred_data] = self.likelihoodWithDependence(reef, v_proposal, S_star, cpts_star, ca_props_star)
-                [likelihood, diff, rmse, pred_data] = self.likelihoodWithProps(reef, self.gt_prop_d, v_proposal)
-                print 'Likelihood:', likelihood, 'and difference score:', diff
-                
-
-                pos_v1[i] = p_v1
-                pos_v2[i] = p_v2
-                pos_likl[a,b] = likelihood
-                pos_diff[i] = diff
-                pos_rmse[i] = rmse
-                self.save_params(pos_v1[i], pos_v2[i], pos_likl[a,b], pos_diff[i], pos_rmse[i])
-                # self.saveCore(reef,i)
-                i += 1
-
-                # if b < a:
-                    #     print 'skip likelihood'
-                    #     #set pos_sed 2, pos_v2, pos_likl and pos_diff to -infinity because can't run.
-                    #     pos_diff[i] = np.nan
-                    #     pos_v1[i] = np.nan
-                    #     pos_v2[i] = np.nan
-                    #     pos_likl[a,b] = np.nan
-                    #     self.save_params(pos_v1[i], pos_v2[i], pos_likl[a,b], pos_diff[i])
-
-                    # else:
-                    #     print '\n Variable 1: ', s_v1[a], 'Variable 2: ', s_v2[b]
-
-                    #     # Update parameters
-                    #     p_v1 = s_v1[a]
-                    #     p_v2 = s_v2[b]
-
-
-                    #     # Substitute generated variables into proposal vector 
-                    #     flow1[assemblage-1] = p_v1
-                    #     flow2[assemblage-1] = p_v2
-                    #     # print 'sed2', sed2
-                    #     # print 'sed3', sed3
-                        
-                    #     # Proposal to be passed to runModel
-                    #     v_proposal = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
-                    #     v_proposal = np.append(v_proposal,(ax,ay,m))
-
-                    #     [likelihood, pred_data, diff] = self.likelihood_func(reef, self.core_data, v_proposal)
-                    #     print 'Likelihood:', likelihood, 'and difference score:', diff
-
-                    #     pos_diff[i] = diff
-                    #     pos_v1[i] = p_v1
-                    #     pos_v2[i] = p_v2
-                    #     pos_likl[a,b] = likelihood
-                    #     self.save_params(pos_v1[i], pos_v2[i], pos_likl[a,b], pos_diff[i])
-                    # i += 1
+        if adaptive:
+            # Quadtree refinement on a lattice with at least samples points along each axis
+            levels = int(np.ceil(np.log2(samples-1)))
+            grid = adaptiveSurface.adaptiveSurface(likelihood, v_base, indices,
+                [[v1_p1, v1_p2], [v2_p1, v2_p2]], '%s/grid.txt' % self.filename, level0=min(2, levels), levels=levels)
+            s_v1, s_v2 = grid.axes
+            pos_likl = grid.run(callback=progress)
+            print 'Adaptive evaluations:', grid.evaluations()
+            grid = grid.grid
+        else:
+            grid = likelihoodGrid.likelihoodGrid(likelihood, v_base, indices, [s_v1, s_v2],
+                '%s/grid.txt' % self.filename)
+            pos_likl = grid.run(callback=progress)
+        pos_v2, pos_v1 = np.meshgrid(s_v2, s_v1)
+        pos_v1 = pos_v1.flatten()
+        pos_v2 = pos_v2.flatten()
+        i = len(grid.results)
 
         end = time.time()
         total_time = end - start
@@ -396,13 +356,21 @@ def main():
     sedlim = [0., 0.005]
     flowlim = [0.,0.3]
 
-    run_nb = 0
-    path_name = 'results-3d-glv'
-    while os.path.exists('%s_%s' % (path_name, run_nb)):
-        run_nb+=1
-    if not os.path.exists('%s_%s' % (path_name, run_nb)):
-        os.makedirs('%s_%s' % (path_name, run_nb))
-    filename = ('%s_%s' % (path_name, run_nb))
+    # USER DEFINED: results directory of an interrupted run to complete, None for a new run
+    resume = None
+    # USER DEFINED: refine the surface where the likelihood is high or poorly resolved
+    adaptive = False
+
+    if resume is not None:
+        filename = resume
+    else:
+        run_nb = 0
+        path_name = 'results-3d-glv'
+        while os.path.exists('%s_%s' % (path_name, run_nb)):
+            run_nb+=1
+        if not os.path.exists('%s_%s' % (path_name, run_nb)):
+            os.makedirs('%s_%s' % (path_name, run_nb))
+        filename = ('%s_%s' % (path_name, run_nb))
 
     #    Save File of Run Description   #
     if not os.path.isfile(('%s/description.txt' % (filename))):
@@ -417,7 +385,7 @@ def main():
         gt_depths,gt_vec_d, gt_prop_d, v1_min, v1_max, v2_min, v2_max, assemblage, description,
         v1, v1_title, v2, v2_title)
 
-    [pos_v1, pos_v2, pos_likl] = mcmc.likelihood_surface()
+    [pos_v1, pos_v2, pos_likl] = mcmc.likelihood_surface(adaptive=adaptive)
 
     print 'Successfully sampled'
     
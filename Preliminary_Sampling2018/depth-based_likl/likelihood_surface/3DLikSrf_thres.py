@@ -12,6 +12,7 @@ import csv
 import numpy as np
 from numpy import inf
 from pyReefCore.model import Model
+from pyReefCore.sampling import likelihoodGrid
 from cycler import cycler
 
 import matplotlib.pyplot as plt
@@ -272,67 +273,34 @@ class MCMC():
         s_v2 = np.linspace(v2_p1, v2_p2, num=samples, endpoint=True)
         print 's_v1', s_v1
         print 's_v2', s_v2
-        # Create storage for data
-        pos_likl = np.full((s_v1.shape[0],s_v2.shape[0]), np.nan)
-        pos_v1 = np.full(dimension, np.nan)
-        pos_v2 = np.full(dimension, np.nan)
-        pos_diff = np.full(dimension, np.nan)
-        pos_rmse = np.full(dimension, np.nan)
-        
+        # Proposal to be passed to runModel
+        v_base = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
+        v_base = np.append(v_base,(ax,ay,m))
+        # USER DEFINED: position of the generated variables in the proposal vector (flow2 and flow3 thresholds)
+        indices = [15+assemblage-1, 18+assemblage-1]
+
+        def likelihood(v_proposal):
+            [likl, diff, rmse, pred_data] = self.likelihoodWithProps(reef, self.gt_prop_d, v_proposal)
+            return [likl, diff, rmse]
+
+        def progress(key, values, done, total):
+            print 'sample: ', done, '/', total
+            print '\n Variable 1: ', s_v1[key[0]], 'Variable 2: ', s_v2[key[1]]
+            print 'Likelihood:', values[0], 'and difference score:', values[1]
+            self.save_params(s_v1[key[0]], s_v2[key[1]], values[0], values[1])
+
         # S_star, cpts_star, ca_props_star = self.modelOutputParameters(self.gt_prop_t,self.gt_vec_t,self.gt_timelay)
 
+        # Only the upper triangle (flow3 threshold >= flow2 threshold) is run on a pool of
+        # processes, points already stored in grid.txt are skipped
         start = time.time()
-        i = 0
-        for a in range(s_v1.shape[0]):
-            for b in np.arange(a,s_v2.shape[0]):
-                print 'sample: ', i
-                # print 'Variable 1: ', s_v1[a], 'Variable 2: ', s_v2[b]
-                # # Update parameters
-                # p_v1 = s_v1[a]
-                # p_v2 = s_v2[b]
-
-                # # USER DEFINED: Substitute generated variables into proposal vector 
-                # m = p_v1
-                # ay = p_v2
-                
-                # # Proposal to be passed to runModel
-                # v_proposal = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
-                # v_proposal = np.append(v_proposal,(ax,ay,m))
-                # # [likelihood, diff, rmse, pred_data] = self.likelihoodWithDependence(reef, v_proposal, S_star, cpts_star, ca_props_star)
-                # [likelihood, diff, rmse, pred_data] = self.likelihoodWithProps(reef, self.gt_prop_d, v_proposal)
-                # print 'Likelihood:', likelihood, 'and difference score:', diff
-                
-                # pos_v1[i] = p_v1
-                # pos_v2[i] = p_v2
-                # pos_likl[a,b] = likelihood
-                # pos_diff[i] = diff
-                # pos_rmse[i] = rmse
-                # self.save_params(pos_v1[i], pos_v2[i], pos_likl[a,b], pos_diff[i], pos_rmse[i])
-                # # self.saveCore(reef,i)
-                # i += 1
-               
-                if b >= a:
-                    print '\n Variable 1: ', s_v1[a], 'Variable 2: ', s_v2[b]
-                    # Update parameters
-                    p_v1 = s_v1[a]
-                    p_v2 = s_v2[b]
-
-                    # Substitute generated variables into proposal vector 
-                    flow2[assemblage-1] = p_v1
-                    flow3[assemblage-1] = p_v2
-                    
-                    # Proposal to be passed to runModel
-                    v_proposal = np.concatenate((sed1,sed2,sed3,sed4,flow1,flow2,flow3,flow4))
-                    v_proposal = np.append(v_proposal,(ax,ay,m))
-                    [likelihood, diff, rmse, pred_data] = self.likelihoodWithProps(reef, self.gt_prop_d, v_proposal)
-                    print 'Likelihood:', likelihood, 'and difference score:', diff
-
-                    pos_diff[i] = diff
-                    pos_v1[i] = p_v1
-                    pos_v2[i] = p_v2
-                    pos_likl[a,b] = likelihood
-                    self.save_params(pos_v1[i], pos_v2[i], pos_likl[a,b], pos_diff[i])
-                i += 1
+        grid = likelihoodGrid.likelihoodGrid(likelihood, v_base, indices, [s_v1, s_v2],
+            '%s/grid.txt' % self.filename, select=lambda key: key[1] >= key[0])
+        pos_likl = grid.run(callback=progress)
+        pos_v2, pos_v1 = np.meshgrid(s_v2, s_v1)
+        pos_v1 = pos_v1.flatten()
+        pos_v2 = pos_v2.flatten()
+        i = len(grid.results)
         pos_likl[pos_likl == -inf] = -528.696341847866#-178.965042307943
         pos_likl[np.isnan(pos_likl)] = -528.696341847866#-178.965042307943
         end = time.time()
@@ -401,13 +369,19 @@ def main():
     sedlim = [0., 0.005]
     flowlim = [0.,0.3]
 
-    run_nb = 0
-    path_name = 'results-3d-thres'
-    while os.path.exists('%s_%s' % (path_name, run_nb)):
-        run_nb+=1
-    if not os.path.exists('%s_%s' % (path_name, run_nb)):
-        os.makedirs('%s_%s' % (path_name, run_nb))
-    filename = ('%s_%s' % (path_name, run_nb))
+    # USER DEFINED: results directory of an interrupted run to complete, None for a new run
+    resume = None
+
+    if resume is not None:
+        filename = resume
+    else:
+        run_nb = 0
+        path_name = 'results-3d-thres'
+        while os.path.exists('%s_%s' % (path_name, run_nb)):
+            run_nb+=1
+        if not os.path.exists('%s_%s' % (path_name, run_nb)):
+            os.makedirs('%s_%s' % (path_name, run_nb))
+        filename = ('%s_%s' % (path_name, run_nb))
 
     #    Save File of Run Description   #
     if not os.path.isfile(('%s/description.txt' % (filename))):
@@ -8,12 +8,34 @@
 ##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
 """
    Top-level pyReefCore Model implementation.
+
+   The modules of the package are imported on first access (see lazyImport), importing
+   pyReefCore does not load the plotting, solver or MPI libraries.
 """
 # from .abc import abc
-from .forcing import preProc
-from .forcing import xmlParser
-from .forcing import enviForce
-from .simulation import coralGLV
-from .simulation import coreData
-from .simulation import modelPlot
+from .lazyImport import install
 
+install(__name__, {
+    'preProc': '.forcing.preProc',
+    'xmlParser': '.forcing.xmlParser',
+    'enviForce': '.forcing.enviForce',
+    'fidelityLevels': '.forcing.fidelityLevels',
+    'datasetCache': '.forcing.datasetCache',
+    'sharedTables': '.forcing.sharedTables',
+    'coralGLV': '.simulation.coralGLV',
+    'coreData': '.simulation.coreData',
+    'modelPlot': '.simulation.modelPlot',
+    'phaseCounters': '.simulation.phaseCounters',
+    'compactCore': '.simulation.compactCore',
+    'forwardKernel': '.simulation.forwardKernel',
+    'speculativeMH': '.sampling.speculativeMH',
+    'delayedAcceptance': '.sampling.delayedAcceptance',
+    'surrogateGP': '.sampling.surrogateGP',
+    'likelihoodGrid': '.sampling.likelihoodGrid',
+    'adaptiveSurface': '.sampling.adaptiveSurface',
+    'telemetry': '.sampling.telemetry',
+    'chainStore': '.sampling.chainStore',
+    'predictiveSummary': '.sampling.predictiveSummary',
+    'figureReport': '.sampling.figureReport',
+    'snapshotWriter': '.sampling.snapshotWriter',
+})
@@ -0,0 +1,328 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   Socket evaluation service around a pool of pyReefCore workers.
+
+   Messages are JSON objects, one per line. A client sends
+       {"op": "evaluate", "vectors": [[...], ...]}
+   and the server streams back, in completion order, one message per vector
+       {"index": i, "loglik": ..., "diff": ..., "codes": [...]}  or  {"index": i, "error": "..."}
+   where failed evaluations which exceeded the time or RHS budget of the workers carry
+   "timeout": true, followed by {"done": n}. The other requests are {"op": "info"} and {"op": "ping"}.
+   Addresses are "host:port" for TCP sockets or a file path for Unix sockets. The
+   service has no authentication and should only listen on localhost or a trusted
+   network.
+"""
+import os
+import json
+import socket
+import threading
+import SocketServer
+
+import numpy as np
+
+from pyReefCore.remote import RemoteError, RemoteTimeout
+
+def _address(address):
+    """
+    Return the socket family and address of a "host:port" string or Unix socket path.
+    """
+
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    if ':' in address and not os.path.sep in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+
+    return socket.AF_UNIX, address
+
+def _finite(value):
+    """JSON has no NaN: failed scores are sent as None."""
+
+    value = float(value)
+    if np.isnan(value):
+        return None
+
+    return value
+
+class _handler(SocketServer.StreamRequestHandler):
+
+    def _send(self, message):
+
+        self.wfile.write(json.dumps(message)+'\n')
+        self.wfile.flush()
+
+    def handle(self):
+
+        server = self.server.evaluator
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get('op')
+            except ValueError:
+                self._send({'error': 'Malformed request.'})
+                continue
+
+            if op == 'ping':
+                self._send({'pong': True})
+            elif op == 'info':
+                self._send(server.info())
+            elif op == 'evaluate':
+                count = 0
+                for message in server.evaluate(request.get('vectors', [])):
+                    self._send(message)
+                    count += 1
+                self._send({'done': count})
+            else:
+                self._send({'error': 'Unknown request %s.' % op})
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+class evalServer(object):
+    """
+    Evaluation server keeping warm pyReefCore models in a RemoteModel worker pool.
+
+    Batches from concurrent clients share the pool: their runs are dispatched on the idle
+    workers as they arrive and each client receives its own results. Each predicted core
+    is scored in the server process and only the log-likelihood, the difference score and
+    the categorical codes of the core are sent back.
+
+    Parameters
+    ----------
+    variable : remote
+        RemoteModel worker pool.
+
+    function : score
+        Function of a predicted core returning the sequence [loglik, core, diff] (as
+        returned by the BayesReef likelihood functions), where core holds one row per
+        depth.
+
+    string : address
+        "host:port" or Unix socket path the server listens on.
+    """
+
+    def __init__(self, remote, score, address):
+        """
+        Constructor.
+        """
+
+        self.remote = remote
+        self.score = score
+
+        family, self.address = _address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self._server = _UnixServer(self.address, _handler)
+        else:
+            self._server = _TCPServer(self.address, _handler)
+            self.address = self._server.server_address
+        self._server.evaluator = self
+
+        return
+
+    def info(self):
+        """Return a description of the served model."""
+
+        xmlinput, communities, core_depths, simtime, sedsim, flowsim = self.remote._setup[:6]
+
+        return {'xml': xmlinput, 'communities': communities, 'depths': len(core_depths),
+                'simtime': simtime, 'workers': self.remote.ncpus(), 'runs': self.remote.nruns,
+                'failed': self.remote.nfailed, 'timeout': self.remote.ntimeout}
+
+    def evaluate(self, vectors):
+        """
+        Run and score a batch of parameter vectors, yielding one message per vector in
+        completion order.
+
+        Parameters
+        ----------
+
+        variable : vectors
+            Parameter vectors.
+        """
+
+        for index, core in self.remote.imap(vectors):
+            if isinstance(core, RemoteError):
+                yield {'index': index, 'error': str(core),
+                       'timeout': isinstance(core, RemoteTimeout)}
+                continue
+            try:
+                loglik, pred_core, diff = self.score(core)
+            except Exception, e:
+                yield {'index': index, 'error': 'Scoring failed: %s' % e}
+                continue
+            codes = getattr(pred_core, 'codes', None)
+            if codes is None:
+                codes = np.argmax(pred_core, axis=1) + 1
+            yield {'index': index, 'loglik': _finite(loglik), 'diff': _finite(diff),
+                   'codes': codes.tolist()}
+
+    def serve_forever(self):
+        """Handle requests until shutdown is called."""
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.remove(self.address)
+
+        return
+
+    def start(self):
+        """Handle requests in a background thread."""
+
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+    def shutdown(self):
+        """Stop the server loop."""
+
+        self._server.shutdown()
+
+        return
+
+class evalClient(object):
+    """
+    Client of an evaluation server.
+
+    Parameters
+    ----------
+    string : address
+        "host:port" or Unix socket path of the server.
+
+    float : timeout
+        Socket timeout in seconds, None to wait indefinitely.
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        Constructor.
+        """
+
+        family, address = _address(address)
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._rfile = self._socket.makefile('rb')
+
+        return
+
+    def _request(self, message):
+
+        self._socket.sendall(json.dumps(message)+'\n')
+
+        return
+
+    def _receive(self):
+
+        line = self._rfile.readline()
+        if not line:
+            raise RemoteError('Connection closed by the evaluation server.')
+        message = json.loads(line)
+        if 'error' in message and 'index' not in message:
+            raise RemoteError(message['error'])
+
+        return message
+
+    def ping(self):
+        """Check that the server answers."""
+
+        self._request({'op': 'ping'})
+
+        return self._receive().get('pong', False)
+
+    def info(self):
+        """Return the description of the served model."""
+
+        self._request({'op': 'info'})
+
+        return self._receive()
+
+    def stream(self, vectors):
+        """
+        Send a batch of parameter vectors and yield (index, loglik, diff, codes) as the
+        results arrive. Failed evaluations yield a RemoteError instance (RemoteTimeout
+        when the evaluation exceeded its budget) in place of the log-likelihood, with diff
+        and codes set to None.
+
+        Parameters
+        ----------
+
+        variable : vectors
+            Parameter vectors.
+        """
+
+        self._request({'op': 'evaluate', 'vectors': [np.asarray(v, dtype=float).tolist() for v in vectors]})
+        while True:
+            message = self._receive()
+            if 'done' in message:
+                break
+            if 'error' in message:
+                error = RemoteTimeout if message.get('timeout') else RemoteError
+                yield message['index'], error(message['error']), None, None
+                continue
+            loglik = message['loglik']
+            if loglik is None:
+                loglik = np.nan
+            yield (message['index'], loglik, message['diff'],
+                   np.array(message['codes'], dtype=np.uint8))
+
+    def evaluate(self, vectors, errors='raise'):
+        """
+        Evaluate a batch of parameter vectors and return the list of (loglik, diff,
+        codes) in the order of the vectors.
+
+        Parameters
+        ----------
+
+        variable : vectors
+            Parameter vectors.
+
+        string : errors
+            'raise' to raise the first RemoteError (or RemoteTimeout), 'return' to return
+            the RemoteError instances in place of the failed results.
+        """
+
+        results = [None] * len(vectors)
+        for index, loglik, diff, codes in self.stream(vectors):
+            if isinstance(loglik, RemoteError):
+                results[index] = loglik
+            else:
+                results[index] = (loglik, diff, codes)
+
+        if errors == 'raise':
+            for result in results:
+                if isinstance(result, RemoteError):
+                    raise result
+
+        return results
+
+    def close(self):
+        """Close the connection."""
+
+        self._rfile.close()
+        self._socket.close()
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -11,6 +11,13 @@
    parameters: wave climate, sea level, siliciclastic input.
 """
 
-import xmlParser
-import preProc
-import enviForce
+from ..lazyImport import install
+
+install(__name__, {
+    'xmlParser': '.xmlParser',
+    'preProc': '.preProc',
+    'enviForce': '.enviForce',
+    'fidelityLevels': '.fidelityLevels',
+    'datasetCache': '.datasetCache',
+    'sharedTables': '.sharedTables',
+})
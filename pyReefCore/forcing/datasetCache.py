@@ -0,0 +1,199 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines a cache of the text data files (core observations, sea level,
+sediment input and flow velocity curves). Each table is parsed once and stored as a
+numpy binary file named after the SHA-1 hash of the text file content, so that later runs
+and worker processes map it in memory (read-only) instead of parsing it again. A modified
+text file has a new hash and is parsed again.
+"""
+import os
+import hashlib
+import tempfile
+
+import numpy
+
+import sharedTables
+
+# Version of the stored tables, part of the cache file names
+_version = 1
+
+class datasetCache:
+    """
+    This class converts whitespace separated text tables to memory-mappable binary files.
+
+    Parameters
+    ----------
+    string : directory
+        Cache directory, defaults to the PYREEFCORE_CACHE environment variable or
+        ~/.pyReefCore/cache.
+
+    boolean : mmap
+        Map the cached tables in memory (read-only) instead of reading them.
+    """
+
+    def __init__(self, directory=None, mmap=True):
+        """
+        Constructor.
+        """
+
+        if directory is None:
+            directory = os.environ.get('PYREEFCORE_CACHE',
+                                       os.path.join(os.path.expanduser('~'), '.pyReefCore', 'cache'))
+        self.directory = directory
+        self.mmap = mmap
+        # Content hash of the files already read, keyed by path, size and modification time
+        self._keys = {}
+
+        return
+
+    def key(self, fname):
+        """
+        Return the SHA-1 hash of the content of a file.
+
+        Parameters
+        ----------
+
+        string : fname
+            Text data file.
+        """
+
+        stat = os.stat(fname)
+        ident = (os.path.abspath(fname), stat.st_size, stat.st_mtime)
+        if ident not in self._keys:
+            digest = hashlib.sha1()
+            with open(fname, 'rb') as infile:
+                for block in iter(lambda: infile.read(1 << 20), b''):
+                    digest.update(block)
+            self._keys[ident] = digest.hexdigest()
+
+        return self._keys[ident]
+
+    def path(self, fname):
+        """
+        Return the name of the cached table of a text file.
+
+        Parameters
+        ----------
+
+        string : fname
+            Text data file.
+        """
+
+        return os.path.join(self.directory, '%s-v%d.npy' % (self.key(fname), _version))
+
+    def _parse(self, fname):
+        """
+        Read a whitespace separated text table as a two-dimensional float array, with the
+        rules of numpy.genfromtxt (any line ending, blank lines and comments skipped).
+        """
+
+        data = numpy.genfromtxt(fname, dtype=numpy.float64)
+        if data.ndim < 2:
+            # One line or one column: count the columns of the first data line
+            ncols = 1
+            with open(fname, 'rU') as infile:
+                for line in infile:
+                    line = line.split('#')[0].split()
+                    if len(line) > 0:
+                        ncols = len(line)
+                        break
+            data = data.reshape((-1, ncols))
+
+        return numpy.ascontiguousarray(data)
+
+    def table(self, fname):
+        """
+        Return the table of a text file (one row per line), parsing it and storing it in
+        the cache the first time.
+
+        Parameters
+        ----------
+
+        string : fname
+            Text data file.
+        """
+
+        cached = self.path(fname)
+        if os.path.isfile(cached):
+            try:
+                return numpy.load(cached, mmap_mode='r' if self.mmap else None)
+            except (IOError, ValueError):
+                pass
+
+        data = self._parse(fname)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Write then rename so that concurrent runs never read a partial file
+            fd, tmpname = tempfile.mkstemp(suffix='.npy', dir=self.directory)
+            with os.fdopen(fd, 'wb') as outfile:
+                numpy.save(outfile, data)
+            os.rename(tmpname, cached)
+        except (IOError, OSError):
+            # Read-only or full cache directory: use the parsed table
+            return data
+
+        if self.mmap:
+            return numpy.load(cached, mmap_mode='r')
+
+        return data
+
+    def clear(self):
+        """Remove the cached tables."""
+
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(self.directory, name))
+        self._keys = {}
+
+        return
+
+# Cache used by loadtable
+_cache = None
+
+def loadtable(fname, usecols=None, cache=None):
+    """
+    Return a table (or some of its columns) of a whitespace separated text file through the
+    dataset cache, or the table shared by the coordinator process when it is attached
+    (see sharedTables). A single column is returned as a one-dimensional array, as
+    numpy.genfromtxt(fname, usecols=(column), unpack=True) does.
+
+    Parameters
+    ----------
+
+    string : fname
+        Text data file.
+
+    variable : usecols
+        Column index or sequence of column indices, all columns by default.
+
+    variable : cache
+        datasetCache instance, a shared default cache is used if None.
+    """
+
+    global _cache
+    if cache is None:
+        if _cache is None:
+            _cache = datasetCache()
+        cache = _cache
+
+    data = None
+    if sharedTables.active():
+        data = sharedTables.lookup(sharedTables.file_key(fname))
+    if data is None:
+        data = cache.table(fname)
+    if usecols is None:
+        return data
+    if numpy.isscalar(usecols):
+        return data[:,usecols]
+
+    return data[:,list(usecols)]
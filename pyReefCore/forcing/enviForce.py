@@ -14,12 +14,36 @@ import warnings
 
 import os
 import numpy
-import pandas
-import skfuzzy as fuzz
 from scipy import interpolate
 from scipy.optimize import curve_fit
 from scipy.optimize import OptimizeWarning
 
+import datasetCache
+import sharedTables
+
+def trapezoids(x, params):
+    """
+    Return the trapezoidal production curves of each species (one row per species) on a
+    grid, or the table shared by the coordinator process when it is attached.
+
+    Parameters
+    ----------
+    variable : x
+        Grid of the curves.
+
+    variable : params
+        Trapezoid parameters of each species.
+    """
+
+    if sharedTables.active():
+        table = sharedTables.lookup(sharedTables.trapezoid_key(x, params))
+        if table is not None:
+            return table
+
+    import skfuzzy as fuzz
+
+    return numpy.array([fuzz.trapmf(x, params[s,:]) for s in range(len(params))])
+
 class enviForce:
     """
     This class defines external forcing parameters.
@@ -120,8 +144,7 @@ class enviForce:
             self.edepth = input.enviDepth
             # Trapeizoidal environment depth production curve
             self.xd = numpy.linspace(0, self.edepth.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.dtrap.append(fuzz.trapmf(self.xd, self.edepth[s,:]))
+            self.dtrap = trapezoids(self.xd, self.edepth[:input.speciesNb])
 
         self.speciesNb = input.speciesNb
         self.eflow = None
@@ -133,8 +156,7 @@ class enviForce:
             self.eflow = input.enviFlow
             # Trapeizoidal environment flow production curve
             self.xf = numpy.linspace(0, self.eflow.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.ftrap.append(fuzz.trapmf(self.xf, self.eflow[s,:]))
+            self.ftrap = trapezoids(self.xf, self.eflow[:input.speciesNb])
 
         self.esed = None
         self.xs = None
@@ -145,8 +167,7 @@ class enviForce:
             self.esed = input.enviSed
             # Trapeizoidal environment sediment production curve
             self.xs = numpy.linspace(0, self.esed.max(), num=1001, endpoint=True)
-            for s in range(input.speciesNb):
-                self.strap.append(fuzz.trapmf(self.xs, self.esed[s,:]))
+            self.strap = trapezoids(self.xs, self.esed[:input.speciesNb])
 
         return
 
@@ -179,51 +200,45 @@ class enviForce:
 
     def _build_Sea_function(self):
         """
-        Using Pandas library to read the sea level file and define sea level interpolation
-        function based on Scipy 1D cubic function.
+        Read the sea level file through the dataset cache (parsed once, then memory
+        mapped) and define interpolation function based on Scipy 1D function.
         """
 
         # Read sea level file
-        seadata = pandas.read_csv(self.seafile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        seadata = datasetCache.loadtable(self.seafile)
 
-        self.seatime = seadata.values[:,0]
-        tmp = seadata.values[:,1]
+        self.seatime = seadata[:,0]
+        tmp = seadata[:,1]
         self.seaFunc = interpolate.interp1d(self.seatime, tmp, kind='linear')
 
         return
 
     def _build_Sed_function(self):
         """
-        Using Pandas library to read the sediment input file and define interpolation
-        function based on Scipy 1D cubic function.
+        Read the sediment input file through the dataset cache (parsed once, then memory
+        mapped) and define interpolation function based on Scipy 1D function.
         """
 
         # Read sea level file
-        seddata = pandas.read_csv(self.sedfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        seddata = datasetCache.loadtable(self.sedfile)
 
-        self.sedtime = seddata.values[:,0]
-        tmp = seddata.values[:,1]
+        self.sedtime = seddata[:,0]
+        tmp = seddata[:,1]
         self.sedFunc = interpolate.interp1d(self.sedtime, tmp, kind='linear')
 
         return
 
     def _build_Flow_function(self):
         """
-        Using Pandas library to read the flow velocity file and define interpolation
-        function based on Scipy 1D cubic function.
+        Read the flow velocity file through the dataset cache (parsed once, then memory
+        mapped) and define interpolation function based on Scipy 1D function.
         """
 
         # Read sea level file
-        flowdata = pandas.read_csv(self.flowfile, sep=r'\s+', engine='c',
-                               header=None, na_filter=False,
-                               dtype=numpy.float, low_memory=False)
+        flowdata = datasetCache.loadtable(self.flowfile)
 
-        self.flowtime = flowdata.values[:,0]
-        tmp = flowdata.values[:,1]
+        self.flowtime = flowdata[:,0]
+        tmp = flowdata[:,1]
         self.flowFunc = interpolate.interp1d(self.flowtime, tmp, kind='cubic')
 
         return
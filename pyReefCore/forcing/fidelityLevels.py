@@ -0,0 +1,405 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module derives lower-fidelity versions of a pyReefCore XmL input file and measures
+their cost and likelihood discrepancy against the full-fidelity model.
+"""
+import os
+import time
+import numpy
+import xml.etree.ElementTree as ET
+from decimal import Decimal
+from scipy import stats
+
+from xmlParser import snap
+
+# Columns of the evaluate and validate reports
+evaluate_keys = ['name', 'cost', 'speedup', 'bias', 'rmse', 'maxerr', 'spearman']
+validate_keys = ['name', 'cost', 'speedup', 'code_changes', 'interval_changes',
+                 'likelihood_changes', 'maxerr', 'safe']
+
+class fidelityLevel:
+    """
+    This class defines a model fidelity: carbonate time step, stratal layer interval, RKF
+    tolerances (or solver accuracy profile) and number of ODE steps per carbonate
+    interval. Values set to None are read from the XmL input file.
+
+    Parameters
+    ----------
+    string : name
+        Name of the fidelity level.
+
+    float : tCarb
+        Carbonate time step.
+
+    float : laytime
+        Stratal layer time interval.
+
+    float : rtol
+        Relative tolerance of the RKF solver.
+
+    float : atol
+        Absolute tolerance of the RKF solver.
+
+    integer : odeSteps
+        Number of ODE steps per carbonate interval.
+
+    string : profile
+        Solver accuracy profile (strict, default or fast), rtol and atol take precedence.
+
+    string : backend
+        Backend of the carbonate time loop (odespy or kernel), see Model.set_backend.
+        Levels are used to compare backends, so they may select the unvalidated kernel.
+    """
+
+    def __init__(self, name, tCarb=None, laytime=None, rtol=None, atol=None, odeSteps=None,
+                 profile=None, backend=None):
+        """
+        Constructor.
+        """
+
+        self.name = name
+        self.tCarb = tCarb
+        self.laytime = laytime
+        self.rtol = rtol
+        self.atol = atol
+        self.odeSteps = odeSteps
+        self.profile = profile
+        self.backend = backend
+
+        return
+
+    def __repr__(self):
+
+        return 'fidelityLevel(%s: tcarb=%s, laytime=%s, rtol=%s, atol=%s, odesteps=%s, profile=%s, backend=%s)' \
+            %(self.name, self.tCarb, self.laytime, self.rtol, self.atol, self.odeSteps, self.profile,
+              self.backend)
+
+    def apply(self, model):
+        """
+        Set the fidelity of a pyReefCore model before its XmL input file is loaded.
+
+        Parameters
+        ----------
+
+        variable : model
+            pyReefCore Model instance.
+        """
+
+        model.set_fidelity(tCarb=self.tCarb, laytime=self.laytime, rtol=self.rtol,
+                           atol=self.atol, odeSteps=self.odeSteps, profile=self.profile)
+        if self.backend is not None:
+            model.set_backend(self.backend, check=True)
+
+        return
+
+def _read_time(inputfile):
+    """
+    Read the time structure of a XmL input file.
+    """
+
+    root = ET.parse(inputfile).getroot()
+    tnode = root.find('time')
+    if tnode is None:
+        raise ValueError('Error in the XmL file: time structure definition is required!')
+    tStart = float(tnode.find('start').text)
+    tEnd = float(tnode.find('end').text)
+    tCarb = float(tnode.find('tcarb').text)
+    element = tnode.find('laytime')
+    if element is not None:
+        laytime = float(element.text)
+    else:
+        laytime = tCarb
+
+    return tStart, tEnd, tCarb, laytime
+
+def derive(inputfile, name, time_factor=1, layer_factor=1, rtol=None, atol=None, odeSteps=None,
+           profile=None):
+    """
+    Derive a consistent fidelity level from a base XmL input file.
+
+    The carbonate time step and layer interval are multiplied by the given factors and
+    snapped so that the layer interval stays an exact multiple of the carbonate interval
+    and the simulation time interval an exact multiple of the layer interval, as required
+    by xmlParser.
+
+    Parameters
+    ----------
+
+    variable : inputfile
+        Base XmL input file.
+
+    variable : name
+        Name of the fidelity level.
+
+    variable : time_factor
+        Coarsening factor of the carbonate time step.
+
+    variable : layer_factor
+        Coarsening factor of the stratal layer interval.
+
+    variable : rtol, atol
+        RKF solver tolerances (None keeps the coralGLV defaults).
+
+    variable : odeSteps
+        Number of ODE steps per carbonate interval (None keeps the default).
+
+    variable : profile
+        Solver accuracy profile (None keeps the default), rtol and atol take precedence.
+    """
+
+    tStart, tEnd, tCarb, laytime = _read_time(inputfile)
+    span = tEnd - tStart
+
+    carb = snap(tCarb*time_factor, tCarb, span)
+    lay = snap(max(laytime*layer_factor, carb), carb, span)
+
+    return fidelityLevel(name, tCarb=carb, laytime=lay, rtol=rtol, atol=atol, odeSteps=odeSteps,
+                         profile=profile)
+
+def ladder(inputfile):
+    """
+    Return the default fidelity levels of a XmL input file, from the full-fidelity model
+    to a coarse screening model. The carbonate time step is coarsened by factors of 2, 4
+    and 8 (before snapping) and the RKF tolerances are loosened, all levels keep the step
+    control of the full-fidelity solver.
+
+    Parameters
+    ----------
+
+    variable : inputfile
+        Base XmL input file.
+    """
+
+    levels = []
+    levels.append(derive(inputfile, 'full'))
+    levels.append(derive(inputfile, 'medium', time_factor=2, rtol=1.e-6, atol=1.e-10, odeSteps=50))
+    levels.append(derive(inputfile, 'coarse', time_factor=4, layer_factor=2, rtol=1.e-5,
+                         atol=1.e-8, odeSteps=20))
+    levels.append(derive(inputfile, 'screen', time_factor=8, layer_factor=4, rtol=1.e-4,
+                         atol=1.e-6, odeSteps=10))
+
+    return levels
+
+def profiles(names=['strict', 'default', 'fast']):
+    """
+    Return one fidelity level per solver accuracy profile, keeping the time structure of
+    the XmL input file. The strict profile comes first as the reference of validate.
+
+    Parameters
+    ----------
+
+    variable : names
+        Names of the solver accuracy profiles.
+    """
+
+    return [fidelityLevel(name, profile=name) for name in names]
+
+def backends(names=['odespy', 'kernel'], profile=None):
+    """
+    Return one fidelity level per backend of the carbonate time loop, keeping the time
+    structure of the XmL input file. The odespy backend comes first as the reference of
+    validate.
+
+    Parameters
+    ----------
+
+    variable : names
+        Names of the backends.
+
+    string : profile
+        Solver accuracy profile used by every backend.
+    """
+
+    return [fidelityLevel(name, profile=profile, backend=name) for name in names]
+
+def write_xml(inputfile, level, outputfile=None):
+    """
+    Write the XmL input file of a fidelity level. The file is written next to the base
+    input file so that relative forcing file paths remain valid.
+
+    Parameters
+    ----------
+
+    variable : inputfile
+        Base XmL input file.
+
+    variable : level
+        fidelityLevel instance.
+
+    variable : outputfile
+        Name of the new XmL file, defaults to the base name followed by the level name.
+    """
+
+    if outputfile is None:
+        base, ext = os.path.splitext(inputfile)
+        outputfile = '%s_%s%s' %(base, level.name, ext)
+
+    tree = ET.parse(inputfile)
+    root = tree.getroot()
+    tnode = root.find('time')
+    if level.tCarb is not None:
+        tnode.find('tcarb').text = str(level.tCarb)
+    if level.laytime is not None:
+        element = tnode.find('laytime')
+        if element is None:
+            element = ET.SubElement(tnode, 'laytime')
+        element.text = str(level.laytime)
+
+    solver = root.find('solver')
+    for key, value in [('profile', level.profile), ('rtol', level.rtol), ('atol', level.atol),
+                       ('odesteps', level.odeSteps)]:
+        if value is None:
+            continue
+        if solver is None:
+            solver = ET.Element('solver')
+            solver.tail = tnode.tail
+            root.insert(list(root).index(tnode)+1, solver)
+        element = solver.find(key)
+        if element is None:
+            element = ET.SubElement(solver, key)
+        element.text = str(value)
+
+    tree.write(outputfile)
+
+    return outputfile
+
+def evaluate(levels, likelihood, validation, reference=0):
+    """
+    Measure the cost of each fidelity level and its log-likelihood discrepancy against a
+    reference level on a validation set of parameter vectors.
+
+    Parameters
+    ----------
+
+    variable : levels
+        List of fidelityLevel instances.
+
+    variable : likelihood
+        Function called as likelihood(level, v) and returning the log-likelihood (or a
+        sequence starting with it) of the parameter vector v at the given level.
+
+    variable : validation
+        Validation parameter vectors (one per row).
+
+    variable : reference
+        Index of the full-fidelity level in levels.
+    """
+
+    nb = len(validation)
+    loglik = numpy.zeros((len(levels), nb))
+    cost = numpy.zeros(len(levels))
+    for l in range(len(levels)):
+        t0 = time.time()
+        for k in range(nb):
+            result = likelihood(levels[l], validation[k])
+            if isinstance(result, (list, tuple)):
+                result = result[0]
+            loglik[l,k] = float(result)
+        cost[l] = (time.time() - t0)/nb
+
+    report = []
+    for l in range(len(levels)):
+        diff = loglik[l] - loglik[reference]
+        ok = numpy.isfinite(diff)
+        if numpy.count_nonzero(ok) > 1:
+            rank = stats.spearmanr(loglik[l,ok], loglik[reference,ok])[0]
+        else:
+            rank = numpy.nan
+        report.append({'name': levels[l].name, 'cost': cost[l],
+                       'speedup': cost[reference]/cost[l] if cost[l] > 0. else numpy.inf,
+                       'bias': numpy.mean(diff[ok]) if ok.any() else numpy.nan,
+                       'rmse': numpy.sqrt(numpy.mean(diff[ok]**2)) if ok.any() else numpy.nan,
+                       'maxerr': numpy.max(numpy.abs(diff[ok])) if ok.any() else numpy.nan,
+                       'spearman': rank})
+
+    return report, loglik
+
+def validate(levels, likelihood, validation, reference=0, tol=1.e-6):
+    """
+    Measure how often each level changes the predicted core codes (dominant assemblage
+    of each depth interval) and the log-likelihood relative to a reference level on a
+    validation set of parameter vectors.
+
+    Parameters
+    ----------
+
+    variable : levels
+        List of fidelityLevel instances.
+
+    variable : likelihood
+        Function called as likelihood(level, v) and returning the sequence [loglik, core,
+        diff] of the parameter vector v at the given level, where core is a compactCore
+        or holds the predicted proportions with one row per depth interval.
+
+    variable : validation
+        Validation parameter vectors (one per row).
+
+    variable : reference
+        Index of the reference level in levels.
+
+    variable : tol
+        Log-likelihood difference above which the likelihood is considered changed.
+    """
+
+    nb = len(validation)
+    loglik = numpy.zeros((len(levels), nb))
+    codes = [[None]*nb for l in range(len(levels))]
+    cost = numpy.zeros(len(levels))
+    for l in range(len(levels)):
+        t0 = time.time()
+        for k in range(nb):
+            result = likelihood(levels[l], validation[k])
+            loglik[l,k] = float(result[0])
+            codes[l][k] = getattr(result[1], 'codes', None)
+            if codes[l][k] is None:
+                codes[l][k] = numpy.argmax(result[1], axis=1) + 1
+        cost[l] = (time.time() - t0)/nb
+
+    report = []
+    for l in range(len(levels)):
+        changed = numpy.array([numpy.count_nonzero(codes[l][k] != codes[reference][k])
+                               for k in range(nb)])
+        intervals = numpy.array([len(codes[reference][k]) for k in range(nb)])
+        diff = numpy.abs(loglik[l] - loglik[reference])
+        report.append({'name': levels[l].name, 'cost': cost[l],
+                       'speedup': cost[reference]/cost[l] if cost[l] > 0. else numpy.inf,
+                       'code_changes': numpy.mean(changed > 0),
+                       'interval_changes': float(numpy.sum(changed))/max(numpy.sum(intervals), 1),
+                       'likelihood_changes': numpy.mean(diff > tol),
+                       'maxerr': numpy.max(diff) if nb > 0 else numpy.nan,
+                       'safe': bool(numpy.all(changed == 0) and numpy.all(diff <= tol))})
+
+    return report, loglik
+
+def write_report(report, filename, keys=None):
+    """
+    Write a fidelity evaluation report as a CSV file.
+
+    Parameters
+    ----------
+
+    variable : report
+        Report returned by evaluate or validate.
+
+    variable : filename
+        Name of the CSV file.
+
+    variable : keys
+        Columns of the CSV file, defaults to the columns of the evaluate report.
+    """
+
+    if keys is None:
+        keys = evaluate_keys
+    with open(filename, 'w') as outfile:
+        outfile.write(','.join(keys)+'\n')
+        for row in report:
+            outfile.write(','.join([str(row[key]) for key in keys])+'\n')
+
+    return
@@ -0,0 +1,190 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module shares read-only tables (forcing curves, fuzzy production curves of the
+depth, core depths) between a coordinator and its worker processes. The coordinator
+writes each table once as a numpy file in a memory backed directory (/dev/shm when
+available) and the workers attach them as read-only memory mapped views, so that all the
+processes use the same physical pages. Tables which are not attached are computed by
+each process as usual.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy
+
+# Tables attached in this process, keyed by name
+_attached = {}
+
+def file_key(fname):
+    """
+    Return the name of the table of a forcing or data file.
+
+    Parameters
+    ----------
+
+    string : fname
+        Text data file.
+    """
+
+    return 'file:%s' % os.path.abspath(fname)
+
+def trapezoid_key(x, params):
+    """
+    Return the name of the table of trapezoidal membership functions of a grid and of
+    their parameters (one row per species).
+
+    Parameters
+    ----------
+
+    variable : x
+        Grid of the membership functions.
+
+    variable : params
+        Trapezoid parameters of each species.
+    """
+
+    digest = hashlib.sha1(numpy.ascontiguousarray(x, dtype=float).tostring())
+    digest.update(numpy.ascontiguousarray(params, dtype=float).tostring())
+
+    return 'trapmf:%s' % digest.hexdigest()
+
+def attach(paths):
+    """
+    Attach the tables shared by a coordinator in this process.
+
+    Parameters
+    ----------
+
+    variable : paths
+        Dictionary of the table files keyed by name (sharedTables.paths).
+    """
+
+    for name, path in paths.items():
+        _attached[name] = numpy.load(path, mmap_mode='r')
+
+    return
+
+def detach():
+    """Forget the attached tables."""
+
+    _attached.clear()
+
+    return
+
+def active():
+    """Return True if tables are attached in this process."""
+
+    return len(_attached) > 0
+
+def lookup(name):
+    """
+    Return an attached table, None if the table is not shared.
+
+    Parameters
+    ----------
+
+    string : name
+        Name of the table.
+    """
+
+    return _attached.get(name)
+
+class sharedTables:
+    """
+    This class holds the tables a coordinator shares with its worker processes.
+
+    Parameters
+    ----------
+    string : directory
+        Parent directory of the table files, /dev/shm by default when available.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Constructor.
+        """
+
+        if directory is None and os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        self.directory = tempfile.mkdtemp(prefix='pyReefCore-', dir=directory)
+        self.paths = {}
+
+        return
+
+    @property
+    def nbytes(self):
+        """Size of the shared tables."""
+
+        return sum([os.path.getsize(path) for path in self.paths.values()])
+
+    def add(self, name, array):
+        """
+        Share a table and return its read-only view.
+
+        Parameters
+        ----------
+
+        string : name
+            Name of the table.
+
+        variable : array
+            Table values.
+        """
+
+        path = os.path.join(self.directory, '%d.npy' % len(self.paths))
+        numpy.save(path, numpy.ascontiguousarray(array))
+        self.paths[name] = path
+
+        return numpy.load(path, mmap_mode='r')
+
+    def add_model(self, xmlinput):
+        """
+        Share the forcing curves and the fuzzy depth production curves of an XmL input
+        file, which are the same for every parameter vector.
+
+        Parameters
+        ----------
+
+        string : xmlinput
+            XmL input file of the model.
+        """
+
+        import datasetCache
+        import xmlParser
+        from enviForce import trapezoids
+
+        input = xmlParser.xmlParser(xmlinput, makeUniqueOutputDir=False)
+        for fname in [input.seafile, input.sedfile, input.flowfile]:
+            if fname is not None and file_key(fname) not in self.paths:
+                self.add(file_key(fname), datasetCache.loadtable(fname))
+        if input.seaOn and input.enviDepth is not None:
+            params = input.enviDepth[:input.speciesNb]
+            x = numpy.linspace(0, input.enviDepth.max(), num=1001, endpoint=True)
+            self.add(trapezoid_key(x, params), trapezoids(x, params))
+
+        return
+
+    def close(self):
+        """Remove the table files (attached views stay valid)."""
+
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+        self.paths = {}
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
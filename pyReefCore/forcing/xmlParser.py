@@ -13,10 +13,44 @@ import os
 import glob
 import numpy
 import shutil
+import warnings
 import xml.etree.ElementTree as ET
 from collections import defaultdict
 from decimal import Decimal
 
+def snap(value, base, span):
+    """
+    Return the multiple of base which divides span and is the closest to value.
+
+    Parameters
+    ----------
+
+    float : value
+        Requested time interval.
+
+    float : base
+        Time interval the result is a multiple of (e.g. carbonate time step).
+
+    float : span
+        Time interval the result divides (e.g. simulation time interval).
+    """
+
+    base = Decimal(repr(base))
+    span = Decimal(repr(span))
+    nb = int(span/base)
+    best = None
+    for k in range(1, nb+1):
+        step = k*base
+        if span % step != 0:
+            continue
+        if best is None or abs(float(step)-value) < abs(float(best)-value):
+            best = step
+
+    if best is None:
+        raise ValueError('Error in the time structure: simulation time interval needs to be an exact multiple of the carbonate interval!')
+
+    return float(best)
+
 class xmlParser:
     """
     This class defines XmL input file variables.
@@ -79,6 +113,11 @@ class xmlParser:
         self.enviSed = None
         self.enviFlow = None
 
+        self.rtol = None
+        self.atol = None
+        self.profile = None
+        self.odeSteps = None
+
         self.makeUniqueOutputDir = makeUniqueOutputDir
         self.outDir = None
 
@@ -113,7 +152,7 @@ class xmlParser:
             if element is not None:
                 self.tEnd = float(element.text)
             else:
-                raise ValueErself.ror('Error in the definition of the simulation time: end time declaration is required')
+                raise ValueError('Error in the definition of the simulation time: end time declaration is required')
             if self.tStart > self.tEnd:
                 raise ValueError('Error in the definition of the simulation time: start time is greater than end time!')
             element = None
@@ -129,7 +168,12 @@ class xmlParser:
             else:
                 self.laytime = self.tCarb
             if Decimal(self.laytime) % Decimal(self.tCarb) != 0.:
-                raise ValueError('Error in the XmL file: stratal layer interval needs to be an exact multiple of the carbonate interval!')
+                # Stratal layers are closed on carbonate time steps: use the closest
+                # multiple of the carbonate interval which divides the simulation time
+                laytime = snap(self.laytime, self.tCarb, self.tEnd-self.tStart)
+                warnings.warn('Stratal layer interval %s is not a multiple of the carbonate interval %s, using %s.'
+                              %(self.laytime, self.tCarb, laytime))
+                self.laytime = laytime
             if Decimal(self.tEnd-self.tStart) % Decimal(self.laytime) != 0.:
                 raise ValueError('Error in the XmL file: layer time interval needs to be an exact multiple of the simulation time interval!')
         else:
@@ -403,6 +447,31 @@ class xmlParser:
                 # Build array from matrix string
                 self.enviSed = numpy.array(numpy.mat(';'.join(rows)))
 
+        # Extract ODE solver accuracy information (optional)
+        solver = None
+        solver = root.find('solver')
+        if solver is not None:
+            element = None
+            element = solver.find('profile')
+            if element is not None:
+                self.profile = element.text.strip()
+                if self.profile not in ['strict', 'default', 'fast']:
+                    raise ValueError('Error in the XmL file: solver profile needs to be strict, default or fast!')
+            element = None
+            element = solver.find('rtol')
+            if element is not None:
+                self.rtol = float(element.text)
+            element = None
+            element = solver.find('atol')
+            if element is not None:
+                self.atol = float(element.text)
+            element = None
+            element = solver.find('odesteps')
+            if element is not None:
+                self.odeSteps = int(element.text)
+                if self.odeSteps < 1:
+                    raise ValueError('Error in the XmL file: the number of ODE steps per carbonate interval needs to be positive!')
+
         # Get output directory
         #out = None
         #out = root.find('outfolder')
@@ -0,0 +1,247 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the functional entry point of pyReefCore: simulate(config, params)
+runs the forward model of a parameter vector and returns the predicted core without side
+effects. The XmL input file is parsed once in a read-only SimulationConfig and every call
+builds its own SimulationState (time, forcing, core and coral population), so that
+simulations can run concurrently (threads) with the same configuration. The model draws
+no random numbers and the global numpy random generator is left untouched.
+"""
+import copy
+import time
+import numpy as np
+
+from pyReefCore import xmlParser, coralGLV, phaseCounters
+from pyReefCore.model import SimulationState, apply_fidelity, check_backend
+
+def vector_parameters(communities, params, sedsim, flowsim):
+    """
+    Return the sediment and flow production curves, the community matrix and the Malthusian
+    parameters encoded in a parameter vector (see Model.convertVector).
+
+    Parameters
+    ----------
+
+    integer : communities
+        Number of communities (species).
+
+    variable : params
+        Parameter vector: sediment curves (if sedsim), flow curves (if flowsim), main and
+        sub-/super-diagonal values of the community matrix and Malthusian parameter.
+
+    boolean : sedsim, flowsim
+        Sediment and flow curves are part of the vector.
+    """
+
+    params = np.asarray(params, dtype=float)
+    size = communities*4
+    sed = None
+    flow = None
+    k = 0
+    if sedsim:
+        sed = params[k:k+size].reshape(4,communities).T
+        k += size
+    if flowsim:
+        flow = params[k:k+size].reshape(4,communities).T
+        k += size
+
+    cmatrix = np.zeros((communities, communities))
+    np.fill_diagonal(cmatrix, params[k])
+    for i in range(0, communities - 1):
+        cmatrix[i][i + 1] = params[k+1]
+        cmatrix[i + 1][i] = params[k+1]
+    malthus = np.full(communities, float(params[k+2]))
+
+    return sed, flow, cmatrix, malthus
+
+class SimulationConfig(object):
+    """
+    Read-only configuration of the forward model shared by all calls to simulate.
+
+    Parameters
+    ----------
+    string : xmlinput
+        XmL input file.
+
+    integer : communities
+        Number of communities (species).
+
+    variable : core_depths
+        Depths of the predicted core intervals.
+
+    float : simtime
+        Simulation end time.
+
+    boolean : sedsim, flowsim
+        Sediment and flow production curves are part of the parameter vectors.
+
+    variable : level
+        Optional fidelityLevels.fidelityLevel applied to the configuration.
+    """
+
+    def __init__(self, xmlinput, communities, core_depths, simtime, sedsim=False,
+                 flowsim=False, level=None):
+        """
+        Constructor.
+        """
+
+        self.xmlinput = xmlinput
+        self.communities = communities
+        self.core_depths = np.asarray(core_depths)
+        self.simtime = simtime
+        self.sedsim = sedsim
+        self.flowsim = flowsim
+        self.input = xmlParser.xmlParser(xmlinput, makeUniqueOutputDir=False)
+        self.rtol = None
+        self.atol = None
+        self.odeSteps = None
+        self.profile = None
+        self.maxTime = None
+        self.maxRHS = None
+        self.backend = 'odespy'
+        if level is not None:
+            level.apply(self)
+
+        return
+
+    def set_fidelity(self, tCarb=None, laytime=None, rtol=None, atol=None, odeSteps=None,
+                     profile=None):
+        """
+        Override the time structure, the RKF tolerances and the number of ODE steps of the
+        XmL input file, as Model.set_fidelity does.
+        """
+
+        if profile is not None and profile not in coralGLV.profiles:
+            raise ValueError('Unknown solver profile %s.' %profile)
+
+        if tCarb is not None or laytime is not None:
+            apply_fidelity(self.input, tCarb, laytime)
+        self.rtol = rtol
+        self.atol = atol
+        self.odeSteps = odeSteps
+        self.profile = profile
+
+        return
+
+    def set_backend(self, backend='odespy', check=False):
+        """
+        Select the backend of the carbonate time loop, as Model.set_backend does. The
+        compiled kernel releases the GIL, simulations then run in parallel in threads.
+        """
+
+        check_backend(backend, check)
+        self.backend = backend
+
+        return
+
+    def set_budget(self, maxTime=None, maxRHS=None):
+        """
+        Limit the wall-clock time (in seconds) and the number of GLV right-hand side
+        evaluations of each simulation, as Model.set_budget does.
+        """
+
+        self.maxTime = maxTime
+        self.maxRHS = maxRHS
+
+        return
+
+    def steps(self):
+        """Return the number of ODE steps of each carbonate time interval."""
+
+        if self.odeSteps is not None:
+            return self.odeSteps
+        if self.input.odeSteps is not None:
+            return self.input.odeSteps
+
+        return 100
+
+class CoreResult(object):
+    """
+    Results of a simulation.
+
+    Parameters
+    ----------
+    variable : core
+        Predicted core: proportions of each community and of the sediment (rows) at the core
+        depths of the configuration (columns), as modelPlot.core_timetodepth.
+
+    variable : state
+        SimulationState of the run.
+    """
+
+    def __init__(self, core, state):
+        """
+        Constructor.
+        """
+
+        self.core = core
+        self.population = state.coral.population
+        self.iterationTime = state.coral.iterationTime
+        self.accspace = state.coral.accspace
+        self.thickness = state.core.thickness
+        self.coralH = state.core.coralH
+        self.layTime = state.core.layTime
+        self.topH = state.core.topH
+        self.sealevel = state.core.sealevel
+        self.sedinput = state.core.sedinput
+        self.waterflow = state.core.waterflow
+        self.counters = state.counters.run()
+
+        return
+
+def simulate(config, params):
+    """
+    Run the forward model of a parameter vector and return its CoreResult. The configuration
+    is not modified, the call raises coralGLV.budgetExceeded if the simulation exceeds the
+    budget of the configuration.
+
+    Parameters
+    ----------
+
+    variable : config
+        SimulationConfig instance.
+
+    variable : params
+        Parameter vector (see vector_parameters).
+    """
+
+    tRun = time.time()
+    counters = phaseCounters.phaseCounters()
+    counters.start_run()
+
+    # Input parameters of this run, the shared ones are only read
+    sed, flow, cmatrix, malthus = vector_parameters(config.communities, params,
+                                                    config.sedsim, config.flowsim)
+    input = copy.copy(config.input)
+    if sed is not None:
+        input.enviSed = sed
+    if flow is not None:
+        input.enviFlow = flow
+    input.communityMatrix = cmatrix
+    input.malthusParam = malthus
+
+    state = SimulationState(counters)
+    state.backend = config.backend
+    state.setup(input)
+    counters.add('xml_time', time.time()-tRun)
+    state.start(config.profile, config.rtol, config.atol)
+    if config.maxRHS is not None:
+        state.coral.maxRHS = config.maxRHS
+    if config.maxTime is not None:
+        state.coral.deadline = tRun + config.maxTime
+
+    t0 = time.time()
+    state.advance(min(config.simtime, input.tEnd), config.steps())
+    state.collect()
+    counters.add('rhs_calls', state.coral.nrhs)
+    counters.add('run_time', time.time()-t0)
+    core = state.plot.core_timetodepth(config.communities, config.core_depths)
+
+    return CoreResult(core, state)
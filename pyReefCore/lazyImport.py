@@ -0,0 +1,101 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module makes the pyReefCore package namespaces lazy: the modules of a package are
+imported the first time one of them is accessed (pyReefCore.enviForce, from
+pyReefCore.sampling import figureReport...) and not when the package itself is imported,
+so that a process only pays for the modules (and their dependencies) it uses.
+"""
+import sys
+import types
+import importlib
+
+class lazyPackage(types.ModuleType):
+    """
+    This class replaces a package in sys.modules and imports its modules on demand.
+
+    Parameters
+    ----------
+    variable : module
+        Package being replaced.
+
+    variable : modules
+        Dictionary of the module names of the package namespace and of their path,
+        relative to the package (e.g. {'preProc': '.forcing.preProc'}).
+    """
+
+    def __init__(self, module, modules):
+        """
+        Constructor.
+        """
+
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Keep the replaced package alive, Python 2 clears the globals of deleted modules
+        self._package = module
+        self._modules = dict(modules)
+        self.__all__ = sorted(modules)
+
+        return
+
+    def __getattr__(self, name):
+
+        modules = self.__dict__.get('_modules', {})
+        if name not in modules:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+        module = importlib.import_module(modules[name], self.__name__)
+        setattr(self, name, module)
+
+        return module
+
+    def __dir__(self):
+
+        return sorted(set(self.__dict__.keys()) | set(self._modules.keys()))
+
+def install(name, modules):
+    """
+    Replace a package by its lazy namespace and return it.
+
+    Parameters
+    ----------
+
+    string : name
+        Name of the package (__name__ in its __init__ file).
+
+    variable : modules
+        Dictionary of the module names of the namespace and of their relative path.
+    """
+
+    package = lazyPackage(sys.modules[name], modules)
+    sys.modules[name] = package
+
+    return package
+
+def loaded(prefixes):
+    """
+    Return the modules imported in this process whose name starts with one of the given
+    prefixes (e.g. ['matplotlib', 'mpi4py']).
+
+    Parameters
+    ----------
+
+    variable : prefixes
+        List of module name prefixes.
+    """
+
+    found = []
+    for name, module in sys.modules.items():
+        if module is None:
+            continue
+        for prefix in prefixes:
+            if name == prefix or name.startswith(prefix+'.'):
+                found.append(name)
+                break
+
+    return sorted(found)
@@ -9,109 +9,110 @@
 """
    pyReefCore Model main entry file.
 """
+import os
 import time
 import numpy as np
-import mpi4py.MPI as mpi
-from scipy import linalg, mat, dot
 import operator
+from decimal import Decimal
 
-from pyReefCore import (preProc, xmlParser, enviForce, coralGLV, coreData, modelPlot)
+from pyReefCore import (preProc, xmlParser, enviForce, coralGLV, coreData, modelPlot, phaseCounters)
 
-# profiling support
-import cProfile
-import os
-import pstats
-import StringIO
+# Backends of the carbonate time loop: odespy RKF45 solver. The compiled forward kernel
+# is only selectable by its validation runs until it has been checked against odespy
+backends = ['odespy']
+unvalidated = ['kernel']
 
-class Model(object):
-    """State object for the pyReef model."""
+def check_backend(backend, check=False):
+    """
+    Raise ValueError if the backend of the carbonate time loop is unknown, or if it has not
+    been validated against odespy and check is False.
+    """
+
+    if backend in backends or (check and backend in unvalidated):
+        return
+    if backend in unvalidated:
+        raise ValueError('The %s backend has not been validated against odespy, it can only '
+                         'be selected by its validation runs (MCMC_Sampling/kernel_check.py).' %backend)
+    raise ValueError('Unknown backend %s, use one of %s.' %(backend, ', '.join(backends)))
+
+def apply_fidelity(input, tCarb=None, laytime=None):
+    """
+    Replace the carbonate time step and the stratigraphic layer interval of an input
+    parameter class (xmlParser), checking that the time structure remains consistent.
+    """
+
+    if tCarb is not None:
+        input.tCarb = float(tCarb)
+    if laytime is not None:
+        input.laytime = float(laytime)
+    if Decimal(input.laytime) % Decimal(input.tCarb) != 0.:
+        raise ValueError('Error in the fidelity definition: stratal layer interval needs to be an exact multiple of the carbonate interval!')
+    if Decimal(input.tEnd-input.tStart) % Decimal(input.laytime) != 0.:
+        raise ValueError('Error in the fidelity definition: layer time interval needs to be an exact multiple of the simulation time interval!')
+
+    return
+
+class SimulationState(object):
+    """
+    Explicit state of a pyReefCore simulation: simulation time, carbonate iteration and
+    stratigraphic layer indices, forcing, core, coral population and plotting objects.
+    Model keeps its state in these attributes while forward.simulate builds a new state for
+    each parameter vector.
+    """
 
-    def __init__(self):
+    def __init__(self, counters=None):
         """
         Constructor.
+
+        Parameters
+        ----------
+
+        variable : counters
+            Phase counters of the simulation, a new phaseCounters instance if None.
         """
-        # Simulation state
+
         self.dt = 0.
         self.tNow = 0.
-        self.tDisp = 0.
-        self.waveID = 0
-        self.outputStep = 0
-        self.applyDisp = False
-        self.simStarted = False
+        self.tCoral = 0.
+        self.tLayer = 0.
+        self.iter = 0
+        self.layID = 0
+        self.input = None
+        self.force = None
+        self.core = None
+        self.coral = None
+        self.plot = None
+        self.odeRKF = None
+        self.backend = 'odespy'
+        if counters is None:
+            counters = phaseCounters.phaseCounters()
+        self.counters = counters
 
-        self.dispRate = None
+        return
 
-        self._rank = mpi.COMM_WORLD.rank
-        self._size = mpi.COMM_WORLD.size
-        self._comm = mpi.COMM_WORLD
+    def setup(self, input):
+        """
+        Initialise the time structure, forcing, core and plotting objects of a simulation.
 
-        # Initialise pre-processing functions
-        self.enviforcing = preProc.preProc()
-        # Optimised parameters
-        self.opt_Sed = []
-        self.opt_Flow = []
-        self.opt_malthusParam = []
-        self.opt_cMatrix = []
-        self.initial_sed = []
-        self.initial_flow = []
+        Parameters
+        ----------
 
-    def load_xml(self, filename, sedsim, flowsim, verbose=False):
-        """
-        Load an XML configuration file.
+        class : input
+            Input parameter class (xmlParser) of the simulation, the forcing may update it.
         """
 
-        # Only the first node should create a unique output dir
-        self.input = xmlParser.xmlParser(filename, makeUniqueOutputDir=(self._rank == 0))
-        self.tNow = self.input.tStart
+        self.input = input
+        self.tNow = input.tStart
         self.tCoral = self.tNow
-        self.tLayer = self.tNow + self.input.laytime
-
-        # Reassign .xml input parameters with input vector values
-        self.initial_sed = self.input.__dict__["enviSed"]
-        self.initial_flow = self.input.__dict__["enviFlow"]
-
-        if (sedsim == True) or (flowsim == True):
-            if (sedsim == True) and (flowsim == False):
-                self.input.__dict__["enviSed"] = self.opt_Sed
-                # envsd = self.input.__dict__["enviSed"]
-                # print 'Sediment Function:', envsd
-                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
-                self.input.__dict__["malthusParam"] = self.opt_malthusParam
-            elif (flowsim == True) and (sedsim == False):
-                self.input.__dict__["enviFlow"] = self.opt_Flow
-                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
-                self.input.__dict__["malthusParam"] = self.opt_malthusParam
-            elif (sedsim == True) and (flowsim == True):
-                self.input.__dict__["enviSed"] = self.opt_Sed
-                envsd = self.input.__dict__["enviSed"]
-                self.input.__dict__["enviFlow"] = self.opt_Flow
-                envwf = self.input.__dict__["enviFlow"]
-                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
-                self.input.__dict__["malthusParam"] = self.opt_malthusParam
-            cmmat= self.input.__dict__["communityMatrix"]
-            mtpar= self.input.__dict__["malthusParam"]
-
-        else:
-            self.input.__dict__["communityMatrix"] = self.opt_cMatrix
-            self.input.__dict__["malthusParam"] = self.opt_malthusParam
-
-           
-        # Seed the random number generator consistently on all nodes
-        seed = None
-        if self._rank == 0:
-            # limit to max uint32
-            seed = np.random.mtrand.RandomState().tomaxint() % 0xFFFFFFFF
-        seed = self._comm.bcast(seed, root=0)
-        np.random.seed(seed)
+        self.tLayer = self.tNow + input.laytime
         self.iter = 0
         self.layID = 0
 
         # Initialise environmental forcing conditions
-        self.force = enviForce.enviForce(input=self.input)
-        # print 'self_dict_force', self.force.__dict__.keys()
+        self.force = enviForce.enviForce(input=input)
 
         # Initialise core data
-        self.core = coreData.coreData(input=self.input)
+        self.core = coreData.coreData(input=input)
 
         # Environmental forces functions
         self.core.seatime = self.force.seatime
@@ -126,44 +127,54 @@ class Model(object):
         self.core.flowfcty = self.force.plotflowx
 
         # Initialise plotting functions
-        self.plot = modelPlot.modelPlot(input=self.input)
+        self.plot = modelPlot.modelPlot(input=input)
+        self.plot.counters = self.counters
 
-        return self.initial_sed, self.initial_flow
+        return
 
-    def run_to_time(self, tEnd, showtime=10, profile=False, verbose=False):
+    def start(self, profile=None, rtol=None, atol=None):
         """
-        Run the simulation to a specified point in time (tEnd).
-
-        If profile is True, dump cProfile output to /tmp.
+        Initialise the Generalized Lotka-Volterra equation solver. The profile overrides
+        the one of the input file, the tolerances given here or in the input file take
+        precedence over the profile.
         """
 
-        timeVerbose = self.tNow+showtime
+        self.coral = coralGLV.coralGLV(input=self.input)
+        if profile is not None:
+            self.coral.set_profile(profile)
+            self.coral.set_tolerances(self.input.rtol, self.input.atol)
+        self.coral.set_tolerances(rtol, atol)
 
-        if profile:
-            pid = os.getpid()
-            pr = cProfile.Profile()
-            pr.enable()
+        return
 
-        if self._rank == 0:
-            print 'tNow = %s [yr]' %self.tNow
+    def advance(self, tEnd, N):
+        """
+        Run the simulation loop to tEnd.
 
-        if tEnd > self.input.tEnd:
-            tEnd = self.input.tEnd
-            print 'Requested time is set to the simulation end time as defined in the XmL input file'
+        Parameters
+        ----------
 
-        if self.tNow == self.input.tStart:
-            # Initialise Generalized Lotka-Volterra equation
-            self.coral = coralGLV.coralGLV(input=self.input)
+        float : tEnd
+            Simulation time to reach.
 
-        # Perform main simulation loop
-        # NOTE: number of iteration for the ODE during a given time step, could be user defined...
-        N = 100
+        integer : N
+            Number of ODE steps of each carbonate time interval.
+        """
+
+        if self.backend == 'kernel':
+            from pyReefCore.simulation import forwardKernel
+            forwardKernel.advance(self, tEnd, N)
+            return
 
         # Define environmental factors
         dfac = np.ones(self.input.speciesNb,dtype=float)
         sfac = np.ones(self.input.speciesNb,dtype=float)
         ffac = np.ones(self.input.speciesNb,dtype=float)
         while self.tNow < tEnd:
+            if self.coral.deadline is not None and time.time() > self.coral.deadline:
+                self.counters.add('aborted', 1)
+                raise coralGLV.budgetExceeded('Simulation exceeded its time budget at %s [yr].' %self.tNow)
+
             # Initial coral population
             if self.tNow == self.input.tStart:
                 self.coral.population[:,self.iter] = self.input.speciesPopulation
@@ -173,8 +184,10 @@ class Model(object):
 
             # Get sea-level
             if self.input.seaOn:
+                t0 = time.time()
                 tmp = self.core.topH
                 self.core.topH, dfac = self.force.getSea(self.tNow, tmp)
+                self.counters.add('sea_time', time.time()-t0)
                 if self.tNow == self.input.tStart:
                     self.core.sealevel[self.layID] = self.force.sealevel
                 else:
@@ -182,14 +195,18 @@ class Model(object):
 
             # Get sediment input
             if self.input.sedOn:
+                t0 = time.time()
                 sedh, sfac = self.force.getSed(self.tNow, self.core.topH)
+                self.counters.add('sed_time', time.time()-t0)
                 self.core.sedinput[self.layID] = self.force.sedlevel
             else:
                 sedh = 0.
 
             # Get flow velocity
             if self.input.flowOn:
+                t0 = time.time()
                 ffac = self.force.getFlow(self.tNow, self.core.topH)
+                self.counters.add('flow_time', time.time()-t0)
                 self.core.waterflow[self.layID] = self.force.flowlevel
 
             # Limit species activity from environmental forces
@@ -207,7 +224,16 @@ class Model(object):
             self.dt = tODE[1]-tODE[0]
 
             # Solve the Generalized Lotka-Volterra equation
-            coral,t = self.odeRKF.solve(tODE)
+            t0 = time.time()
+            nrhs = self.coral.nrhs
+            try:
+                coral,t = self.odeRKF.solve(tODE)
+            except coralGLV.budgetExceeded:
+                self.counters.add('aborted', 1)
+                raise
+            self.counters.add('ode_time', time.time()-t0)
+            # RKF steps taken by odespy: six right-hand side evaluations per step
+            self.counters.add('ode_steps', (self.coral.nrhs-nrhs)//6)
             population = coral.T
             tmppop = np.copy(population[:,-1])
             # maxpop
@@ -229,8 +255,10 @@ class Model(object):
                 self.coral.population[:self.input.speciesNb,self.iter] = 0.
 
             # Compute carbonate production and update coral core characteristics
+            t0 = time.time()
             self.core.coralProduction(self.layID, self.coral.population[:,self.iter],
                                       self.coral.epsilon, sedh)
+            self.counters.add('production_time', time.time()-t0)
             # Update time step
             self.tNow = self.tCoral
 
@@ -239,11 +267,13 @@ class Model(object):
                 self.tLayer += self.input.laytime
                 self.layID += 1
 
-            if self._rank == 0 and self.tNow>=timeVerbose:
-                timeVerbose = self.tNow+showtime
-                # print 'tNow = %s [yr]' %self.tNow
+        return
+
+    def collect(self):
+        """
+        Copy the simulation results to the plotting object.
+        """
 
-        # Update plotting parameters
         self.plot.pop = self.coral.population
         self.plot.timeCarb = self.coral.iterationTime
         self.plot.depth = self.core.thickness
@@ -257,6 +287,226 @@ class Model(object):
 
         return
 
+class Model(SimulationState):
+    """State object for the pyReef model."""
+
+    def __init__(self, distributed=False):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+
+        boolean : distributed
+            Run on the MPI communicator (mpi4py is then imported and initialised), a
+            single process is assumed otherwise.
+        """
+        # Simulation state
+        SimulationState.__init__(self)
+        self.tDisp = 0.
+        self.waveID = 0
+        self.outputStep = 0
+        self.applyDisp = False
+        self.simStarted = False
+
+        self.dispRate = None
+
+        if distributed:
+            import mpi4py.MPI as mpi
+            self._rank = mpi.COMM_WORLD.rank
+            self._size = mpi.COMM_WORLD.size
+            self._comm = mpi.COMM_WORLD
+        else:
+            self._rank = 0
+            self._size = 1
+            self._comm = None
+
+        # Initialise pre-processing functions
+        self.enviforcing = preProc.preProc()
+        # Optimised parameters
+        self.opt_Sed = []
+        self.opt_Flow = []
+        self.opt_malthusParam = []
+        self.opt_cMatrix = []
+        self.initial_sed = []
+        self.initial_flow = []
+        # Optional fidelity overrides of the XmL time structure and RKF tolerances
+        self.opt_tCarb = None
+        self.opt_laytime = None
+        self.opt_rtol = None
+        self.opt_atol = None
+        self.opt_odeSteps = None
+        self.opt_profile = None
+        # Optional budget of a single run: wall-clock time and GLV right-hand side evaluations
+        self.opt_maxTime = None
+        self.opt_maxRHS = None
+
+    def get_counters(self, total=False):
+        """
+        Return the phase counters (ODE intervals, RHS calls and time spent in each phase) of
+        the last run, or accumulated across runs if total is True.
+        """
+
+        if total:
+            return self.counters.total()
+
+        return self.counters.run()
+
+    def set_fidelity(self, tCarb=None, laytime=None, rtol=None, atol=None, odeSteps=None,
+                     profile=None):
+        """
+        Override the carbonate time step, the stratigraphic layer interval, the RKF
+        tolerances and the number of ODE steps per carbonate interval defined in the XmL
+        input file. The profile (strict, default or fast) selects the tolerances of a
+        coralGLV accuracy profile, explicit rtol and atol values take precedence. Values
+        left to None are read from the XmL file (and coralGLV defaults) as usual.
+        """
+
+        if profile is not None and profile not in coralGLV.profiles:
+            raise ValueError('Unknown solver profile %s.' %profile)
+
+        self.opt_tCarb = tCarb
+        self.opt_laytime = laytime
+        self.opt_rtol = rtol
+        self.opt_atol = atol
+        self.opt_odeSteps = odeSteps
+        self.opt_profile = profile
+
+        return
+
+    def set_backend(self, backend='odespy', check=False):
+        """
+        Select the backend of the carbonate time loop: odespy (RKF45 solver of the odespy
+        library). The forward kernel (forwardKernel, compiled with numba when it is
+        installed) has not been validated against odespy and is only accepted with check
+        set to True, for the runs comparing it to odespy.
+        """
+
+        check_backend(backend, check)
+        self.backend = backend
+
+        return
+
+    def set_budget(self, maxTime=None, maxRHS=None):
+        """
+        Limit the wall-clock time (in seconds) and the number of GLV right-hand side
+        evaluations of each call to run_to_time. A run exceeding its budget raises
+        coralGLV.budgetExceeded. Values left to None are not limited.
+        """
+
+        self.opt_maxTime = maxTime
+        self.opt_maxRHS = maxRHS
+
+        return
+
+    def load_xml(self, filename, sedsim, flowsim, verbose=False):
+        """
+        Load an XML configuration file.
+        """
+
+        t0 = time.time()
+        self.counters.start_run()
+
+        # Only the first node should create a unique output dir
+        self.input = xmlParser.xmlParser(filename, makeUniqueOutputDir=(self._rank == 0))
+        if self.opt_tCarb is not None or self.opt_laytime is not None:
+            self._apply_fidelity()
+
+        # Reassign .xml input parameters with input vector values
+        self.initial_sed = self.input.__dict__["enviSed"]
+        self.initial_flow = self.input.__dict__["enviFlow"]
+
+        if (sedsim == True) or (flowsim == True):
+            if (sedsim == True) and (flowsim == False):
+                self.input.__dict__["enviSed"] = self.opt_Sed
+                # envsd = self.input.__dict__["enviSed"]
+                # print 'Sediment Function:', envsd
+                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
+                self.input.__dict__["malthusParam"] = self.opt_malthusParam
+            elif (flowsim == True) and (sedsim == False):
+                self.input.__dict__["enviFlow"] = self.opt_Flow
+                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
+                self.input.__dict__["malthusParam"] = self.opt_malthusParam
+            elif (sedsim == True) and (flowsim == True):
+                self.input.__dict__["enviSed"] = self.opt_Sed
+                envsd = self.input.__dict__["enviSed"]
+                self.input.__dict__["enviFlow"] = self.opt_Flow
+                envwf = self.input.__dict__["enviFlow"]
+                self.input.__dict__["communityMatrix"] = self.opt_cMatrix
+                self.input.__dict__["malthusParam"] = self.opt_malthusParam
+            cmmat= self.input.__dict__["communityMatrix"]
+            mtpar= self.input.__dict__["malthusParam"]
+
+        else:
+            self.input.__dict__["communityMatrix"] = self.opt_cMatrix
+            self.input.__dict__["malthusParam"] = self.opt_malthusParam
+
+           
+        self.setup(self.input)
+        self.counters.add('xml_time', time.time()-t0)
+
+        return self.initial_sed, self.initial_flow
+
+    def _apply_fidelity(self):
+        """
+        Replace the XmL time structure with the requested fidelity.
+        """
+
+        apply_fidelity(self.input, self.opt_tCarb, self.opt_laytime)
+
+        return
+
+    def run_to_time(self, tEnd, showtime=10, profile=False, verbose=False):
+        """
+        Run the simulation to a specified point in time (tEnd).
+
+        If profile is True, dump cProfile output to /tmp.
+        """
+
+        tRun = time.time()
+
+        if profile:
+            import cProfile
+            pid = os.getpid()
+            pr = cProfile.Profile()
+            pr.enable()
+
+        if self._rank == 0 and verbose:
+            print 'tNow = %s [yr]' %self.tNow
+
+        if tEnd > self.input.tEnd:
+            tEnd = self.input.tEnd
+            print 'Requested time is set to the simulation end time as defined in the XmL input file'
+
+        if self.tNow == self.input.tStart:
+            # Initialise Generalized Lotka-Volterra equation
+            self.start(self.opt_profile, self.opt_rtol, self.opt_atol)
+        nrhs = self.coral.nrhs
+        self.coral.maxRHS = None
+        self.coral.deadline = None
+        if self.opt_maxRHS is not None:
+            self.coral.maxRHS = nrhs + self.opt_maxRHS
+        if self.opt_maxTime is not None:
+            self.coral.deadline = tRun + self.opt_maxTime
+
+        # Perform main simulation loop
+        # Number of iteration for the ODE during a given time step
+        N = 100
+        if self.opt_odeSteps is not None:
+            N = self.opt_odeSteps
+        elif self.input.odeSteps is not None:
+            N = self.input.odeSteps
+
+        self.advance(tEnd, N)
+
+        # Update plotting parameters
+        self.collect()
+
+        self.counters.add('rhs_calls', self.coral.nrhs-nrhs)
+        self.counters.add('run_time', time.time()-tRun)
+
+        return
+
     def ncpus(self):
         """
         Return the number of CPUs used to generate the results.
@@ -328,11 +578,12 @@ class Model(object):
         optCM = self.opt_cMatrix
         optMP = self.opt_malthusParam
 
-        print 'New parameters:'
-        # print '\t Sed:\n', opts
-        # print '\t Flow:\n', optf
-        print '\t Matrix main:', x, 'and sub-/super:', y
-        print '\t Malthus.:', tempParam
+        if verbose:
+            print 'New parameters:'
+            # print '\t Sed:\n', opts
+            # print '\t Flow:\n', optf
+            print '\t Matrix main:', x, 'and sub-/super:', y
+            print '\t Malthus.:', tempParam
         
         return
 
@@ -389,11 +640,12 @@ class Model(object):
         optCM = self.opt_cMatrix
         optMP = self.opt_malthusParam
 
-        print 'New parameters:'
-        # print '\t Sed:\n', opts
-        # print '\t Flow:\n', optf
-        print '\t Matrix main:', x, 'and sub-/super:', y
-        print '\t Malthus.:', tempParam
+        if verbose:
+            print 'New parameters:'
+            # print '\t Sed:\n', opts
+            # print '\t Flow:\n', optf
+            print '\t Matrix main:', x, 'and sub-/super:', y
+            print '\t Malthus.:', tempParam
         
         return
 
@@ -1,76 +1,423 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   Local pool of persistent pyReefCore worker processes.
+"""
 import os
+import time
+import Queue
+import select
+import threading
+import traceback
+import multiprocessing
 
-from ipyparallel import Client
+import numpy as np
 
+from pyReefCore.forcing import sharedTables
+
+class RemoteError(RuntimeError):
+    """Forward model evaluation failed in a worker process."""
+    pass
+
+class RemoteTimeout(RemoteError):
+    """Forward model evaluation exceeded the time limit."""
+    pass
 
 def relog():
-    ''' For debugging, redirect the individual node stdout/stderr to a file '''
-    import os
+    ''' For debugging, redirect the individual worker stdout/stderr to a file '''
+    import sys
     pid = os.getpid()
     logfile = open('/tmp/model-%s.txt' % pid, 'w')
     logfile.write('--- I am PID %s\n' % pid)
 
-    import sys
     sys.stdout = logfile
     sys.stderr = logfile
 
+def _serve(conn, setup, tables, debug):
+    """
+    Worker loop: attach the shared tables and parse the XmL input once, then run the
+    parameter vectors received on the pipe and send back the predicted cores. Each run only
+    builds the parameter dependent simulation state (forward.simulate).
+    """
+
+    if debug:
+        relog()
+    sharedTables.attach(tables)
+
+    from pyReefCore.forward import SimulationConfig, simulate
+    from pyReefCore.simulation.coralGLV import budgetExceeded
+
+    xmlinput, communities, core_depths, simtime, sedsim, flowsim, level, maxRHS = setup
+    if sharedTables.lookup('core_depths') is not None:
+        core_depths = sharedTables.lookup('core_depths')
+    config = SimulationConfig(xmlinput, communities, core_depths, simtime, sedsim, flowsim,
+                              level)
+    config.set_budget(maxRHS=maxRHS)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        jobid, v = job
+        try:
+            core = simulate(config, v).core
+            conn.send((jobid, True, np.asarray(core, dtype=np.float32)))
+        except budgetExceeded, e:
+            conn.send((jobid, None, str(e)))
+        except Exception:
+            conn.send((jobid, False, traceback.format_exc()))
+
+    conn.close()
+
+    return
 
 class RemoteModel(object):
     """
-    Wrapper to allow Model to run on an MPI cluster while hiding most of the
-    MPI details.
+    Pool of local worker processes running pyReefCore forward models.
+
+    Each worker holds the parsed configuration of one XmL input file (forward.
+    SimulationConfig) and receives parameter vectors, returning the predicted core
+    (proportions of each community and of the sediment at the core depths, as returned by
+    modelPlot.core_timetodepth) in single precision. Failed runs raise RemoteError with the
+    worker traceback and runs exceeding the time limit raise RemoteTimeout; the faulty
+    worker is then replaced so the pool stays usable. The pool can be shared by several
+    threads: the runs of concurrent imap and map calls are dispatched on the idle workers
+    in the order they were submitted.
+
+    Parameters
+    ----------
+    string : xmlinput
+        XmL input file of the model.
+
+    integer : communities
+        Number of communities.
+
+    variable : core_depths
+        Depths of the core data.
 
-    The public interface is identical to Model, so you should be able to
-    substitute one for the other as desired..
+    float : simtime
+        Simulation end time.
 
-    We use MPI in a master-slave architecture. This object runs on the master
-    and handles all communication with the slaves. The slaves run the native
-    Model object. In this way, the calling code does not need to be aware of the
-    underlying parallelisation details.
+    boolean : sedsim, flowsim
+        Sediment and flow parameters are part of the parameter vector.
+
+    integer : nworkers
+        Number of worker processes, defaults to the number of CPUs.
+
+    float : timeout
+        Maximum time in seconds of one forward run, None for no limit.
+
+    variable : level
+        Optional fidelityLevels.fidelityLevel applied to the worker models.
+
+    integer : maxRHS
+        Maximum number of GLV right-hand side evaluations of one forward run, runs
+        exceeding it raise RemoteTimeout.
+
+    boolean : share
+        Share the read-only tables (forcing curves, depth production curves and core
+        depths) with the workers through memory mapped files instead of building them in
+        each worker.
+
+    boolean : debug
+        Redirect the worker outputs to /tmp/model-<pid>.txt.
     """
 
-    # These attributes are exposed on the RemoteModel object; any other
-    # accesses are forwarded to the Model objects running on the remote nodes.
-    REMOTEMODEL_ATTRIBUTES = ('_client', '_view')
+    def __init__(self, xmlinput, communities, core_depths, simtime, sedsim=True, flowsim=True,
+                 nworkers=None, timeout=None, level=None, maxRHS=None, share=True, debug=False):
+        """
+        Constructor.
+        """
+
+        if nworkers is None:
+            nworkers = multiprocessing.cpu_count()
+
+        self._setup = (xmlinput, communities, np.array(core_depths), simtime, sedsim, flowsim, level,
+                       maxRHS)
+        self._debug = debug
+        self.timeout = timeout
+        self.nworkers = nworkers
+        self.nruns = 0
+        self.nfailed = 0
+        self.ntimeout = 0
+
+        # Jobs waiting for a worker, workers running a job and batches of the running
+        # imap calls; one caller at a time waits on the workers and routes the answers
+        self._cond = threading.Condition()
+        self._pending = []
+        self._busy = {}
+        self._batches = set()
+        self._polling = False
+        self._wake = os.pipe()
 
-    def __init__(self, profile='mpi'):
-        self._client = Client(profile=profile)
-        self._view = self._client[:]
-        self._view.block = True
+        self.tables = None
+        if share:
+            self.tables = sharedTables.sharedTables()
+            self.tables.add_model(xmlinput)
+            self.tables.add('core_depths', np.asarray(core_depths, dtype=float))
 
-        self._view.execute('from pyReef.Model.model import Model')
-        self._view.execute('model = Model()')
+        self._workers = []
+        for w in range(nworkers):
+            self._workers.append(self._spawn())
 
-        # Uncomment this to enable node debug logging to /tmp
-        # self._view.apply(relog)
+        return
+
+    def _spawn(self):
+        """
+        Start a worker process and return its process and pipe.
+        """
+
+        conn, child = multiprocessing.Pipe()
+        tables = {}
+        if self.tables is not None:
+            tables = self.tables.paths
+        process = multiprocessing.Process(target=_serve, args=(child, self._setup, tables, self._debug))
+        process.daemon = True
+        process.start()
+        child.close()
+
+        return [process, conn]
+
+    def _replace(self, w):
+        """
+        Kill a worker process and start a new one in its place.
+        """
+
+        process, conn = self._workers[w]
+        conn.close()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        self._workers[w] = self._spawn()
+
+        return
+
+    def ncpus(self):
+        """Return the number of worker processes."""
 
-    def load_xml(self, filename, verbose=False):
+        return len(self._workers)
+
+    def run(self, input_vector):
+        """
+        Run the forward model for one parameter vector and return the predicted core.
+
+        Parameters
+        ----------
+
+        variable : input_vector
+            Parameter vector.
+        """
+
+        return self.map([input_vector])[0]
+
+    def imap(self, vectors):
+        """
+        Run the forward model for a list of parameter vectors on the worker processes and
+        yield (index, core) pairs as soon as each run completes. Failed runs yield a
+        RemoteError instance in place of the core.
+
+        Parameters
+        ----------
+
+        variable : vectors
+            Parameter vectors.
+        """
+
+        if self._workers is None:
+            raise RemoteError('The worker pool is closed.')
+
+        batch = Queue.Queue()
+        with self._cond:
+            self._batches.add(batch)
+            for jobid in range(len(vectors)):
+                self._pending.append((batch, jobid, np.asarray(vectors[jobid], dtype=float)))
+            os.write(self._wake[1], '.')
+
+        count = 0
         try:
-            cwd = os.getcwd()
-            self._view.execute('import os')
-            self._view.execute('os.chdir("%s")' % cwd)
-            self._view.execute('model.load_xml(filename="%s", verbose=%s)' % (filename, verbose))
-        except Exception, e:
-            import pdb; pdb.set_trace()
-
-    def run_to_time(self, tEnd):
+            while count < len(vectors):
+                try:
+                    jobid, result = batch.get_nowait()
+                except Queue.Empty:
+                    self._poll(batch)
+                    continue
+                count += 1
+                yield jobid, result
+        finally:
+            with self._cond:
+                self._batches.discard(batch)
+                self._pending = [job for job in self._pending if job[0] is not batch]
+                # Workers still running jobs of an abandoned iteration are restarted when no
+                # other caller waits on them, otherwise their late answers are dropped
+                if not self._polling:
+                    for w in list(self._busy.keys()):
+                        if self._busy[w][0] is batch:
+                            del self._busy[w]
+                            self._replace(w)
+
+    def _dispatch(self):
+        """
+        Send the pending jobs to the idle workers.
+        """
+
+        for w in range(len(self._workers)):
+            if w in self._busy or len(self._pending) == 0:
+                continue
+            batch, jobid, v = self._pending.pop(0)
+            self._busy[w] = (batch, jobid, time.time())
+            try:
+                self._workers[w][1].send((jobid, v))
+            except (IOError, OSError):
+                self._replace(w)
+                try:
+                    self._workers[w][1].send((jobid, v))
+                except (IOError, OSError):
+                    self.nfailed += 1
+                    self._answer(w, RemoteError('Worker process could not receive the job.'))
+
+        return
+
+    def _answer(self, w, result):
+        """
+        Free a worker and route the result of its job to the batch of the job.
+        """
+
+        batch, jobid, start = self._busy.pop(w)
+        self.nruns += 1
+        if batch in self._batches:
+            batch.put((jobid, result))
+
+        return
+
+    def _poll(self, batch):
+        """
+        Dispatch the pending jobs and wait for a worker to answer, or wait for the caller
+        currently polling the workers when there is one.
+
+        Parameters
+        ----------
+
+        variable : batch
+            Result queue of the calling imap.
+        """
+
+        with self._cond:
+            if not batch.empty():
+                return
+            if self._polling:
+                self._cond.wait(1.)
+                return
+            self._polling = True
+
         try:
-            self._view.execute('model.run_to_time(%s)' % tEnd)
-        except Exception, e:
-            import pdb; pdb.set_trace()
+            with self._cond:
+                self._dispatch()
+                busy = dict(self._busy)
 
-    def ncpus(self):
-        """Return the number of CPUs used to generate the results."""
-        return len(self._view)
+            # Wait for a worker to answer, for new jobs or for the next time limit
+            wait = None
+            if self.timeout is not None and len(busy) > 0:
+                first = min([start for b, jobid, start in busy.values()])
+                wait = max(0., first + self.timeout - time.time())
+            conns = dict([(self._workers[w][1].fileno(), w) for w in busy])
+            ready = select.select(list(conns.keys()) + [self._wake[0]], [], [], wait)[0]
+
+            with self._cond:
+                for fd in ready:
+                    if fd == self._wake[0]:
+                        os.read(self._wake[0], 4096)
+                        continue
+                    w = conns[fd]
+                    try:
+                        answer, ok, output = self._workers[w][1].recv()
+                    except (EOFError, IOError):
+                        ok, output = False, 'Worker process exited unexpectedly.'
+                        self._replace(w)
+                    if ok:
+                        self._answer(w, np.asarray(output, dtype=float))
+                    elif ok is None:
+                        self.ntimeout += 1
+                        self._answer(w, RemoteTimeout(output))
+                    else:
+                        self.nfailed += 1
+                        self._answer(w, RemoteError(output))
+
+                if self.timeout is not None:
+                    now = time.time()
+                    for w in list(self._busy.keys()):
+                        if now - self._busy[w][2] >= self.timeout:
+                            self._replace(w)
+                            self.ntimeout += 1
+                            self._answer(w, RemoteTimeout('Forward model exceeded %g s.' % self.timeout))
+        finally:
+            with self._cond:
+                self._polling = False
+                self._cond.notify_all()
+
+        return
+
+    def map(self, vectors, errors='raise'):
+        """
+        Run the forward model for a list of parameter vectors on the worker processes and
+        return the predicted cores in the same order.
+
+        Parameters
+        ----------
+
+        variable : vectors
+            Parameter vectors.
+
+        string : errors
+            'raise' to raise the first RemoteError, 'return' to return the RemoteError
+            instances in place of the failed cores.
+        """
+
+        results = [None] * len(vectors)
+        for jobid, result in self.imap(vectors):
+            results[jobid] = result
+
+        if errors == 'raise':
+            for result in results:
+                if isinstance(result, RemoteError):
+                    raise result
+
+        return results
+
+    def close(self):
+        """Stop the worker processes."""
+
+        if self._workers is None:
+            return
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+            conn.close()
+        for process, conn in self._workers:
+            process.join(1.)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._workers = None
+        for fd in self._wake:
+            os.close(fd)
+        if self.tables is not None:
+            self.tables.close()
 
-    def __getattr__(self, name):
-        """If we don't define an attribute locally, read its value from node 0"""
-        return self._client[0]['model.%s' % name]
+        return
 
-    def __setattr__(self, name, value):
-        """If we don't define an attribute locally, write its value to all nodes"""
+    def __enter__(self):
+        return self
 
-        if name in RemoteModel.REMOTEMODEL_ATTRIBUTES:
-            self.__dict__[name] = value
-        else:
-            self._view['model.%s' % name] = value
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -0,0 +1,26 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+   Implementation relating to BayesReef sampling kernels and executors.
+"""
+
+from ..lazyImport import install
+
+install(__name__, {
+    'speculativeMH': '.speculativeMH',
+    'delayedAcceptance': '.delayedAcceptance',
+    'surrogateGP': '.surrogateGP',
+    'likelihoodGrid': '.likelihoodGrid',
+    'adaptiveSurface': '.adaptiveSurface',
+    'telemetry': '.telemetry',
+    'chainStore': '.chainStore',
+    'predictiveSummary': '.predictiveSummary',
+    'figureReport': '.figureReport',
+    'snapshotWriter': '.snapshotWriter',
+})
@@ -0,0 +1,250 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements an adaptive (quadtree) likelihood surface mapper. The surface is
+first evaluated on a coarse grid and the cells where the log-likelihood is poorly
+approximated by bilinear interpolation or is close to its maximum are recursively split
+in four. Points are stored with likelihoodGrid on the lattice of the finest level, so
+runs are parallel and resumable.
+"""
+import numpy
+
+import likelihoodGrid
+
+class adaptiveSurface:
+    """
+    This class maps a two-dimensional likelihood surface with quadtree refinement.
+
+    A leaf cell is split while it is larger than one lattice spacing and either its
+    hierarchical surplus exceeds tol times the range of the surface, or its largest
+    corner value lies within band times the range of the surface from the maximum. The
+    surplus of a cell is the largest difference, at the points added when its parent was
+    split, between the log-likelihood and the bilinear interpolation of the parent
+    corners. Cells of the initial grid are always split once and cells with only some
+    corners finite (edge of the feasible region) are always split.
+
+    Parameters
+    ----------
+    function : likelihood
+        Function returning the log-likelihood of a parameter vector, or a sequence
+        starting with it.
+
+    variable : base
+        Full parameter vector used for the parameters which are not varied.
+
+    variable : indices
+        Positions in the parameter vector of the two varied parameters.
+
+    variable : bounds
+        Minimum and maximum values of the two varied parameters.
+
+    string : store
+        Name of the text file where the results are stored.
+
+    integer : level0
+        Level of the initial grid (2^level0 cells along each axis).
+
+    integer : levels
+        Finest level (2^levels cells along each axis).
+
+    float : tol
+        Surplus, as a fraction of the surface range, above which a cell is split.
+
+    float : band
+        Distance to the maximum, as a fraction of the surface range, below which a cell
+        is split.
+
+    integer : nworkers
+        Number of worker processes, evaluation is serial if set to 1.
+    """
+
+    def __init__(self, likelihood, base, indices, bounds, store, level0=2, levels=6,
+                 tol=0.02, band=0.05, nworkers=None):
+        """
+        Constructor.
+        """
+
+        if len(indices) != 2 or len(bounds) != 2:
+            raise ValueError('Adaptive surfaces are defined for two varied parameters.')
+        if level0 > levels:
+            raise ValueError('Initial level needs to be lower than the finest level.')
+
+        self.level0 = level0
+        self.levels = levels
+        self.tol = tol
+        self.band = band
+        self.n = 2**levels + 1
+        axes = [numpy.linspace(b[0], b[1], self.n) for b in bounds]
+        self.grid = likelihoodGrid.likelihoodGrid(likelihood, base, indices, axes, store,
+                                                  nworkers=nworkers)
+        self.axes = self.grid.axes
+
+        # Leaf cells: lattice indices of the lower corner and size in lattice spacings
+        self.cells = []
+        self.surplus = {}
+
+        return
+
+    def _corners(self, cell):
+
+        i, j, h = cell
+
+        return [(i,j), (i+h,j), (i,j+h), (i+h,j+h)]
+
+    def _split(self, cell):
+
+        i, j, h = cell
+        h = h//2
+
+        return [(i,j,h), (i+h,j,h), (i,j+h,h), (i+h,j+h,h)]
+
+    def _surplus(self, cell):
+        """
+        Largest difference between the log-likelihood and the bilinear interpolation of
+        the cell corners at the centre and edge midpoints of the cell.
+        """
+
+        i, j, h = cell
+        z = [self.grid.results[key][0] for key in self._corners(cell)]
+        h = h//2
+        mids = [((i+h,j), 0.5*(z[0]+z[1])), ((i,j+h), 0.5*(z[0]+z[2])),
+                ((i+2*h,j+h), 0.5*(z[1]+z[3])), ((i+h,j+2*h), 0.5*(z[2]+z[3])),
+                ((i+h,j+h), 0.25*(z[0]+z[1]+z[2]+z[3]))]
+        err = [abs(self.grid.results[key][0] - value) for key, value in mids]
+
+        return max(err)
+
+    def _marked(self, cell, zmax, span):
+        """
+        Check if a leaf cell needs to be refined.
+        """
+
+        if cell[2] < 2:
+            return False
+
+        z = numpy.array([self.grid.results[key][0] for key in self._corners(cell)])
+        finite = numpy.isfinite(z)
+        if not finite.any():
+            return False
+        if not finite.all():
+            return True
+        surplus = self.surplus[cell]
+        if not (surplus <= self.tol*span):
+            return True
+
+        return z.max() >= zmax - self.band*span
+
+    def run(self, callback=None):
+        """
+        Evaluate and refine the surface.
+
+        Parameters
+        ----------
+
+        variable : callback
+            Optional function called as callback(key, values, done, total) after each
+            evaluation.
+        """
+
+        self.grid.load()
+        h = 2**(self.levels - self.level0)
+        self.cells = [(i, j, h) for i in range(0, self.n-1, h) for j in range(0, self.n-1, h)]
+        self.surplus = dict([(cell, numpy.inf) for cell in self.cells])
+        keys = set()
+        for cell in self.cells:
+            keys.update(self._corners(cell))
+        self.grid.evaluate(sorted(keys), callback)
+
+        while True:
+            z = numpy.array([values[0] for values in self.grid.results.values()])
+            z = z[numpy.isfinite(z)]
+            if len(z) == 0:
+                break
+            zmax = z.max()
+            span = zmax - z.min()
+
+            marked = [cell for cell in self.cells if self._marked(cell, zmax, span)]
+            if len(marked) == 0:
+                break
+            split = set(marked)
+            cells = [cell for cell in self.cells if cell not in split]
+            keys = set()
+            for cell in marked:
+                for child in self._split(cell):
+                    cells.append(child)
+                    keys.update(self._corners(child))
+            self.cells = cells
+            self.grid.evaluate(sorted(keys), callback)
+            for cell in marked:
+                surplus = self._surplus(cell)
+                del self.surplus[cell]
+                for child in self._split(cell):
+                    self.surplus[child] = surplus
+
+        return self.surface()
+
+    def evaluations(self):
+        """
+        Return the number of evaluated points and the number of points of the uniform
+        grid with the same resolution.
+        """
+
+        return len(self.grid.results), self.n**2
+
+    def surface(self, column=0):
+        """
+        Return the surface on the finest lattice. Points which have not been evaluated
+        are bilinearly interpolated from the corners of their leaf cell.
+
+        Parameters
+        ----------
+
+        variable : column
+            Index of the output in the stored values.
+        """
+
+        Z = self.grid.surface(column)
+        for i, j, h in self.cells:
+            z = [Z[key] for key in self._corners((i, j, h))]
+            t = numpy.arange(h+1, dtype=float)/h
+            fill = numpy.outer(1.-t, 1.-t)*z[0] + numpy.outer(t, 1.-t)*z[1] \
+                + numpy.outer(1.-t, t)*z[2] + numpy.outer(t, t)*z[3]
+            sub = Z[i:i+h+1, j:j+h+1]
+            mask = numpy.isnan(sub)
+            sub[mask] = fill[mask]
+
+        return Z
+
+    def save_surface(self, fname, column=0):
+        """
+        Write the X.txt, Y.txt and Z.txt files read by the likelihood surface plotting
+        scripts (X holds the second parameter and Y the first one) on the finest lattice,
+        and the evaluated points in points.txt.
+
+        Parameters
+        ----------
+
+        variable : fname
+            Output directory.
+
+        variable : column
+            Index of the output in the stored values.
+        """
+
+        X, Y = numpy.meshgrid(self.axes[1], self.axes[0])
+        numpy.savetxt('%s/X.txt' % fname, X)
+        numpy.savetxt('%s/Y.txt' % fname, Y)
+        numpy.savetxt('%s/Z.txt' % fname, self.surface(column))
+
+        keys = sorted(self.grid.results.keys())
+        points = numpy.array([[self.axes[0][k[0]], self.axes[1][k[1]], self.grid.results[k][column]]
+                              for k in keys])
+        numpy.savetxt('%s/points.txt' % fname, points)
+
+        return
@@ -0,0 +1,398 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements a run-length encoded Markov chain store. A rejected proposal
+repeats the current state, so the chain is recorded as (state, multiplicity) pairs and
+the posterior summaries are computed on the weighted unique states.
+"""
+import numpy
+
+def _percentile(values, counts, q):
+    """
+    Percentile of values repeated counts times, equal to numpy.percentile (linear
+    interpolation) of the expanded values.
+    """
+
+    order = numpy.argsort(values, kind='mergesort')
+    values = values[order]
+    cum = numpy.cumsum(counts[order])
+    pos = numpy.asarray(q, dtype=float)/100.*(cum[-1]-1)
+    lo = numpy.floor(pos)
+    vlo = values[numpy.searchsorted(cum, lo, side='right')]
+    vhi = values[numpy.searchsorted(cum, numpy.ceil(pos), side='right')]
+
+    return vlo + (pos-lo)*(vhi-vlo)
+
+class chainStore:
+    """
+    This class records a Markov chain as unique consecutive states with their
+    multiplicity, together with the uint8 codes of the predicted core of each state.
+
+    Parameters
+    ----------
+    integer : nparams
+        Number of parameters of a state.
+
+    integer : ncodes
+        Number of core codes recorded with each state (0 if none).
+
+    integer : capacity
+        Initial number of unique states allocated.
+    """
+
+    def __init__(self, nparams, ncodes=0, capacity=1024):
+        """
+        Constructor.
+        """
+
+        self.nparams = nparams
+        self.ncodes = ncodes
+        self._states = numpy.zeros((capacity, nparams))
+        self._codes = numpy.zeros((capacity, ncodes), dtype=numpy.uint8)
+        self._counts = numpy.zeros(capacity, dtype=numpy.int64)
+        self.nunique = 0
+        # Unique state index at which each merged chain starts
+        self.parts = [0]
+
+        return
+
+    def _grow(self):
+
+        capacity = 2*len(self._counts)
+        self._states = numpy.resize(self._states, (capacity, self.nparams))
+        self._codes = numpy.resize(self._codes, (capacity, self.ncodes))
+        self._counts = numpy.resize(self._counts, capacity)
+
+        return
+
+    @property
+    def states(self):
+        """Unique states."""
+        return self._states[:self.nunique]
+
+    @property
+    def codes(self):
+        """Core codes of the unique states."""
+        return self._codes[:self.nunique]
+
+    @property
+    def counts(self):
+        """Multiplicity of the unique states."""
+        return self._counts[:self.nunique]
+
+    @property
+    def nsteps(self):
+        """Number of steps of the chain."""
+        return int(self.counts.sum())
+
+    @property
+    def nbytes(self):
+        """Memory used by the recorded chain."""
+        return self.states.nbytes + self.codes.nbytes + self.counts.nbytes
+
+    def append(self, state, codes=None, count=1):
+        """
+        Record a new state (accepted proposal).
+
+        Parameters
+        ----------
+
+        variable : state
+            Parameter vector.
+
+        variable : codes
+            Core codes of the state.
+
+        variable : count
+            Multiplicity of the state.
+        """
+
+        if self.nunique == len(self._counts):
+            self._grow()
+        self._states[self.nunique] = state
+        if self.ncodes > 0:
+            self._codes[self.nunique] = codes
+        self._counts[self.nunique] = count
+        self.nunique += 1
+
+        return
+
+    def repeat(self, count=1):
+        """
+        Repeat the current state (rejected proposal).
+
+        Parameters
+        ----------
+
+        variable : count
+            Number of repetitions.
+        """
+
+        if self.nunique == 0:
+            raise ValueError('The chain has no state to repeat.')
+        self._counts[self.nunique-1] += count
+
+        return
+
+    def burn(self, nsteps):
+        """
+        Return a new store without the first steps of the chain.
+
+        Parameters
+        ----------
+
+        variable : nsteps
+            Number of burn-in steps.
+        """
+
+        cum = numpy.cumsum(self.counts)
+        first = numpy.searchsorted(cum, nsteps, side='right')
+        store = chainStore(self.nparams, self.ncodes, capacity=max(self.nunique-first, 1))
+        for i in range(first, self.nunique):
+            count = self.counts[i]
+            if i == first:
+                count = cum[i] - nsteps
+            store.append(self.states[i], self.codes[i], count)
+
+        return store
+
+    @staticmethod
+    def merge(stores):
+        """
+        Concatenate chains (e.g. the replicas of a parallel tempering run).
+
+        Parameters
+        ----------
+
+        variable : stores
+            List of chainStore instances.
+        """
+
+        total = sum([s.nunique for s in stores])
+        store = chainStore(stores[0].nparams, stores[0].ncodes, capacity=max(total, 1))
+        store.parts = []
+        for s in stores:
+            store.parts.append(store.nunique)
+            n = s.nunique
+            store._states[store.nunique:store.nunique+n] = s.states
+            store._codes[store.nunique:store.nunique+n] = s.codes
+            store._counts[store.nunique:store.nunique+n] = s.counts
+            store.nunique += n
+
+        return store
+
+    def part(self, k):
+        """
+        Return a merged chain as a new store.
+
+        Parameters
+        ----------
+
+        variable : k
+            Index of the chain in the merged stores.
+        """
+
+        bounds = self.parts + [self.nunique]
+        store = chainStore(self.nparams, self.ncodes, capacity=max(bounds[k+1]-bounds[k], 1))
+        for i in range(bounds[k], bounds[k+1]):
+            store.append(self.states[i], self.codes[i], self.counts[i])
+
+        return store
+
+    def expand(self, nsteps=None):
+        """
+        Return the full chain states and core codes (one row per step).
+
+        Parameters
+        ----------
+
+        variable : nsteps
+            Only expand the first steps of the chain.
+        """
+
+        n = self.nunique
+        if nsteps is not None:
+            n = min(numpy.searchsorted(numpy.cumsum(self.counts), nsteps) + 1, n)
+        states = numpy.repeat(self.states[:n], self.counts[:n], axis=0)[:nsteps]
+        codes = numpy.repeat(self.codes[:n], self.counts[:n], axis=0)[:nsteps]
+
+        return states, codes
+
+    def _values(self, codes):
+
+        if codes:
+            return self.codes.astype(float)
+
+        return self.states
+
+    def weights(self):
+        """Return the normalised weights of the unique states."""
+
+        return self.counts/float(self.nsteps)
+
+    def mean(self, codes=False):
+        """
+        Return the posterior mean of each parameter (or core code if codes is True).
+        """
+
+        return numpy.dot(self.weights(), self._values(codes))
+
+    def std(self, codes=False):
+        """
+        Return the posterior standard deviation of each parameter (or core code).
+        """
+
+        values = self._values(codes)
+        mean = numpy.dot(self.weights(), values)
+
+        return numpy.sqrt(numpy.dot(self.weights(), (values-mean)**2))
+
+    def percentile(self, q, codes=False):
+        """
+        Return the posterior percentiles of each parameter (or core code), identical to
+        numpy.percentile on the full chain.
+
+        Parameters
+        ----------
+
+        variable : q
+            Percentile or sequence of percentiles (0 to 100).
+
+        variable : codes
+            Summarise the core codes instead of the parameters.
+        """
+
+        values = self._values(codes)
+        out = [_percentile(values[:,j], self.counts, q) for j in range(values.shape[1])]
+
+        return numpy.array(out).T
+
+    def median(self, codes=False):
+        """Return the posterior median of each parameter (or core code)."""
+
+        return self.percentile(50., codes)
+
+    def mode(self, codes=False):
+        """
+        Return the most frequent value of each parameter (or core code) in the chain.
+        """
+
+        values = self._values(codes)
+        out = numpy.zeros(values.shape[1])
+        for j in range(values.shape[1]):
+            unique, inverse = numpy.unique(values[:,j], return_inverse=True)
+            out[j] = unique[numpy.argmax(numpy.bincount(inverse, weights=self.counts))]
+
+        return out
+
+    def histogram(self, column, bins=20, range=None, codes=False):
+        """
+        Return the weighted histogram of a parameter (or core code).
+
+        Parameters
+        ----------
+
+        variable : column
+            Index of the parameter.
+
+        variable : bins, range
+            numpy.histogram bins and range.
+
+        variable : codes
+            Use the core codes instead of the parameters.
+        """
+
+        return numpy.histogram(self._values(codes)[:,column], bins=bins, range=range,
+                               weights=self.counts)
+
+    def boxstats(self, columns, whis=1.5):
+        """
+        Return the matplotlib bxp statistics (as computed by boxplot on the full chain)
+        of some parameters.
+
+        Parameters
+        ----------
+
+        variable : columns
+            Indices of the parameters.
+
+        variable : whis
+            Whisker reach as a multiple of the interquartile range.
+        """
+
+        stats = []
+        for j in columns:
+            values = self.states[:,j]
+            q1, med, q3 = _percentile(values, self.counts, [25., 50., 75.])
+            iqr = q3 - q1
+            inside = values[(values >= q1-whis*iqr) & (values <= q3+whis*iqr)]
+            stats.append({'med': med, 'q1': q1, 'q3': q3,
+                          'whislo': inside.min() if len(inside) > 0 else q1,
+                          'whishi': inside.max() if len(inside) > 0 else q3,
+                          'fliers': numpy.unique(values[(values < q1-whis*iqr) | (values > q3+whis*iqr)]),
+                          'mean': numpy.dot(self.weights(), values), 'label': str(len(stats)+1)})
+
+        return stats
+
+    def trace(self, column):
+        """
+        Return the step indices and values of a parameter at each change of state, to be
+        drawn as a step plot (where='post') of the chain trace.
+
+        Parameters
+        ----------
+
+        variable : column
+            Index of the parameter.
+        """
+
+        steps = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+        values = numpy.append(self.states[:,column], self.states[-1,column])
+
+        return steps, values
+
+    def save(self, fname):
+        """
+        Write the store in a compressed numpy file.
+
+        Parameters
+        ----------
+
+        variable : fname
+            Name of the file.
+        """
+
+        numpy.savez_compressed(fname, states=self.states, codes=self.codes, counts=self.counts,
+                               parts=numpy.array(self.parts))
+
+        return
+
+    @staticmethod
+    def load(fname):
+        """
+        Read a store written by save.
+
+        Parameters
+        ----------
+
+        variable : fname
+            Name of the file.
+        """
+
+        data = numpy.load(fname)
+        store = chainStore(data['states'].shape[1], data['codes'].shape[1],
+                           capacity=max(len(data['counts']), 1))
+        n = len(data['counts'])
+        store._states[:n] = data['states']
+        store._codes[:n] = data['codes']
+        store._counts[:n] = data['counts']
+        store.nunique = n
+        store.parts = list(data['parts'])
+
+        return store
@@ -0,0 +1,169 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements a two-stage delayed-acceptance Metropolis-Hastings kernel
+(Christen & Fox, 2005). Proposals are first screened with a cheap coarse-resolution
+pyReefCore likelihood and only the survivors are simulated at full fidelity. The second
+stage acceptance ratio corrects for the coarse screen so that the chain still targets
+the full-fidelity posterior.
+"""
+import math
+import time
+import numpy
+
+from speculativeMH import loglikelihood
+
+class delayedAcceptance:
+    """
+    This class runs a delayed-acceptance Metropolis-Hastings chain with a symmetric
+    random walk proposal.
+
+    Stage 1 accepts y with probability min(1, Lc(y)/Lc(x)) using the coarse likelihood.
+    Stage 2 accepts y with probability min(1, Lf(y)Lc(x) / Lf(x)Lc(y)) using the full
+    likelihood. A proposal rejected at stage 1 costs no full-fidelity run.
+
+    Parameters
+    ----------
+    function : coarse
+        Coarse log-likelihood function of a parameter vector.
+
+    function : fine
+        Full-fidelity log-likelihood function of a parameter vector.
+
+    function : proposal
+        Function returning a new proposal vector from the current state.
+
+    function : prior
+        Optional function returning the log-prior of a parameter vector.
+    """
+
+    def __init__(self, coarse, fine, proposal, prior=None):
+        """
+        Constructor.
+        """
+
+        self.coarse = coarse
+        self.fine = fine
+        self.proposal = proposal
+        self.prior = prior
+
+        # Kernel statistics
+        self.nsteps = 0
+        self.ncoarse = 0
+        self.nfine = 0
+        self.nstage1 = 0
+        self.nstage2 = 0
+        self.walltime = 0.
+
+        return
+
+    def _logprior(self, v):
+
+        if self.prior is None:
+            return 0.
+
+        return self.prior(v)
+
+    def _accept(self, diff):
+
+        u = numpy.random.uniform(0., 1.)
+
+        return u > 0. and math.log(u) < diff
+
+    def run(self, initial, samples, callback=None):
+        """
+        Sample the chain starting from an initial parameter vector.
+
+        Parameters
+        ----------
+
+        variable : initial
+            Initial parameter vector.
+
+        variable : samples
+            Number of samples in the chain (including the initial one).
+
+        variable : callback
+            Optional function called as callback(i, state, result, accepted) for each step
+            where result is the full-fidelity likelihood output of the retained state.
+        """
+
+        t0 = time.time()
+
+        state = numpy.array(initial, dtype=float)
+        result = self.fine(state)
+        cresult = self.coarse(state)
+        self.nfine += 1
+        self.ncoarse += 1
+        likl = loglikelihood(result)
+        clikl = loglikelihood(cresult)
+        lprior = self._logprior(state)
+
+        pos = numpy.zeros((samples, state.size))
+        pos_likl = numpy.zeros(samples)
+        accept = numpy.zeros(samples, dtype=bool)
+        pos[0,:] = state
+        pos_likl[0] = likl
+        if callback is not None:
+            callback(0, state, result, True)
+
+        for i in range(1, samples):
+            v_proposal = self.proposal(state)
+            pprior = self._logprior(v_proposal)
+
+            # Stage 1: coarse screen
+            if pprior > -numpy.inf:
+                presult_c = self.coarse(v_proposal)
+                self.ncoarse += 1
+                pclikl = loglikelihood(presult_c)
+                if self._accept(pclikl + pprior - clikl - lprior):
+                    self.nstage1 += 1
+                    # Stage 2: full fidelity with the coarse correction
+                    presult = self.fine(v_proposal)
+                    self.nfine += 1
+                    plikl = loglikelihood(presult)
+                    if self._accept((plikl - likl) - (pclikl - clikl)):
+                        self.nstage2 += 1
+                        state = v_proposal
+                        result = presult
+                        likl = plikl
+                        clikl = pclikl
+                        lprior = pprior
+                        accept[i] = True
+
+            pos[i,:] = state
+            pos_likl[i] = likl
+            if callback is not None:
+                callback(i, state, result, accept[i])
+            self.nsteps += 1
+
+        self.walltime += time.time() - t0
+
+        return pos, pos_likl, accept
+
+    def saved_fraction(self):
+        """
+        Fraction of full-fidelity runs saved relative to a standard Metropolis-Hastings chain
+        of the same length.
+        """
+
+        if self.nsteps == 0:
+            return 0.
+
+        return 1. - float(self.nfine - 1)/self.nsteps
+
+    def summary(self):
+        """
+        Return the kernel statistics: number of steps, coarse and full runs, stage 1 and
+        stage 2 acceptances and fraction of full runs saved.
+        """
+
+        return {'steps': self.nsteps, 'coarse_runs': self.ncoarse, 'full_runs': self.nfine,
+                'stage1_accepted': self.nstage1, 'stage2_accepted': self.nstage2,
+                'saved_fraction': self.saved_fraction()}
@@ -0,0 +1,422 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module renders the posterior diagnostic figures (histogram and trace of each
+parameter, boxplots of parameter groups) of a stored chain on a pool of worker processes.
+Parameters are sent to the workers in batches and each worker draws them on the same
+figure templates, using the matplotlib Agg canvas without pyplot. Long traces are
+decimated to the pixel width of the figure with a shape preserving algorithm (min/max
+bucketing or largest triangle three buckets) and rasterised in the PDF files when they
+still hold too many points. As the report only needs a chainStore, it can be run again
+from a saved chain (chain.npz) without sampling.
+"""
+import os
+import numpy
+import multiprocessing
+
+from matplotlib import ticker, font_manager
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Chain, reference values and figure templates held by each worker process
+_chain = None
+_parts = None
+_true_values = None
+_templates = {}
+
+def _init_worker(chain, true_values):
+    """
+    Store the chain in the worker process. With the fork start method the chain is
+    inherited and does not need to be pickled.
+    """
+
+    global _chain, _parts, _true_values
+    # FreeType fonts opened by the parent process cannot be shared with a forked worker
+    cache_clear = getattr(getattr(font_manager, '_get_font', None), 'cache_clear', None)
+    if cache_clear is not None:
+        cache_clear()
+    _chain = chain
+    _parts = [chain.part(k) for k in range(len(chain.parts))]
+    _true_values = true_values
+    _templates.clear()
+
+    return
+
+def _template(kind, figsize=None):
+    """
+    Return the figure and axes of a template, created once per worker process and
+    cleared before each use.
+    """
+
+    if kind not in _templates:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        _templates[kind] = (fig, fig.add_subplot(111))
+    fig, ax = _templates[kind]
+    ax.cla()
+
+    return fig, ax
+
+def minmax(x, y, npoints):
+    """
+    Return the indices of the points kept by min/max bucketing: the x range is split in
+    npoints/2 buckets (e.g. pixel columns) and the lowest and highest points of each
+    bucket are kept, so that the envelope of the curve is drawn unchanged.
+
+    Parameters
+    ----------
+
+    variable : x, y
+        Increasing abscissas and values of the curve.
+
+    integer : npoints
+        Maximum number of kept points.
+    """
+
+    n = len(x)
+    nbuckets = max(npoints//2 - 1, 1)
+    span = float(x[-1] - x[0]) or 1.
+    bucket = numpy.minimum(((x - x[0])/span*nbuckets).astype(int), nbuckets-1)
+    # Sort by bucket, then by value: the first and last point of each bucket are its
+    # minimum and maximum
+    order = numpy.lexsort((y, bucket))
+    ends = numpy.searchsorted(bucket[order], numpy.unique(bucket), side='right')
+    starts = numpy.concatenate(([0], ends[:-1]))
+
+    return numpy.unique(numpy.concatenate(([0, n-1], order[starts], order[ends-1])))
+
+def lttb(x, y, npoints):
+    """
+    Return the indices of the points kept by the largest triangle three buckets algorithm
+    (Steinarsson, 2013): one point per bucket, chosen to form the largest triangle with the
+    point kept in the previous bucket and the mean of the next bucket.
+
+    Parameters
+    ----------
+
+    variable : x, y
+        Increasing abscissas and values of the curve.
+
+    integer : npoints
+        Number of kept points (at least 2).
+    """
+
+    n = len(x)
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    edges = numpy.linspace(1, n-1, npoints-1).astype(int)
+    keep = numpy.zeros(npoints, dtype=int)
+    keep[-1] = n-1
+    a = 0
+    for i in range(npoints-2):
+        lo, hi = edges[i], max(edges[i+1], edges[i]+1)
+        if i+2 < npoints-1:
+            nlo, nhi = edges[i+1], max(edges[i+2], edges[i+1]+1)
+        else:
+            nlo, nhi = n-1, n
+        cx = x[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        area = numpy.abs((x[a]-cx)*(y[lo:hi]-y[a]) - (x[a]-x[lo:hi])*(cy-y[a]))
+        a = lo + int(numpy.argmax(area))
+        keep[i+1] = a
+
+    return numpy.unique(keep)
+
+def decimate(steps, values, maxpoints, method='minmax'):
+    """
+    Downsample a trace to at most maxpoints points (but at least two) with a shape
+    preserving algorithm, keeping the first and last points. Min/max bucketing needs four
+    points, lttb is used below.
+
+    Parameters
+    ----------
+
+    variable : steps, values
+        Step indices and values of the trace.
+
+    integer : maxpoints
+        Maximum number of points, no downsampling if 0 or None.
+
+    string : method
+        'minmax' (envelope of the trace) or 'lttb' (largest triangle three buckets).
+    """
+
+    if method not in ['minmax', 'lttb']:
+        raise ValueError('Unknown decimation method %s.' % method)
+    if not maxpoints or len(steps) <= max(maxpoints, 2):
+        return steps, values
+    if method == 'minmax' and maxpoints >= 4:
+        keep = minmax(steps, values, maxpoints)
+    else:
+        keep = lttb(steps, values, max(maxpoints, 2))
+
+    return steps[keep], values[keep]
+
+def _posterior(fname, param, trace, formats):
+    """
+    Draw the histogram and trace figures of one parameter.
+    """
+
+    maxpoints, method, vector_limit, dpi = trace
+
+    title = 'pos_distri_%d' % param
+    files = []
+
+    fig, ax = _template('posterior')
+    ax.hist(_chain.states[:,param], weights=_chain.counts, bins=20, rwidth=0.9, color='#607c8e')
+    ax.tick_params(axis="x", labelsize=14)
+    ax.tick_params(axis="y", labelsize=14)
+    ax.yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,g}'))
+    ax.yaxis.set_minor_formatter(ticker.StrMethodFormatter('{x:.3f}'))
+    ax.set_xlabel("Parameter", fontsize=15)
+    ax.set_ylabel("Frequency", fontsize=15)
+    if _true_values is not None:
+        ax.axvline(x=_true_values[param], linewidth=2, color='b')
+    ax.grid(linestyle='-', linewidth='0.2', color='grey')
+    fig.tight_layout()
+    for fmt in formats:
+        files.append('%s/posterior/%s_posterior.%s' %(fname, title, fmt))
+        fig.savefig(files[-1])
+
+    fig, ax = _template('trace')
+    if maxpoints is None:
+        # Two points (minimum and maximum) per pixel column of the axes
+        maxpoints = 2*int(fig.get_figwidth()*ax.get_position().width*dpi)
+    npoints = 0
+    lines = []
+    for part in _parts:
+        steps, values = decimate(*part.trace(param), maxpoints=maxpoints, method=method)
+        lines += ax.step(steps, values, where='post')
+        npoints += len(steps)
+    # Vector output only for small traces, larger ones are rasterised at dpi
+    for line in lines:
+        line.set_rasterized(npoints > vector_limit)
+    ax.tick_params(axis="x", labelsize=14)
+    ax.tick_params(axis="y", labelsize=14)
+    ax.yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:.3f}'))
+    ax.yaxis.set_minor_formatter(ticker.StrMethodFormatter('{x:,g}'))
+    ax.set_xlabel("Iterations", fontsize=15)
+    ax.set_ylabel("Parameter", fontsize=15)
+    ax.grid(linestyle='-', linewidth='0.2', color='grey')
+    fig.tight_layout()
+    for fmt in formats:
+        files.append('%s/posterior/%s_trace.%s' %(fname, title, fmt))
+        fig.savefig(files[-1], dpi=dpi)
+
+    return files
+
+def _boxplot(fname, name, columns, label):
+    """
+    Draw the boxplot of a group of parameters.
+    """
+
+    fig, ax = _template('boxplot')
+    ax.tick_params(labelsize=12)
+    ax.bxp(_chain.boxstats(columns))
+    ax.set_xlabel('Parameter ID', fontsize=12)
+    ax.set_ylabel('%s Posterior' % label, fontsize=12)
+    ax.set_title('Boxplot of %s Posterior' % label, fontsize=12)
+    filename = '%s/%s_pos.pdf' %(fname, name)
+    fig.savefig(filename)
+
+    return [filename]
+
+def _render(job):
+    """
+    Render a batch of figures and return the names of the written files.
+    """
+
+    kind, fname, args = job
+    files = []
+    if kind == 'posterior':
+        params, trace, formats = args
+        for param in params:
+            files += _posterior(fname, param, trace, formats)
+    else:
+        files += _boxplot(fname, *args)
+
+    return files
+
+class figureReport:
+    """
+    This class generates the posterior diagnostic figures of a chain.
+
+    Parameters
+    ----------
+    string : fname
+        Output directory, the histograms and traces are written in its posterior folder.
+
+    variable : chain
+        chainStore instance or name of a file written by chainStore.save.
+
+    variable : true_values
+        Optional reference parameter values drawn on the histograms.
+
+    integer : nworkers
+        Number of worker processes, rendering is serial if set to 1.
+
+    integer : batch
+        Number of parameters drawn by a worker for each job.
+
+    integer : maxpoints
+        Maximum number of points of each drawn trace and replica, None for two points per
+        pixel column of the figure and 0 to keep all of them.
+
+    string : method
+        Trace decimation algorithm, 'minmax' or 'lttb'.
+
+    integer : vector_limit
+        Traces with more points are rasterised in vector output files.
+
+    integer : dpi
+        Resolution of the trace figures.
+    """
+
+    def __init__(self, fname, chain, true_values=None, nworkers=None, batch=4, maxpoints=None,
+                 method='minmax', vector_limit=20000, dpi=150):
+        """
+        Constructor.
+        """
+
+        if isinstance(chain, str):
+            from chainStore import chainStore
+            chain = chainStore.load(chain)
+
+        self.fname = fname
+        self.chain = chain
+        self.true_values = true_values
+        if nworkers is None:
+            nworkers = multiprocessing.cpu_count()
+        self.nworkers = nworkers
+        self.batch = batch
+        self.maxpoints = maxpoints
+        self.method = method
+        self.vector_limit = vector_limit
+        self.dpi = dpi
+
+        return
+
+    def render(self, jobs):
+        """
+        Render a list of jobs (kind, output directory, arguments) and return the names of
+        the written files.
+
+        Parameters
+        ----------
+
+        variable : jobs
+            Jobs as built by posterior_jobs and boxplot_jobs.
+        """
+
+        files = []
+        if len(jobs) == 0:
+            return files
+
+        if self.nworkers == 1 or len(jobs) == 1:
+            _init_worker(self.chain, self.true_values)
+            for job in jobs:
+                files += _render(job)
+            return files
+
+        pool = multiprocessing.Pool(min(self.nworkers, len(jobs)), initializer=_init_worker,
+                                    initargs=(self.chain, self.true_values))
+        try:
+            for output in pool.imap_unordered(_render, jobs):
+                files += output
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return files
+
+    def posterior_jobs(self, params=None, formats=('pdf',)):
+        """
+        Return the jobs drawing the histogram and trace of some parameters.
+
+        Parameters
+        ----------
+
+        variable : params
+            Indices of the parameters, all of them by default.
+
+        variable : formats
+            Output file formats.
+        """
+
+        if params is None:
+            params = range(self.chain.nparams)
+        params = list(params)
+        if not os.path.exists('%s/posterior' % self.fname):
+            os.makedirs('%s/posterior' % self.fname)
+
+        trace = (self.maxpoints, self.method, self.vector_limit, self.dpi)
+
+        return [('posterior', self.fname, (params[i:i+self.batch], trace, tuple(formats)))
+                for i in range(0, len(params), self.batch)]
+
+    def boxplot_jobs(self, groups):
+        """
+        Return the jobs drawing the boxplots of groups of parameters.
+
+        Parameters
+        ----------
+
+        variable : groups
+            List of (name, columns, label) tuples, each boxplot is written in
+            <name>_pos.pdf.
+        """
+
+        return [('boxplot', self.fname, tuple(group)) for group in groups]
+
+    def posterior(self, params=None, formats=('pdf',)):
+        """
+        Render the histogram and trace of some parameters.
+
+        Parameters
+        ----------
+
+        variable : params
+            Indices of the parameters, all of them by default.
+
+        variable : formats
+            Output file formats.
+        """
+
+        return self.render(self.posterior_jobs(params, formats))
+
+    def boxplots(self, groups):
+        """
+        Render the boxplots of groups of parameters.
+
+        Parameters
+        ----------
+
+        variable : groups
+            List of (name, columns, label) tuples.
+        """
+
+        return self.render(self.boxplot_jobs(groups))
+
+    def all(self, groups=None, formats=('pdf',)):
+        """
+        Render the figures of all parameters and the boxplots in a single pool.
+
+        Parameters
+        ----------
+
+        variable : groups
+            List of (name, columns, label) tuples.
+
+        variable : formats
+            Output file formats of the histograms and traces.
+        """
+
+        jobs = self.boxplot_jobs(groups or []) + self.posterior_jobs(None, formats)
+
+        return self.render(jobs)
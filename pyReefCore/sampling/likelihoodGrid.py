@@ -0,0 +1,320 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements a parallel and resumable likelihood surface engine. Any subset of
+the parameter vector is varied over a regular grid while the other parameters are kept
+at their base values. Grid points are distributed over a pool of worker processes and
+each result is appended to a text store as soon as it is available, so that an
+interrupted run restarts where it stopped.
+"""
+import os
+import numpy
+import multiprocessing
+
+from speculativeMH import loglikelihood
+
+# Likelihood function held by each worker process
+_likelihood = None
+
+def _init_worker(likelihood):
+    """
+    Store the likelihood function in the worker process. With the fork start method the
+    function is inherited and does not need to be picklable.
+    """
+
+    global _likelihood
+    _likelihood = likelihood
+
+    return
+
+def _scalars(result):
+    """
+    Keep the log-likelihood and the scalar outputs (difference score, RMSE...) of a
+    likelihood function result. Predicted cores and other arrays or objects are not stored.
+    """
+
+    if not isinstance(result, (list, tuple)):
+        return [float(result)]
+
+    values = [loglikelihood(result)]
+    for value in result[1:]:
+        if isinstance(value, (int, long, float, numpy.number)):
+            values.append(float(value))
+
+    return values
+
+def _evaluate(job):
+
+    key, v = job
+
+    return key, _scalars(_likelihood(v))
+
+class likelihoodGrid:
+    """
+    This class evaluates a likelihood function over a regular grid of a slice of the
+    parameter vector.
+
+    Each line of the store holds the grid indices, the parameter values and the
+    log-likelihood followed by the other scalar outputs of the likelihood function. The
+    header records the varied parameters and the grid so that a store can only be
+    resumed with the same grid definition.
+
+    Parameters
+    ----------
+    function : likelihood
+        Function returning the log-likelihood of a parameter vector, or a sequence
+        starting with it.
+
+    variable : base
+        Full parameter vector used for the parameters which are not varied.
+
+    variable : indices
+        Positions in the parameter vector of the varied parameters.
+
+    variable : axes
+        Grid values of each varied parameter.
+
+    string : store
+        Name of the text file where the results are stored.
+
+    integer : nworkers
+        Number of worker processes, evaluation is serial if set to 1.
+
+    function : select
+        Optional function of the grid indices returning False for the points which
+        should not be evaluated (e.g. outside a feasible region).
+    """
+
+    def __init__(self, likelihood, base, indices, axes, store, nworkers=None, select=None):
+        """
+        Constructor.
+        """
+
+        if len(indices) != len(axes):
+            raise ValueError('One grid axis needs to be defined for each varied parameter.')
+
+        self.likelihood = likelihood
+        self.base = numpy.array(base, dtype=float)
+        self.indices = [int(i) for i in indices]
+        self.axes = [numpy.array(a, dtype=float) for a in axes]
+        self.shape = tuple([len(a) for a in self.axes])
+        self.store = store
+        if nworkers is None:
+            nworkers = multiprocessing.cpu_count()
+        self.nworkers = nworkers
+        self.select = select
+
+        self.results = {}
+
+        if numpy.max(self.indices) >= self.base.size:
+            raise ValueError('Varied parameter index is larger than the parameter vector.')
+
+        return
+
+    def _header(self):
+
+        header = ['# indices: %s' %(' '.join([str(i) for i in self.indices]))]
+        for i in range(len(self.axes)):
+            header.append('# axis %d: %s' %(i, ' '.join([repr(x) for x in self.axes[i]])))
+
+        return header
+
+    def vector(self, key):
+        """
+        Return the full parameter vector of a grid point.
+
+        Parameters
+        ----------
+
+        variable : key
+            Grid indices of the point.
+        """
+
+        v = self.base.copy()
+        for i in range(len(key)):
+            v[self.indices[i]] = self.axes[i][key[i]]
+
+        return v
+
+    def load(self):
+        """
+        Read the results already present in the store. Incomplete lines left by an
+        interrupted run are ignored.
+        """
+
+        self.results = {}
+        if not os.path.isfile(self.store):
+            return
+
+        header = self._header()
+        found = []
+        ndim = len(self.shape)
+        with open(self.store, 'r') as infile:
+            for line in infile:
+                if line.startswith('#'):
+                    found.append(line.rstrip('\n'))
+                    continue
+                if not line.endswith('\n'):
+                    continue
+                words = line.split()
+                if len(words) < 2*ndim + 1:
+                    continue
+                try:
+                    key = tuple([int(w) for w in words[:ndim]])
+                    values = [float(w) for w in words[2*ndim:]]
+                except ValueError:
+                    continue
+                self.results[key] = values
+
+        if found != header:
+            raise RuntimeError('The store %s was created for a different likelihood grid.' %self.store)
+
+        return
+
+    def pending(self):
+        """
+        Return the grid indices of the points which have not been computed yet.
+        """
+
+        keys = [key for key in numpy.ndindex(*self.shape) if key not in self.results]
+        if self.select is not None:
+            keys = [key for key in keys if self.select(key)]
+
+        return keys
+
+    def _write(self, outfile, key, values):
+
+        v = self.vector(key)
+        words = [str(k) for k in key] + [repr(v[i]) for i in self.indices] + [repr(x) for x in values]
+        outfile.write(' '.join(words)+'\n')
+        outfile.flush()
+        self.results[key] = values
+
+        return
+
+    def _truncate(self):
+        """
+        Remove the incomplete line left at the end of the store by an interrupted run.
+        """
+
+        with open(self.store, 'rb+') as infile:
+            data = infile.read()
+            if len(data) > 0 and not data.endswith('\n'):
+                infile.truncate(data.rfind('\n')+1)
+
+        return
+
+    def run(self, callback=None):
+        """
+        Evaluate the grid points missing from the store.
+
+        Parameters
+        ----------
+
+        variable : callback
+            Optional function called as callback(key, values, done, total) after each
+            evaluation.
+        """
+
+        self.load()
+
+        return self.evaluate(self.pending(), callback)
+
+    def evaluate(self, keys, callback=None):
+        """
+        Evaluate a list of grid points, skipping those already in the store. The store
+        needs to be loaded first.
+
+        Parameters
+        ----------
+
+        variable : keys
+            Grid indices of the points.
+
+        variable : callback
+            Optional function called as callback(key, values, done, total) after each
+            evaluation.
+        """
+
+        jobs = [(tuple(key), self.vector(key)) for key in keys if tuple(key) not in self.results]
+        total = len(self.results) + len(jobs)
+        if len(jobs) == 0 and os.path.isfile(self.store):
+            return self.surface()
+
+        newfile = not os.path.isfile(self.store)
+        if not newfile:
+            self._truncate()
+        with open(self.store, 'a') as outfile:
+            if newfile:
+                outfile.write('\n'.join(self._header())+'\n')
+
+            if self.nworkers == 1:
+                _init_worker(self.likelihood)
+                outputs = (_evaluate(job) for job in jobs)
+                pool = None
+            else:
+                pool = multiprocessing.Pool(self.nworkers, initializer=_init_worker,
+                                            initargs=(self.likelihood,))
+                outputs = pool.imap_unordered(_evaluate, jobs)
+            try:
+                for key, values in outputs:
+                    self._write(outfile, key, values)
+                    if callback is not None:
+                        callback(key, values, len(self.results), total)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+
+        return self.surface()
+
+    def surface(self, column=0):
+        """
+        Return the grid of one stored output (the log-likelihood by default), set to NaN
+        where the point has not been computed.
+
+        Parameters
+        ----------
+
+        variable : column
+            Index of the output in the stored values.
+        """
+
+        Z = numpy.empty(self.shape)
+        Z.fill(numpy.nan)
+        for key, values in self.results.items():
+            if column < len(values):
+                Z[key] = values[column]
+
+        return Z
+
+    def save_surface(self, fname, column=0):
+        """
+        Write a two-dimensional surface as the X.txt, Y.txt and Z.txt files read by the
+        likelihood surface plotting scripts: X holds the second axis and Y the first one.
+
+        Parameters
+        ----------
+
+        variable : fname
+            Output directory.
+
+        variable : column
+            Index of the output in the stored values.
+        """
+
+        if len(self.shape) != 2:
+            raise ValueError('Surface files can only be written for a two-dimensional grid.')
+
+        X, Y = numpy.meshgrid(self.axes[1], self.axes[0])
+        numpy.savetxt('%s/X.txt' % fname, X)
+        numpy.savetxt('%s/Y.txt' % fname, Y)
+        numpy.savetxt('%s/Z.txt' % fname, self.surface(column))
+
+        return
@@ -0,0 +1,312 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module accumulates posterior predictive summaries of the core while sampling: a
+categorical histogram of the predicted codes at each depth and streaming quantiles (P2
+algorithm of Jain and Chlamtac, 1985) of continuous outputs such as the predicted
+proportions. The matrix of all predicted cores is never built.
+"""
+import numpy
+
+class codeHistogram:
+    """
+    This class counts the predicted codes at each depth interval.
+
+    Parameters
+    ----------
+    integer : ndepths
+        Number of depth intervals.
+
+    integer : ncodes
+        Largest code value.
+    """
+
+    def __init__(self, ndepths, ncodes):
+        """
+        Constructor.
+        """
+
+        self.ndepths = ndepths
+        self.ncodes = ncodes
+        # Column c counts the code c (column 0 is 'none')
+        self.counts = numpy.zeros((ndepths, ncodes+1), dtype=numpy.int64)
+        self._rows = numpy.arange(ndepths)
+
+        return
+
+    @property
+    def nsamples(self):
+        """Number of recorded cores."""
+        return int(self.counts[0].sum())
+
+    def add(self, codes, count=1):
+        """
+        Record a predicted core.
+
+        Parameters
+        ----------
+
+        variable : codes
+            Code of each depth interval.
+
+        variable : count
+            Number of times the core is recorded.
+        """
+
+        self.counts[self._rows, numpy.asarray(codes, dtype=int)] += count
+
+        return
+
+    def probabilities(self):
+        """Return the probability of each code at each depth interval."""
+
+        return self.counts/numpy.maximum(self.counts.sum(axis=1), 1).astype(float)[:,None]
+
+    def mean(self):
+        """Return the mean code at each depth interval."""
+
+        return numpy.dot(self.probabilities(), numpy.arange(self.ncodes+1))
+
+    def mode(self):
+        """Return the most frequent code at each depth interval."""
+
+        return numpy.argmax(self.counts, axis=1)
+
+    def percentile(self, q):
+        """
+        Return the percentile of the codes at each depth interval, identical to
+        numpy.percentile (linear interpolation) on the matrix of all recorded codes.
+
+        Parameters
+        ----------
+
+        variable : q
+            Percentile (0 to 100).
+        """
+
+        cum = numpy.cumsum(self.counts, axis=1)
+        pos = q/100.*(cum[:,-1]-1)
+        lo = numpy.floor(pos)
+        vlo = (cum <= lo[:,None]).sum(axis=1)
+        vhi = (cum <= numpy.ceil(pos)[:,None]).sum(axis=1)
+
+        return vlo + (pos-lo)*(vhi-vlo)
+
+class streamingQuantile:
+    """
+    This class estimates a quantile of many continuous outputs at once with the P2
+    algorithm, using five markers per output.
+
+    Parameters
+    ----------
+    float : p
+        Quantile (0 to 1).
+
+    integer : size
+        Number of outputs.
+    """
+
+    def __init__(self, p, size):
+        """
+        Constructor.
+        """
+
+        self.p = p
+        self.size = size
+        self.count = 0
+        self._first = []
+        self.q = None
+        self.n = None
+        self.desired = numpy.array([0., 2.*p, 4.*p, 2.+2.*p, 4.])[:,None]*numpy.ones(size)
+        self.dn = numpy.array([0., p/2., p, (1.+p)/2., 1.])[:,None]
+
+        return
+
+    def add(self, x):
+        """
+        Record one value of each output.
+
+        Parameters
+        ----------
+
+        variable : x
+            Values of the outputs.
+        """
+
+        x = numpy.asarray(x, dtype=float).ravel()
+        self.count += 1
+        if self.q is None:
+            self._first.append(x)
+            if len(self._first) == 5:
+                self.q = numpy.sort(numpy.array(self._first), axis=0)
+                self.n = numpy.arange(5.)[:,None]*numpy.ones(self.size)
+                self._first = []
+            return
+
+        q = self.q
+        n = self.n
+        # Cell of the new value, extreme markers follow the extrema
+        q[0] = numpy.minimum(q[0], x)
+        q[4] = numpy.maximum(q[4], x)
+        k = (x[None,:] >= q[1:4]).sum(axis=0)
+        n[1:] += (numpy.arange(1, 5)[:,None] > k[None,:])
+        self.desired += self.dn
+
+        # Adjust the three middle markers
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            up = (d >= 1.) & (n[i+1]-n[i] > 1.)
+            down = (d <= -1.) & (n[i-1]-n[i] < -1.)
+            move = up | down
+            if not move.any():
+                continue
+            d = numpy.where(up, 1., -1.)
+            qp = q[i] + d/(n[i+1]-n[i-1])*((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i])
+                                           + (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+            linear = numpy.where(up, q[i] + (q[i+1]-q[i])/(n[i+1]-n[i]),
+                                 q[i] - (q[i-1]-q[i])/(n[i-1]-n[i]))
+            parabolic = (q[i-1] < qp) & (qp < q[i+1])
+            q[i] = numpy.where(move, numpy.where(parabolic, qp, linear), q[i])
+            n[i] = numpy.where(move, n[i]+d, n[i])
+
+        return
+
+    def value(self):
+        """Return the current estimate of the quantile of each output."""
+
+        if self.q is None:
+            if len(self._first) == 0:
+                return numpy.zeros(self.size)*numpy.nan
+            return numpy.percentile(numpy.array(self._first), 100.*self.p, axis=0)
+
+        return self.q[2].copy()
+
+class predictiveSummary:
+    """
+    This class accumulates the posterior predictive summaries of the core: code
+    histogram at each depth interval and streaming quantiles of continuous outputs.
+
+    Parameters
+    ----------
+    integer : ndepths
+        Number of depth intervals.
+
+    integer : ncodes
+        Largest code value.
+
+    variable : shape
+        Shape of the continuous outputs (e.g. the predicted proportions), None if no
+        continuous output is recorded. When given, every sample needs its continuous
+        outputs so that the codes and the continuous summaries cover the same samples.
+
+    variable : quantiles
+        Percentiles of the continuous outputs to estimate.
+    """
+
+    def __init__(self, ndepths, ncodes, shape=None, quantiles=[5., 50., 95.]):
+        """
+        Constructor.
+        """
+
+        self.codes = codeHistogram(ndepths, ncodes)
+        self.shape = shape
+        self.quantiles = list(quantiles)
+        self.streams = []
+        if shape is not None:
+            size = int(numpy.prod(shape))
+            self.streams = [streamingQuantile(q/100., size) for q in self.quantiles]
+            self.total = numpy.zeros(size)
+        self.nvalues = 0
+
+        return
+
+    @property
+    def nsamples(self):
+        """Number of recorded samples."""
+        return self.codes.nsamples
+
+    def add(self, codes, values=None):
+        """
+        Record the predicted core of a posterior sample.
+
+        Parameters
+        ----------
+
+        variable : codes
+            Code of each depth interval.
+
+        variable : values
+            Continuous outputs of the sample, required if the summary records continuous
+            outputs.
+        """
+
+        if self.shape is not None and values is None:
+            raise ValueError('The continuous outputs of the sample are required.')
+        self.codes.add(codes)
+        if self.shape is not None:
+            values = numpy.asarray(values, dtype=float).ravel()
+            self.total += values
+            self.nvalues += 1
+            for stream in self.streams:
+                stream.add(values)
+
+        return
+
+    def bands(self, low=5., high=95.):
+        """
+        Return the mean, low and high percentiles of the predicted codes at each depth
+        interval (inputs of the core prediction plot).
+
+        Parameters
+        ----------
+
+        variable : low, high
+            Percentiles of the band.
+        """
+
+        return self.codes.mean(), self.codes.percentile(low), self.codes.percentile(high)
+
+    def values(self, q):
+        """
+        Return the estimated percentile of the continuous outputs.
+
+        Parameters
+        ----------
+
+        variable : q
+            One of the percentiles given to the constructor.
+        """
+
+        return self.streams[self.quantiles.index(q)].value().reshape(self.shape)
+
+    def mean(self):
+        """Return the mean of the continuous outputs."""
+
+        return (self.total/max(self.nvalues, 1)).reshape(self.shape)
+
+    def save(self, fname):
+        """
+        Write the code probabilities (predictive_codes.txt) and, if recorded, the mean
+        and percentiles of the continuous outputs (predictive_mean.txt and
+        predictive_q<percentile>.txt) of each depth interval.
+
+        Parameters
+        ----------
+
+        variable : fname
+            Output directory.
+        """
+
+        numpy.savetxt('%s/predictive_codes.txt' % fname, self.codes.probabilities(), fmt='%1.4f')
+        if self.shape is not None:
+            numpy.savetxt('%s/predictive_mean.txt' % fname, self.mean(), fmt='%1.4e')
+            for q in self.quantiles:
+                numpy.savetxt('%s/predictive_q%g.txt' %(fname, q), self.values(q), fmt='%1.4e')
+
+        return
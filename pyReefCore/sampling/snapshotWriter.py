@@ -0,0 +1,321 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module writes the core snapshots of accepted samples (initial settings, community
+evolution, accommodation space and core figures and CSV file) in a background process.
+The sampler copies the core and plot objects of the model in a bounded queue and returns
+immediately; when the queue is full the snapshot is either dropped or coalesced with the
+next one, and the number of such snapshots is reported.
+"""
+import os
+import copy
+import time
+import Queue
+import cPickle
+import traceback
+import multiprocessing
+
+import numpy
+
+class _tabulated:
+    """
+    Forcing function (scipy interp1d, which cannot be pickled) replaced by its values at
+    the times where the plotting functions evaluate it.
+    """
+
+    def __init__(self, func, times):
+
+        x = []
+        y = []
+        for t in times:
+            if t is None:
+                continue
+            try:
+                y.append(numpy.asarray(func(t), dtype=float).ravel())
+                x.append(numpy.asarray(t, dtype=float).ravel())
+            except ValueError:
+                continue
+        x = numpy.concatenate(x) if len(x) > 0 else numpy.zeros(0)
+        y = numpy.concatenate(y) if len(y) > 0 else numpy.zeros(0)
+        self.x, index = numpy.unique(x, return_index=True)
+        self.y = y[index]
+
+    def __call__(self, t):
+
+        return numpy.interp(t, self.x, self.y)
+
+def snapshot(reef):
+    """
+    Return a picklable copy of the core and plot objects of a model.
+
+    Parameters
+    ----------
+
+    variable : reef
+        pyReefCore Model instance after a run.
+    """
+
+    core = copy.copy(reef.core)
+    times = (core.seatime, core.sedtime, core.flowtime)
+    for name in ['seaFunc', 'sedFunc', 'flowFunc']:
+        func = getattr(core, name)
+        if func is not None:
+            setattr(core, name, _tabulated(func, times))
+    plot = copy.copy(reef.plot)
+    plot.counters = None
+
+    return core, plot
+
+def render(core, plot, path, label, dpi=300):
+    """
+    Write the snapshot figures and core file of a sample in path.
+
+    Parameters
+    ----------
+
+    variable : core, plot
+        Core and plot objects of the model (or their snapshot copies).
+
+    string : path
+        Output directory.
+
+    variable : label
+        Name of the sample (e.g. number of accepted proposals).
+
+    integer : dpi
+        Figure resolution.
+    """
+
+    from matplotlib.cm import terrain, plasma
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    colors = terrain(numpy.linspace(0, 1.8, len(core.coralH)+10))
+    colors2 = plasma(numpy.linspace(0, 1, len(core.layTime)+3))
+
+    #     Initial settings     #
+    core.initialSetting(size=(8,2.5), size2=(8,4.5), dpi=dpi, fname='%s/a_thres_%s_' % (path, label))
+    #      Community population evolution    #
+    plot.speciesDepth(colors=colors, size=(8,4), font=8, dpi=dpi, fname=('%s/b_popd_%s.png' % (path, label)))
+    plot.speciesTime(colors=colors, size=(8,4), font=8, dpi=dpi, fname=('%s/c_popt_%s.png' % (path, label)))
+    plot.accomodationTime(size=(8,4), font=8, dpi=dpi, fname=('%s/d_acct_%s.pdf' % (path, label)))
+    #      Draw core      #
+    plot.drawCore(lwidth=3, colsed=colors, coltime=colors2, size=(9,8), font=8, dpi=dpi,
+                  figname=('%s/e_core_%s' % (path, label)), filename=('%s/core_%s.csv' % (path, label)), sep='\t')
+
+    return
+
+def _write(jobs, results):
+    """
+    Writer process loop: render the queued snapshots until None is received.
+    """
+
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        label, path, dpi, data = job
+        try:
+            core, plot = cPickle.loads(data)
+            render(core, plot, path, label, dpi)
+            plt.close('all')
+            results.put((label, None))
+        except Exception:
+            plt.close('all')
+            results.put((label, traceback.format_exc()))
+
+    return
+
+class snapshotWriter:
+    """
+    This class queues core snapshots to a background writer process.
+
+    Parameters
+    ----------
+    string : fname
+        Output directory, each snapshot is written in its own <fname>/<label> folder.
+
+    integer : maxsize
+        Number of snapshots the queue holds.
+
+    string : overflow
+        'coalesce' to keep the latest snapshot submitted while the queue is full and
+        queue it as soon as possible (older ones are replaced), 'drop' to discard it.
+
+    integer : dpi
+        Figure resolution.
+
+    variable : telemetry
+        Optional telemetry instance receiving the warnings and the final report.
+    """
+
+    def __init__(self, fname, maxsize=4, overflow='coalesce', dpi=300, telemetry=None):
+        """
+        Constructor.
+        """
+
+        if overflow not in ['coalesce', 'drop']:
+            raise ValueError('Unknown overflow policy %s.' % overflow)
+
+        self.fname = fname
+        self.overflow = overflow
+        self.dpi = dpi
+        self.telemetry = telemetry
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._pending = None
+
+        self._jobs = multiprocessing.Queue(maxsize)
+        self._results = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_write, args=(self._jobs, self._results))
+        self._process.daemon = True
+        self._process.start()
+
+        return
+
+    def _warn(self, event, **fields):
+
+        if self.telemetry is not None:
+            self.telemetry.warning(event, **fields)
+
+        return
+
+    def _put(self, job):
+        """
+        Queue a job without blocking, return False if the queue is full.
+        """
+
+        try:
+            self._jobs.put_nowait(job)
+        except Queue.Full:
+            return False
+
+        return True
+
+    def poll(self):
+        """
+        Collect the results of the written snapshots and queue the coalesced one if there
+        is room.
+        """
+
+        while True:
+            try:
+                label, error = self._results.get_nowait()
+            except Queue.Empty:
+                break
+            if error is None:
+                self.written += 1
+            else:
+                self.failed += 1
+                self._warn('snapshot_failed', label=label, error=error)
+
+        if self._pending is not None and self._put(self._pending):
+            self._pending = None
+
+        return
+
+    def submit(self, reef, label):
+        """
+        Queue the snapshot of a model run without blocking.
+
+        Parameters
+        ----------
+
+        variable : reef
+            pyReefCore Model instance after a run.
+
+        variable : label
+            Name of the sample (e.g. number of accepted proposals).
+        """
+
+        self.poll()
+        self.submitted += 1
+        job = (label, '%s/%s' % (self.fname, label), self.dpi,
+               cPickle.dumps(snapshot(reef), cPickle.HIGHEST_PROTOCOL))
+        if self._pending is None and self._put(job):
+            return
+
+        if self.overflow == 'drop':
+            self.dropped += 1
+            self._warn('snapshot_dropped', label=label, dropped=self.dropped)
+        else:
+            if self._pending is not None:
+                self.coalesced += 1
+                self._warn('snapshot_coalesced', label=self._pending[0], coalesced=self.coalesced)
+            self._pending = job
+
+        return
+
+    def summary(self):
+        """Return the snapshot counters."""
+
+        return {'submitted': self.submitted, 'written': self.written, 'failed': self.failed,
+                'dropped': self.dropped, 'coalesced': self.coalesced}
+
+    def close(self, timeout=None):
+        """
+        Write the queued snapshots, stop the writer process and return the counters.
+
+        Parameters
+        ----------
+
+        float : timeout
+            Maximum time in seconds to queue and wait for the remaining snapshots, None to
+            wait until they are all written. A writer process that died is not waited for.
+        """
+
+        if self._process is None:
+            return self.summary()
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        # Queue the coalesced snapshot and the stop signal, collecting the results in the
+        # meantime, unless the writer died or the time is up
+        jobs = [None]
+        if self._pending is not None:
+            jobs.insert(0, self._pending)
+            self._pending = None
+        while len(jobs) > 0 and self._process.is_alive():
+            if deadline is not None and time.time() >= deadline:
+                break
+            try:
+                self._jobs.put(jobs[0], timeout=0.1)
+                jobs.pop(0)
+            except Queue.Full:
+                pass
+            self.poll()
+
+        # The writer only exits once its results have been read, drain them while waiting
+        while self._process.is_alive():
+            if deadline is not None and time.time() >= deadline:
+                break
+            self.poll()
+            self._process.join(0.1)
+        if self._process.is_alive():
+            self._process.terminate()
+            # Jobs left in the queue are abandoned, do not wait to flush them at exit
+            self._jobs.cancel_join_thread()
+        self._process.join()
+        self._process = None
+        self.poll()
+        lost = self.submitted - self.written - self.failed - self.dropped - self.coalesced
+        if lost > 0:
+            self._warn('snapshot_unwritten', count=lost)
+        if self.telemetry is not None:
+            self.telemetry.info('snapshots', **self.summary())
+
+        return self.summary()
@@ -0,0 +1,242 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements a speculative (pre-fetching) executor for the Metropolis-Hastings
+random walk. While the proposal of step i is simulated, the proposals of the following
+steps are simulated on idle workers for both the accept and the reject branch. The chain
+itself is unchanged: only one path through the tree of proposals is retained and the
+other branches are discarded.
+"""
+import math
+import time
+import numpy
+import multiprocessing
+
+# Likelihood function held by each worker process
+_likelihood = None
+
+def _init_worker(likelihood):
+    """
+    Store the likelihood function in the worker process. With the fork start method the
+    function is inherited and does not need to be picklable.
+    """
+
+    global _likelihood
+    _likelihood = likelihood
+
+    return
+
+def _evaluate(proposal):
+
+    return _likelihood(proposal)
+
+def loglikelihood(result):
+    """
+    Extract the log-likelihood from a likelihood function result. Results are either a
+    float or a sequence starting with the log-likelihood, as returned by
+    MCMC.likelihood_func.
+    """
+
+    if isinstance(result, (list, tuple)):
+        return float(result[0])
+
+    return float(result)
+
+class speculativeMH:
+    """
+    This class runs a single Metropolis-Hastings chain where the next proposals are
+    evaluated ahead of time on a binary tree of depth k.
+
+    Nodes of the tree are stored in heap order: the children of node n are 2n+1 (current
+    proposal accepted) and 2n+2 (current proposal rejected). A complete round therefore
+    advances the chain by up to k steps for the cost of a single forward run when
+    2^k-1 workers are available.
+
+    Parameters
+    ----------
+    function : likelihood
+        Function returning the log-likelihood of a parameter vector (see loglikelihood).
+
+    function : proposal
+        Function returning a new proposal vector from the current state.
+
+    function : prior
+        Optional function returning the log-prior of a parameter vector.
+
+    integer : depth
+        Depth k of the speculation tree.
+
+    integer : nworkers
+        Number of worker processes, defaults to 2^k-1.
+    """
+
+    def __init__(self, likelihood, proposal, prior=None, depth=3, nworkers=None):
+        """
+        Constructor.
+        """
+
+        if depth < 1:
+            raise ValueError('Speculation tree depth needs to be at least 1.')
+
+        self.likelihood = likelihood
+        self.proposal = proposal
+        self.prior = prior
+        self.depth = depth
+        self.nodes = 2**depth - 1
+        if nworkers is None:
+            nworkers = self.nodes
+        self.nworkers = nworkers
+        self.pool = None
+
+        # Executor statistics
+        self.nsteps = 0
+        self.nrounds = 0
+        self.nevals = 0
+        self.nwasted = 0
+        self.walltime = 0.
+
+        return
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.nworkers, initializer=_init_worker,
+                                             initargs=(self.likelihood,))
+
+        return
+
+    def close(self):
+        """
+        Terminate the worker processes. Pending speculative evaluations are discarded.
+        """
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        return
+
+    def _logprior(self, v):
+
+        if self.prior is None:
+            return 0.
+
+        return self.prior(v)
+
+    def _build_tree(self, state):
+        """
+        Draw the proposals of every node of the speculation tree from the current state.
+
+        Parameters
+        ----------
+
+        variable : state
+            Current state of the chain.
+        """
+
+        states = [None]*self.nodes
+        proposals = [None]*self.nodes
+        states[0] = state
+        for n in range(self.nodes):
+            proposals[n] = self.proposal(states[n])
+            if 2*n+2 < self.nodes:
+                states[2*n+1] = proposals[n]
+                states[2*n+2] = states[n]
+
+        return proposals
+
+    def run(self, initial, samples, callback=None):
+        """
+        Sample the chain starting from an initial parameter vector.
+
+        Parameters
+        ----------
+
+        variable : initial
+            Initial parameter vector.
+
+        variable : samples
+            Number of samples in the chain (including the initial one).
+
+        variable : callback
+            Optional function called as callback(i, state, result, accepted) for each step
+            where result is the likelihood output of the retained state.
+        """
+
+        self.start()
+        t0 = time.time()
+
+        state = numpy.array(initial, dtype=float)
+        result = self.pool.apply(_evaluate, (state,))
+        self.nevals += 1
+        likl = loglikelihood(result)
+        lprior = self._logprior(state)
+
+        pos = numpy.zeros((samples, state.size))
+        pos_likl = numpy.zeros(samples)
+        accept = numpy.zeros(samples, dtype=bool)
+        pos[0,:] = state
+        pos_likl[0] = likl
+        if callback is not None:
+            callback(0, state, result, True)
+
+        i = 1
+        while i < samples:
+            proposals = self._build_tree(state)
+            jobs = [self.pool.apply_async(_evaluate, (p,)) for p in proposals]
+            self.nevals += self.nodes
+            self.nrounds += 1
+
+            # Walk down the tree along the realised accept/reject path
+            n = 0
+            used = 0
+            while n < self.nodes and i < samples:
+                presult = jobs[n].get()
+                used += 1
+                plikl = loglikelihood(presult)
+                pprior = self._logprior(proposals[n])
+                diff = plikl + pprior - likl - lprior
+                u = numpy.random.uniform(0., 1.)
+                if u > 0. and math.log(u) < diff:
+                    state = proposals[n]
+                    result = presult
+                    likl = plikl
+                    lprior = pprior
+                    accept[i] = True
+                    n = 2*n+1
+                else:
+                    n = 2*n+2
+                pos[i,:] = state
+                pos_likl[i] = likl
+                if callback is not None:
+                    callback(i, state, result, accept[i])
+                i += 1
+                self.nsteps += 1
+            self.nwasted += self.nodes - used
+
+        self.walltime += time.time() - t0
+
+        return pos, pos_likl, accept
+
+    def summary(self):
+        """
+        Return the executor statistics: number of steps, rounds, forward evaluations,
+        discarded evaluations and steps per second.
+        """
+
+        rate = 0.
+        if self.walltime > 0.:
+            rate = self.nsteps/self.walltime
+
+        return {'steps': self.nsteps, 'rounds': self.nrounds, 'evaluations': self.nevals,
+                'wasted': self.nwasted, 'steps_per_sec': rate}
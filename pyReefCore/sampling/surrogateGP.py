@@ -0,0 +1,362 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements surrogate-assisted Metropolis-Hastings sampling. A local Gaussian
+process emulator is trained on the (parameter, log-likelihood) pairs already evaluated
+during the run and is used to pre-screen proposals. The forward model is only called
+when the emulator is uncertain or when it predicts that the proposal will be accepted.
+"""
+import math
+import time
+import numpy
+from scipy import linalg
+
+from speculativeMH import loglikelihood
+
+class gaussianProcess:
+    """
+    This class defines a Gaussian process regression with a squared exponential kernel
+    on standardised inputs. A diagonal quadratic trend, which captures most of the shape
+    of a log-likelihood around a mode, is fitted by ridge regression and the Gaussian
+    process models the residuals. The length scale is picked by maximising the log
+    marginal likelihood over a small grid scaled by the median distance between training
+    points.
+
+    Parameters
+    ----------
+    float : noise
+        Noise variance added to the kernel diagonal (on standardised residuals).
+
+    float : ridge
+        Ridge penalty of the quadratic trend.
+    """
+
+    def __init__(self, noise=1.e-4, ridge=1.e-3):
+        """
+        Constructor.
+        """
+
+        self.noise = noise
+        self.ridge = ridge
+        self.trend = None
+        self.lengthscale = None
+        self.X = None
+        self.xmean = None
+        self.xstd = None
+        self.ymean = 0.
+        self.ystd = 1.
+        self.chol = None
+        self.weights = None
+
+        return
+
+    def _kernel(self, A, B):
+
+        d2 = numpy.sum(A**2, axis=1)[:,None] + numpy.sum(B**2, axis=1)[None,:] - 2.*numpy.dot(A, B.T)
+        d2[d2<0.] = 0.
+
+        return numpy.exp(-0.5*d2/self.lengthscale**2)
+
+    def _features(self, A):
+
+        return numpy.hstack((numpy.ones((A.shape[0],1)), A, A**2))
+
+    def fit(self, X, y):
+        """
+        Train the emulator.
+
+        Parameters
+        ----------
+
+        variable : X
+            Training parameter vectors (one per row).
+
+        variable : y
+            Training log-likelihood values.
+        """
+
+        X = numpy.asarray(X, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        self.xmean = X.mean(axis=0)
+        self.xstd = X.std(axis=0)
+        self.xstd[self.xstd==0.] = 1.
+        self.X = (X - self.xmean)/self.xstd
+
+        # Quadratic trend
+        F = self._features(self.X)
+        A = numpy.dot(F.T, F) + self.ridge*len(y)*numpy.eye(F.shape[1])
+        self.trend = linalg.solve(A, numpy.dot(F.T, y), sym_pos=True)
+        res = y - numpy.dot(F, self.trend)
+        self.ymean = res.mean()
+        self.ystd = res.std()
+        if self.ystd == 0.:
+            self.ystd = 1.
+        ys = (res - self.ymean)/self.ystd
+
+        d2 = numpy.sum((self.X[:,None,:] - self.X[None,:,:])**2, axis=2)
+        d0 = math.sqrt(numpy.median(d2[d2>0.])) if numpy.any(d2>0.) else 1.
+
+        best = None
+        for scale in [0.25, 0.5, 1., 2., 4.]:
+            self.lengthscale = scale*d0
+            K = self._kernel(self.X, self.X) + self.noise*numpy.eye(len(ys))
+            try:
+                chol = linalg.cho_factor(K, lower=True)
+            except linalg.LinAlgError:
+                continue
+            weights = linalg.cho_solve(chol, ys)
+            lml = -0.5*numpy.dot(ys, weights) - numpy.sum(numpy.log(numpy.diag(chol[0])))
+            if best is None or lml > best[0]:
+                best = [lml, scale*d0, chol, weights]
+
+        if best is None:
+            raise RuntimeError('Gaussian process training failed: kernel matrix is not positive definite.')
+        self.lengthscale = best[1]
+        self.chol = best[2]
+        self.weights = best[3]
+
+        return
+
+    def predict(self, x):
+        """
+        Predict the log-likelihood mean and standard deviation.
+
+        Parameters
+        ----------
+
+        variable : x
+            Parameter vectors (one per row).
+        """
+
+        xs = (numpy.atleast_2d(x) - self.xmean)/self.xstd
+        k = self._kernel(xs, self.X)
+        mean = numpy.dot(k, self.weights)*self.ystd + self.ymean + numpy.dot(self._features(xs), self.trend)
+        v = linalg.cho_solve(self.chol, k.T)
+        var = 1. + self.noise - numpy.sum(k*v.T, axis=1)
+        var[var<0.] = 0.
+
+        return mean, numpy.sqrt(var)*self.ystd
+
+class surrogateMH:
+    """
+    This class runs a surrogate-assisted Metropolis-Hastings chain.
+
+    When the emulator is confident (predicted standard deviations of both the current
+    state and the proposal below max_sd) it is used as the first stage of a
+    delayed-acceptance kernel: proposals it rejects cost no forward run, and proposals it
+    accepts are corrected with a true model call. Uncertain proposals always use the true
+    model. The confidence test is symmetric in the current state and the proposal, so
+    that both moves of a pair use the same kernel.
+
+    The emulator is retrained on the chain history during the first freeze steps only.
+    Once it is frozen the transition kernel is fixed and the chain targets the exact
+    posterior, the samples of the adaptation period should be discarded as burn-in. With
+    freeze set to None the emulator is retrained for the whole run, the adaptation does
+    not diminish and the sampler is then approximate.
+
+    Parameters
+    ----------
+    function : likelihood
+        Function returning the log-likelihood of a parameter vector.
+
+    function : proposal
+        Function returning a new proposal vector from the current state.
+
+    function : prior
+        Optional function returning the log-prior of a parameter vector.
+
+    integer : min_train
+        Number of true evaluations collected before the emulator is used.
+
+    integer : max_train
+        Number of most recent evaluations used to train the local emulator.
+
+    integer : retrain
+        Number of new true evaluations between two emulator trainings.
+
+    float : max_sd
+        Largest predicted standard deviation (log-likelihood units) for which the
+        emulator is trusted.
+
+    integer : freeze
+        Number of steps after which the emulator is no longer retrained, None to retrain
+        it for the whole run.
+    """
+
+    def __init__(self, likelihood, proposal, prior=None, min_train=50, max_train=400,
+                 retrain=25, max_sd=1., freeze=None):
+        """
+        Constructor.
+        """
+
+        self.likelihood = likelihood
+        self.proposal = proposal
+        self.prior = prior
+        self.min_train = min_train
+        self.max_train = max_train
+        self.retrain = retrain
+        self.max_sd = max_sd
+        self.freeze = freeze
+        self.gp = gaussianProcess()
+        self.trained = False
+
+        self.train_x = []
+        self.train_y = []
+        self.nnew = 0
+
+        # Sampler statistics
+        self.nsteps = 0
+        self.ntrue = 0
+        self.nuncertain = 0
+        self.nscreened = 0
+        self.ntrain = 0
+        self.walltime = 0.
+
+        return
+
+    def _logprior(self, v):
+
+        if self.prior is None:
+            return 0.
+
+        return self.prior(v)
+
+    def _accept(self, diff):
+
+        u = numpy.random.uniform(0., 1.)
+
+        return u > 0. and math.log(u) < diff
+
+    def _evaluate(self, v):
+        """
+        Run the forward model and store the new training pair.
+        """
+
+        result = self.likelihood(v)
+        likl = loglikelihood(result)
+        self.ntrue += 1
+        if numpy.isfinite(likl):
+            self.train_x.append(numpy.array(v, dtype=float))
+            self.train_y.append(likl)
+            self.nnew += 1
+            if len(self.train_x) > self.max_train:
+                self.train_x.pop(0)
+                self.train_y.pop(0)
+
+        return result, likl
+
+    def _update(self):
+        """
+        Retrain the emulator when enough new evaluations are available, until it is
+        frozen.
+        """
+
+        if self.freeze is not None and self.nsteps >= self.freeze:
+            return
+        if len(self.train_x) < self.min_train:
+            return
+        if self.trained and self.nnew < self.retrain:
+            return
+        try:
+            self.gp.fit(numpy.array(self.train_x), numpy.array(self.train_y))
+            self.trained = True
+            self.ntrain += 1
+        except RuntimeError:
+            self.trained = False
+        self.nnew = 0
+
+        return
+
+    def run(self, initial, samples, callback=None):
+        """
+        Sample the chain starting from an initial parameter vector.
+
+        Parameters
+        ----------
+
+        variable : initial
+            Initial parameter vector.
+
+        variable : samples
+            Number of samples in the chain (including the initial one).
+
+        variable : callback
+            Optional function called as callback(i, state, result, accepted) for each step
+            where result is the true likelihood output of the retained state.
+        """
+
+        t0 = time.time()
+
+        state = numpy.array(initial, dtype=float)
+        result, likl = self._evaluate(state)
+        lprior = self._logprior(state)
+
+        pos = numpy.zeros((samples, state.size))
+        pos_likl = numpy.zeros(samples)
+        accept = numpy.zeros(samples, dtype=bool)
+        pos[0,:] = state
+        pos_likl[0] = likl
+        if callback is not None:
+            callback(0, state, result, True)
+
+        for i in range(1, samples):
+            self._update()
+            v_proposal = self.proposal(state)
+            pprior = self._logprior(v_proposal)
+
+            if pprior > -numpy.inf:
+                confident = False
+                if self.trained:
+                    mu, sd = self.gp.predict(numpy.vstack((state, v_proposal)))
+                    confident = max(sd[0], sd[1]) <= self.max_sd
+
+                if confident:
+                    # Stage 1: emulator screen
+                    if self._accept(mu[1] + pprior - mu[0] - lprior):
+                        # Stage 2: true model with the emulator correction
+                        presult, plikl = self._evaluate(v_proposal)
+                        if self._accept((plikl - likl) - (mu[1] - mu[0])):
+                            accept[i] = True
+                    else:
+                        self.nscreened += 1
+                else:
+                    self.nuncertain += 1
+                    presult, plikl = self._evaluate(v_proposal)
+                    if self._accept(plikl + pprior - likl - lprior):
+                        accept[i] = True
+
+                if accept[i]:
+                    state = v_proposal
+                    result = presult
+                    likl = plikl
+                    lprior = pprior
+
+            pos[i,:] = state
+            pos_likl[i] = likl
+            if callback is not None:
+                callback(i, state, result, accept[i])
+            self.nsteps += 1
+
+        self.walltime += time.time() - t0
+
+        return pos, pos_likl, accept
+
+    def summary(self):
+        """
+        Return the sampler statistics: number of steps, true model runs, runs triggered by
+        emulator uncertainty, proposals rejected by the emulator alone, trainings and the
+        reduction factor of forward evaluations relative to a standard chain.
+        """
+
+        reduction = 0.
+        if self.ntrue > 0:
+            reduction = float(self.nsteps + 1)/self.ntrue
+
+        return {'steps': self.nsteps, 'true_runs': self.ntrue, 'uncertain_runs': self.nuncertain,
+                'screened': self.nscreened, 'trainings': self.ntrain, 'reduction': reduction}
@@ -0,0 +1,269 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the BayesReef modelling software                         ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module implements the sampler telemetry. Events are filtered by level and written
+as JSON lines to a log file, and the sampler progress (acceptance rate, swap rate,
+evaluations per second and best likelihood) is aggregated and reported periodically
+instead of at every step. Log records are buffered in memory and written with the
+progress summaries, on warnings and when the telemetry is closed. Non-finite values
+(e.g. the best likelihood before any evaluation) are written as null so that every line
+is valid JSON.
+"""
+import sys
+import json
+import math
+import time
+import numpy
+
+levels = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+def _jsonable(value):
+    """
+    Convert numpy values for the JSON encoder.
+    """
+
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+
+    return str(value)
+
+def _finite(value):
+    """
+    Replace the non-finite floats of a record (NaN, -inf, inf) by None.
+    """
+
+    if isinstance(value, numpy.ndarray):
+        value = value.tolist()
+    elif isinstance(value, numpy.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isinf(value) or math.isnan(value):
+            return None
+        return value
+    if isinstance(value, dict):
+        return dict([(key, _finite(item)) for key, item in value.items()])
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+
+    return value
+
+class telemetry:
+    """
+    This class records sampler events and aggregated progress summaries.
+
+    Parameters
+    ----------
+    string : filename
+        Name of the JSON lines log file, nothing is written to file if None.
+
+    string : level
+        Lowest level of the events written to the log file.
+
+    string : console
+        Lowest level of the events printed on the standard output.
+
+    float : interval
+        Minimum time in seconds between two progress summaries.
+    """
+
+    def __init__(self, filename=None, level='info', console='info', interval=60.):
+        """
+        Constructor.
+        """
+
+        self.level = levels[level]
+        self.console = levels[console]
+        self.interval = interval
+        self.outfile = None
+        self.buffer = []
+        if filename is not None:
+            self.outfile = open(filename, 'a')
+
+        self.start = time.time()
+        self.last = self.start
+        self.reset()
+
+        return
+
+    def reset(self):
+        """
+        Reset the aggregated counters.
+        """
+
+        self.nsteps = 0
+        self.naccept = 0
+        self.nswaps = 0
+        self.nswapped = 0
+        self.nevals = 0
+        self.best = -numpy.inf
+        # Counters at the last summary
+        self.window = [0, 0, 0, 0, 0]
+
+        return
+
+    def log(self, level, event, **fields):
+        """
+        Record an event.
+
+        Parameters
+        ----------
+
+        variable : level
+            Event level: debug, info, warning or error.
+
+        variable : event
+            Event name.
+
+        variable : fields
+            Event values.
+        """
+
+        value = levels[level]
+        if value < self.level and value < self.console:
+            return
+
+        if self.outfile is not None and value >= self.level:
+            record = {'time': round(time.time() - self.start, 3), 'level': level, 'event': event}
+            record.update(fields)
+            self.buffer.append(json.dumps(_finite(record), default=_jsonable, allow_nan=False)+'\n')
+            if value >= levels['warning']:
+                self.flush()
+
+        if value >= self.console:
+            words = ['%s=%s' %(key, fields[key]) for key in sorted(fields.keys())]
+            sys.stdout.write('[%s] %s %s\n' %(level, event, ' '.join(words)))
+
+        return
+
+    def flush(self):
+        """
+        Write the buffered records to the log file.
+        """
+
+        if self.outfile is not None and len(self.buffer) > 0:
+            self.outfile.writelines(self.buffer)
+            self.outfile.flush()
+        self.buffer = []
+
+        return
+
+    def debug(self, event, **fields):
+
+        self.log('debug', event, **fields)
+
+    def info(self, event, **fields):
+
+        self.log('info', event, **fields)
+
+    def warning(self, event, **fields):
+
+        self.log('warning', event, **fields)
+
+    def error(self, event, **fields):
+
+        self.log('error', event, **fields)
+
+    def evaluation(self, likelihood):
+        """
+        Count a forward model evaluation.
+
+        Parameters
+        ----------
+
+        variable : likelihood
+            Log-likelihood of the evaluated parameter vector.
+        """
+
+        self.nevals += 1
+        if likelihood > self.best:
+            self.best = float(likelihood)
+
+        return
+
+    def step(self, accepted):
+        """
+        Count a Metropolis-Hastings step and report the progress when it is due.
+
+        Parameters
+        ----------
+
+        variable : accepted
+            True if the proposal was accepted.
+        """
+
+        self.nsteps += 1
+        if accepted:
+            self.naccept += 1
+        if time.time() - self.last >= self.interval:
+            self.report()
+
+        return
+
+    def swap(self, accepted):
+        """
+        Count a replica swap proposal.
+
+        Parameters
+        ----------
+
+        variable : accepted
+            True if the replicas were swapped.
+        """
+
+        self.nswaps += 1
+        if accepted:
+            self.nswapped += 1
+
+        return
+
+    def summary(self):
+        """
+        Return the aggregated progress since the start and since the last summary.
+        """
+
+        now = time.time()
+        steps = self.nsteps - self.window[0]
+        swaps = self.nswaps - self.window[2]
+        evals = self.nevals - self.window[4]
+        elapsed = now - self.last
+
+        return {'steps': self.nsteps, 'evaluations': self.nevals, 'elapsed': round(now - self.start, 3),
+                'acceptance_rate': float(self.naccept)/max(self.nsteps, 1),
+                'swap_rate': float(self.nswapped)/max(self.nswaps, 1),
+                'window_acceptance_rate': float(self.naccept - self.window[1])/max(steps, 1),
+                'window_swap_rate': float(self.nswapped - self.window[3])/max(swaps, 1),
+                'evals_per_sec': evals/elapsed if elapsed > 0. else 0.,
+                'best_likelihood': self.best if numpy.isfinite(self.best) else None}
+
+    def report(self):
+        """
+        Record a progress summary, write the buffered records and start a new summary
+        window.
+        """
+
+        self.info('summary', **self.summary())
+        self.flush()
+        self.window = [self.nsteps, self.naccept, self.nswaps, self.nswapped, self.nevals]
+        self.last = time.time()
+
+        return
+
+    def close(self):
+        """
+        Record the final summary and close the log file.
+        """
+
+        self.report()
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+
+        return
@@ -8,100 +8,234 @@
 ##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
 """
 This script is intended to save records of posteriors of parameters in BayesReef.
+
+Records are buffered in memory and appended as fixed size binary rows to <name>.bin
+files (pos_sed, pos_flow, pos_m, pos_aij, pos_diff, pos_likl, pos_samples and
+pos_proposals), which stay open during sampling. The numpy dtype of the rows is written
+in <name>.dtype next to each file. exportParameters converts the binary files to the CSV
+files previously written by saveParameters.
 """
 import os
 import csv
+import ast
+import time
+import atexit
 import numpy as np
 
-def saveParameters(fname, sedsim, flowsim, naccept, pos_m, pos_ax, pos_ay, 
-    pos_sed1, pos_sed2, pos_sed3, pos_sed4, 
-    pos_flow1, pos_flow2, pos_flow3, pos_flow4, pos_diff, pos_likl, pos_samples, proposal):
-    if sedsim == True:
-        if not os.path.isfile(('%s/pos_sed.csv' % (fname))):
-            with file(('%s/pos_sed.csv' % (fname)),'wb') as outfile:
-                writer = csv.writer(outfile, delimiter=',')
-                data = [naccept,np.ndarray.tolist(pos_sed1),np.ndarray.tolist(pos_sed2),np.ndarray.tolist(pos_sed3),np.ndarray.tolist(pos_sed4)]
-                writer.writerow(data)
-        else:
-            with file(('%s/pos_sed.csv' % (fname)),'ab') as outfile:
-                writer = csv.writer(outfile, delimiter=',')
-                data = [naccept,np.ndarray.tolist(pos_sed1),np.ndarray.tolist(pos_sed2),np.ndarray.tolist(pos_sed3),np.ndarray.tolist(pos_sed4)]
-                writer.writerow(data)
-    
-    if flowsim == True:
-        if not os.path.isfile(('%s/pos_flow.csv' % (fname))):
-            with file(('%s/pos_flow.csv' % (fname)),'wb') as outfile:
-                writer = csv.writer(outfile, delimiter=',')
-                data = [naccept,np.ndarray.tolist(pos_flow1),np.ndarray.tolist(pos_flow2),np.ndarray.tolist(pos_flow3),np.ndarray.tolist(pos_flow4)]
-                writer.writerow(data)
+class parameterLogger:
+    """
+    This class buffers the records of the posteriors and writes them as typed binary rows.
+
+    Parameters
+    ----------
+    string : fname
+        Output directory.
+
+    integer : nrows
+        Number of buffered records of a file before it is written.
+
+    float : interval
+        Maximum time in seconds between two writes.
+    """
+
+    def __init__(self, fname, nrows=256, interval=30.):
+        """
+        Constructor.
+        """
+
+        self.fname = fname
+        self.nrows = nrows
+        self.interval = interval
+        self._files = {}
+        self._dtypes = {}
+        self._rows = {}
+        self._last = time.time()
+
+        return
+
+    def _open(self, name, fields):
+        """
+        Open the binary file of a record, checking the dtype of an existing file.
+        """
+
+        descr = []
+        for key, value in fields:
+            if key == 'naccept':
+                descr.append((key, '<i8'))
+            elif np.ndim(value) == 0:
+                descr.append((key, '<f8'))
+            else:
+                descr.append((key, '<f8', np.shape(value)))
+        dtype = np.dtype(descr)
+        descr = repr(dtype.descr)
+        header = '%s/%s.dtype' % (self.fname, name)
+        if os.path.isfile(header):
+            with open(header) as infile:
+                if infile.read().strip() != descr:
+                    raise ValueError('Records of %s do not match the existing file.' % name)
         else:
-            with file(('%s/pos_flow.csv' % (fname)),'ab') as outfile:
-                writer = csv.writer(outfile, delimiter=',')
-                data = [naccept,np.ndarray.tolist(pos_flow1),np.ndarray.tolist(pos_flow2),np.ndarray.tolist(pos_flow3),np.ndarray.tolist(pos_flow4)]
-                writer.writerow(data)
+            with open(header, 'w') as outfile:
+                outfile.write(descr+'\n')
+        self._files[name] = open('%s/%s.bin' % (self.fname, name), 'ab')
+        self._dtypes[name] = dtype
+        self._rows[name] = []
 
-    if not os.path.isfile(('%s/pos_m.csv' % (fname))):
-        with file(('%s/pos_m.csv' % (fname)),'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_m]
-            writer.writerow(data)
-    else:
-        with file(('%s/pos_m.csv' % (fname)),'ab') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_m]
-            writer.writerow(data)
+        return
 
-    if not os.path.isfile(('%s/pos_aij.csv' % (fname))):
-        with file(('%s/pos_aij.csv' % (fname)),'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_ax,pos_ay]
-            writer.writerow(data)
-    else:
-        with file(('%s/pos_aij.csv' % (fname)),'ab') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_ax,pos_ay]
-            writer.writerow(data)
+    def record(self, name, fields):
+        """
+        Buffer a record.
 
-    if not os.path.isfile(('%s/pos_diff.csv' % (fname))):
-        with file(('%s/pos_diff.csv' % (fname)),'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_diff]
-            writer.writerow(data)
-    else:
-        with file(('%s/pos_diff.csv' % (fname)),'ab') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_diff]
-            writer.writerow(data)
+        Parameters
+        ----------
 
-    if not os.path.isfile(('%s/pos_likl.csv' % (fname))):
-        with file(('%s/pos_likl.csv' % (fname)),'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_likl]
-            writer.writerow(data)
-    else:
-        with file(('%s/pos_likl.csv' % (fname)),'ab') as outfile:
+        string : name
+            Name of the file (e.g. pos_sed).
+
+        variable : fields
+            List of (field name, value) pairs, values being scalars or arrays.
+        """
+
+        if name not in self._files:
+            self._open(name, fields)
+        self._rows[name].append(tuple([value for key, value in fields]))
+        if len(self._rows[name]) >= self.nrows or time.time() - self._last >= self.interval:
+            self.flush()
+
+        return
+
+    def flush(self):
+        """Write the buffered records."""
+
+        for name, rows in self._rows.items():
+            if len(rows) == 0:
+                continue
+            np.array(rows, dtype=self._dtypes[name]).tofile(self._files[name])
+            self._files[name].flush()
+            self._rows[name] = []
+        self._last = time.time()
+
+        return
+
+    def close(self):
+        """Write the buffered records and close the files."""
+
+        self.flush()
+        for outfile in self._files.values():
+            outfile.close()
+        self._files = {}
+        self._rows = {}
+
+        return
+
+# Loggers of the output directories used by saveParameters
+_loggers = {}
+
+def closeParameters(fname=None):
+    """
+    Write the buffered records of an output directory (all of them by default) and close
+    the files.
+
+    Parameters
+    ----------
+
+    string : fname
+        Output directory.
+    """
+
+    for key in list(_loggers.keys()):
+        if fname is None or key == fname:
+            _loggers.pop(key).close()
+
+    return
+
+atexit.register(closeParameters)
+
+def readParameters(fname, name):
+    """
+    Return the records of a binary file as a numpy structured array. An incomplete last
+    row (interrupted run) is ignored.
+
+    Parameters
+    ----------
+
+    string : fname
+        Output directory.
+
+    string : name
+        Name of the file (e.g. pos_sed).
+    """
+
+    if fname in _loggers:
+        _loggers[fname].flush()
+    with open('%s/%s.dtype' % (fname, name)) as infile:
+        dtype = np.dtype(ast.literal_eval(infile.read().strip()))
+    data = open('%s/%s.bin' % (fname, name), 'rb').read()
+    nrows = len(data)//dtype.itemsize
+
+    return np.frombuffer(data[:nrows*dtype.itemsize], dtype=dtype)
+
+def _format(value):
+
+    if np.ndim(value) > 0:
+        return np.ndarray.tolist(value)
+
+    return float(value)
+
+def exportParameters(fname, names=None):
+    """
+    Convert the binary files of an output directory to CSV files with the layout written
+    by previous versions of saveParameters (arrays as lists).
+
+    Parameters
+    ----------
+
+    string : fname
+        Output directory.
+
+    variable : names
+        Names of the files to convert, all of them by default.
+    """
+
+    if names is None:
+        names = sorted([f[:-6] for f in os.listdir(fname) if f.endswith('.dtype')])
+
+    for name in names:
+        records = readParameters(fname, name)
+        with file(('%s/%s.csv' % (fname, name)),'wb') as outfile:
             writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,pos_likl]
-            writer.writerow(data)
+            for row in records:
+                if name == 'pos_proposals':
+                    writer.writerow(np.ndarray.tolist(row['proposal']))
+                    continue
+                data = [int(row['naccept'])] + [_format(row[key]) for key in records.dtype.names[1:]]
+                writer.writerow(data)
+
+    return names
+
+def saveParameters(fname, sedsim, flowsim, naccept, pos_m, pos_ax, pos_ay,
+    pos_sed1, pos_sed2, pos_sed3, pos_sed4,
+    pos_flow1, pos_flow2, pos_flow3, pos_flow4, pos_diff, pos_likl, pos_samples, proposal):
+
+    if fname not in _loggers:
+        _loggers[fname] = parameterLogger(fname)
+    logger = _loggers[fname]
+
+    if sedsim == True:
+        logger.record('pos_sed', [('naccept', naccept), ('sed1', pos_sed1), ('sed2', pos_sed2),
+                                  ('sed3', pos_sed3), ('sed4', pos_sed4)])
+    if flowsim == True:
+        logger.record('pos_flow', [('naccept', naccept), ('flow1', pos_flow1), ('flow2', pos_flow2),
+                                   ('flow3', pos_flow3), ('flow4', pos_flow4)])
+    logger.record('pos_m', [('naccept', naccept), ('m', pos_m)])
+    logger.record('pos_aij', [('naccept', naccept), ('ax', pos_ax), ('ay', pos_ay)])
+    logger.record('pos_diff', [('naccept', naccept), ('diff', pos_diff)])
+    logger.record('pos_likl', [('naccept', naccept), ('likl', pos_likl)])
 
     # Save accepted samples
-    if not os.path.isfile(('%s/pos_samples.csv' % (fname))):
-        with file(('%s/pos_samples.csv' % (fname)),'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,np.ndarray.tolist(pos_samples)]
-            writer.writerow(data)
-    else:
-        with file(('%s/pos_samples.csv' % (fname)),'ab') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            data = [naccept,np.ndarray.tolist(pos_samples)]
-            writer.writerow(data)
-    
+    logger.record('pos_samples', [('naccept', naccept), ('samples', pos_samples)])
+
     # Save accepted proposals
-    if not os.path.isfile('%s/pos_proposals.csv' % (fname)):
-        with file(('%s/pos_proposals.csv' % (fname)), 'wb') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            writer.writerow(proposal)
-    else:
-        with file(('%s/pos_proposals.csv' % (fname)), 'ab') as outfile:
-            writer = csv.writer(outfile, delimiter=',')
-            writer.writerow(proposal)
\ No newline at end of file
+    logger.record('pos_proposals', [('proposal', proposal)])
+
+    return
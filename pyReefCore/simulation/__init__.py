@@ -10,6 +10,13 @@
    Implementation relating to pyReefCore coral evolution.
 """
 
-import coralGLV
-import coreData
-import modelPlot
+from ..lazyImport import install
+
+install(__name__, {
+    'coralGLV': '.coralGLV',
+    'coreData': '.coreData',
+    'modelPlot': '.modelPlot',
+    'phaseCounters': '.phaseCounters',
+    'compactCore': '.compactCore',
+    'forwardKernel': '.forwardKernel',
+})
@@ -0,0 +1,176 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the compact categorical core shared by the observed and predicted
+cores: one uint8 code per depth interval (dominant assemblage, the last code being the
+sediment), optional float32 proportions and the depths of the intervals.
+"""
+import numpy
+
+def codes(core):
+    """
+    Return the uint8 dominant codes of a core given as proportions or one-hot rows (one
+    row per depth interval). Codes start at 1 so that 0 is preserved as 'none'.
+
+    Parameters
+    ----------
+
+    variable : core
+        Core proportions with one row per depth interval.
+    """
+
+    return (numpy.argmax(core, axis=1) + 1).astype(numpy.uint8)
+
+class compactCore:
+    """
+    This class stores a core as uint8 dominant codes with optional float32 proportions
+    and the depths of the intervals.
+
+    Parameters
+    ----------
+    variable : codes
+        Dominant code of each depth interval (1 to the number of columns).
+
+    variable : depths
+        Depth of each interval.
+
+    variable : proportions
+        Optional proportions of each community and of the sediment (one row per depth
+        interval).
+
+    integer : ncols
+        Number of columns of the core (communities and sediment).
+    """
+
+    def __init__(self, codes, depths=None, proportions=None, ncols=None):
+        """
+        Constructor.
+        """
+
+        self.codes = numpy.asarray(codes, dtype=numpy.uint8)
+        self.depths = None
+        if depths is not None:
+            self.depths = numpy.asarray(depths, dtype=numpy.float32)
+            if len(self.depths) != len(self.codes):
+                raise ValueError('One depth needs to be defined for each core interval.')
+        self.proportions = None
+        if proportions is not None:
+            self.proportions = numpy.asarray(proportions, dtype=numpy.float32)
+            ncols = self.proportions.shape[1]
+        if ncols is None:
+            ncols = int(self.codes.max()) if len(self.codes) > 0 else 0
+        self.ncols = ncols
+
+        return
+
+    @staticmethod
+    def from_proportions(core, depths=None, keep=True):
+        """
+        Build a compact core from predicted proportions.
+
+        Parameters
+        ----------
+
+        variable : core
+            Core proportions with one row per depth interval.
+
+        variable : depths
+            Depth of each interval.
+
+        variable : keep
+            Keep the float32 proportions (needed by the posterior predictive summaries).
+        """
+
+        core = numpy.asarray(core)
+        proportions = None
+        if keep:
+            proportions = core
+
+        return compactCore(codes(core), depths, proportions, ncols=core.shape[1])
+
+    @staticmethod
+    def from_onehot(core, depths=None):
+        """
+        Build a compact core from one-hot rows (observed core data).
+
+        Parameters
+        ----------
+
+        variable : core
+            One-hot core with one row per depth interval.
+
+        variable : depths
+            Depth of each interval.
+        """
+
+        core = numpy.asarray(core)
+
+        return compactCore(codes(core), depths, ncols=core.shape[1])
+
+    def __len__(self):
+
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        """Memory used by the core arrays."""
+
+        size = self.codes.nbytes
+        if self.depths is not None:
+            size += self.depths.nbytes
+        if self.proportions is not None:
+            size += self.proportions.nbytes
+
+        return size
+
+    def onehot(self):
+        """
+        Return the core as float one-hot rows.
+        """
+
+        core = numpy.zeros((len(self.codes), self.ncols))
+        core[numpy.arange(len(self.codes)), self.codes.astype(int)-1] = 1.
+
+        return core
+
+    def dense(self):
+        """
+        Return the core proportions, or the one-hot rows if the proportions were not kept.
+        """
+
+        if self.proportions is not None:
+            return self.proportions.astype(float)
+
+        return self.onehot()
+
+    def sediment(self):
+        """
+        Return the mask of the intervals made of sediment only.
+        """
+
+        if self.proportions is not None:
+            return self.proportions[:,-1] == 1.
+
+        return self.codes == self.ncols
+
+    def matches(self, other):
+        """
+        Return the mask of the intervals with the same dominant code in both cores.
+
+        Parameters
+        ----------
+
+        variable : other
+            compactCore instance or array of codes.
+        """
+
+        if isinstance(other, compactCore):
+            other = other.codes
+
+        return self.codes == other
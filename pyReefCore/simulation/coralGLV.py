@@ -13,8 +13,21 @@ The GLV equation is mainly formed by two parts, the logistic growth/decay of a s
 and its interaction with the other species.
 """
 import os
+import time
 import numpy
-import odespy
+
+# RKF relative and absolute tolerances of the solver accuracy profiles. The default profile
+# holds the tolerances pyReefCore has always used, the strict and fast values are provisional
+# until MCMC_Sampling/tolerance_check.py has been run with the odespy library
+profiles = {'strict': (1.e-10, 1.e-14),
+            'default': (1.e-8, 1.e-12),
+            'fast': (1.e-6, 1.e-8)}
+
+class budgetExceeded(RuntimeError):
+    """
+    Raised when a simulation exceeds its time or right-hand side evaluation budget.
+    """
+    pass
 
 class coralGLV:
     """
@@ -27,12 +40,17 @@ class coralGLV:
         Constructor.
         """
 
-        # RKF relative tolerance for solution
-        self.rtol = 1.e-8#1.e-6
-        # RKF absolute tolerance for solution
-        self.atol = 1.e-12#1.e-8
+        # RKF relative and absolute tolerances for solution
+        profile = 'default'
+        if input.profile is not None:
+            profile = input.profile
+        self.set_profile(profile)
         # RKF minimum step size for an adaptive algorithm.
         self.min_step = 1.e-4
+        # RKF maximum step size, None keeps odespy's default (the ODE time interval)
+        self.max_step = None
+        # Tolerances defined in the XmL input file
+        self.set_tolerances(input.rtol, input.atol)
         # Definition of the intrinsic rate of a population species
         self.epsilon = input.malthusParam
         # Community matrix representing the interactions between species
@@ -41,6 +59,50 @@ class coralGLV:
         self.iterationTime = numpy.arange(input.tStart, input.tEnd+input.tCarb, input.tCarb)
         self.population = numpy.zeros((input.speciesNb,len(self.iterationTime)),dtype=float)
         self.accspace = numpy.zeros(len(self.iterationTime),dtype=float)
+        # Number of right-hand side evaluations of the GLV equation
+        self.nrhs = 0
+        # Optional budget: maximum value of nrhs and wall-clock deadline
+        self.maxRHS = None
+        self.deadline = None
+
+        return
+
+    def set_profile(self, profile):
+        """
+        Set the RKF tolerances of a named accuracy profile, the other solver settings are
+        left unchanged.
+
+        Parameters
+        ----------
+
+        variable : profile
+            Name of the profile: strict, default or fast.
+        """
+
+        if profile not in profiles:
+            raise ValueError('Unknown solver profile %s, use one of %s.' %(profile, ', '.join(sorted(profiles))))
+        self.rtol, self.atol = profiles[profile]
+
+        return
+
+    def set_tolerances(self, rtol=None, atol=None):
+        """
+        Set the RKF tolerances, values left to None are unchanged.
+
+        Parameters
+        ----------
+
+        float : rtol
+            Relative tolerance of the RKF solver.
+
+        float : atol
+            Absolute tolerance of the RKF solver.
+        """
+
+        if rtol is not None:
+            self.rtol = rtol
+        if atol is not None:
+            self.atol = atol
 
         return
 
@@ -58,6 +120,11 @@ class coralGLV:
             Time step on which to solve the ODEs for.
         """
 
+        self.nrhs += 1
+        if self.maxRHS is not None and self.nrhs > self.maxRHS:
+            raise budgetExceeded('GLV solver exceeded its budget of right-hand side evaluations.')
+        if self.deadline is not None and self.nrhs % 64 == 0 and time.time() > self.deadline:
+            raise budgetExceeded('GLV solver exceeded its time budget.')
         function = numpy.zeros(len(self.epsilon))
 
         for eq in range(len(self.epsilon)):
@@ -69,8 +136,13 @@ class coralGLV:
         This function build the RKF solver used for the Generalized Lotka-Volterra equation.
         """
         
+        import odespy
+
         # RKF initialisation
-        odeRKF = odespy.RKF45(self._functionGLV, atol=self.atol,
-                                   rtol=self.rtol, min_step=self.min_step)
+        options = {}
+        if self.max_step is not None:
+            options['max_step'] = self.max_step
+        odeRKF = odespy.RKF45(self._functionGLV, atol=self.atol, rtol=self.rtol,
+                              min_step=self.min_step, **options)
 
         return odeRKF
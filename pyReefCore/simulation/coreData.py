@@ -12,13 +12,6 @@ the interactions between the active forcing paramters.
 """
 import os
 import numpy
-import pandas as pd
-import skfuzzy as fuzz
-
-import matplotlib
-from matplotlib import gridspec
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
 
 class coreData:
     """
@@ -89,6 +82,9 @@ class coreData:
     def _plot_fuzzy_curve(self, xd, xs, xf, dtrap, strap, ftrap, size,
                           dpi, font, colors, width, fname):
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         for s in range(len(self.names)):
@@ -143,7 +139,14 @@ class coreData:
             Save filename.
         """
 
+        import matplotlib
+        import pandas as pd
+        import skfuzzy as fuzz
+        from matplotlib import gridspec
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mtick
         from matplotlib.cm import terrain
+
         # nbcolors = len(self.names)+3
         # JODIE EDIT: colour range from 0-1.8 from 0-1
         # nbcolors = len(self.names)+3
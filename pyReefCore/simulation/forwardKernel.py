@@ -0,0 +1,536 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module defines the compiled forward kernel of pyReefCore: the whole carbonate time
+loop (sea-level, sediment and flow production factors, GLV integration, population
+clamps, carbonate production and layer bookkeeping) runs in a single function. When numba
+is installed the kernel is compiled in nopython mode and releases the GIL, otherwise the
+same kernel runs with NumPy right-hand side and Runge-Kutta stage evaluations.
+
+The forcing values which only depend on time (sea level, sediment and flow curves read
+from files) are tabulated at the carbonate time steps before the loop. The GLV equation
+is integrated with the Runge-Kutta-Fehlberg (4,5) method of the odespy RKF45 solver: a
+step is accepted when the RMS norm of its local error relative to the tolerances is at
+most 1, when it reaches min_step or when it is at least max_step long, and the next step
+is scaled by 0.84*norm**(-1/4), kept within 0.1 and 4 times the current step and within
+min_step and max_step. As in coralGLV, max_step defaults to the ODE time interval
+(odespy's default).
+
+The two backends are expected to agree to the solver tolerance rather than bitwise. This
+parity is unverified: MCMC_Sampling/kernel_check.py compares them on prior draws and
+needs the odespy library, it has not been run with it. Until it passes the kernel is not
+one of the Model backends (see model.unvalidated).
+"""
+import math
+import time
+import numpy
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+import coralGLV
+
+# Runge-Kutta-Fehlberg (4,5) tableau: the fourth order solution is kept and the fifth
+# order one gives the local error
+_c = numpy.array([0., 1./4, 3./8, 12./13, 1., 1./2])
+_a = numpy.array([[0., 0., 0., 0., 0., 0.],
+                  [1./4, 0., 0., 0., 0., 0.],
+                  [3./32, 9./32, 0., 0., 0., 0.],
+                  [1932./2197, -7200./2197, 7296./2197, 0., 0., 0.],
+                  [439./216, -8., 3680./513, -845./4104, 0., 0.],
+                  [-8./27, 2., -3544./2565, 1859./4104, -11./40, 0.]])
+_b = numpy.array([25./216, 0., 1408./2565, 2197./4104, -1./5, 0.])
+_berr = _b - numpy.array([16./135, 0., 6656./12825, 28561./56430, -9./50, 2./55])
+
+# Forcing modes: constant value, time table, exponential decay or linear function of depth
+CONSTANT, TABLE, DECAY, LINEAR = 0, 1, 2, 3
+
+def _jit(func):
+    """
+    Compile a kernel function with numba (nopython mode, GIL released) when available.
+    """
+
+    if numba is None:
+        return func
+
+    return numba.jit(nopython=True, nogil=True, cache=True)(func)
+
+def backend():
+    """Return the backend running the kernel: numba or numpy."""
+
+    if numba is None:
+        return 'numpy'
+
+    return 'numba'
+
+@_jit
+def _rhs(alpha, epsilon, x, out):
+    """
+    Right-hand side of the Generalized Lotka-Volterra equation (coralGLV._functionGLV).
+    """
+
+    n = x.shape[0]
+    for i in range(n):
+        acc = 0.
+        for j in range(n):
+            acc += alpha[i,j]*x[j]
+        out[i] = (epsilon[i]+acc)*x[i]
+
+    return
+
+@_jit
+def _stage(a, k, m, y, h, out):
+    """
+    State of the Runge-Kutta stage m.
+    """
+
+    for j in range(y.shape[0]):
+        acc = 0.
+        for l in range(m):
+            acc += a[m,l]*k[l,j]
+        out[j] = y[j] + h*acc
+
+    return
+
+@_jit
+def _update(b, berr, k, y, h, ynew, rtol, atol):
+    """
+    Fourth order solution of a Runge-Kutta step, return the RMS norm of its local error
+    relative to the tolerances (the step is accurate if it is at most 1).
+    """
+
+    norm = 0.
+    for j in range(y.shape[0]):
+        acc = 0.
+        err = 0.
+        for l in range(k.shape[0]):
+            acc += b[l]*k[l,j]
+            err += berr[l]*k[l,j]
+        ynew[j] = y[j] + h*acc
+        scaled = h*err/(rtol*abs(ynew[j]) + atol)
+        norm += scaled*scaled
+
+    return math.sqrt(norm/y.shape[0])
+
+if numba is None:
+    # NumPy versions of the Runge-Kutta evaluations
+    def _rhs(alpha, epsilon, x, out):
+        out[:] = (epsilon+numpy.sum(alpha*x, axis=1))*x
+
+    def _stage(a, k, m, y, h, out):
+        out[:] = y + h*numpy.dot(a[m,:m], k[:m])
+
+    def _update(b, berr, k, y, h, ynew, rtol, atol):
+        ynew[:] = y + h*numpy.dot(b, k)
+        scaled = h*numpy.dot(berr, k)/(rtol*numpy.abs(ynew) + atol)
+        return math.sqrt(numpy.mean(scaled*scaled))
+
+@_jit
+def _rkf45(y, t0, t1, alpha, epsilon, c, a, b, berr, rtol, atol, min_step, max_step, maxRHS,
+           clock, k, ytmp, ynew):
+    """
+    Integrate the GLV equation from t0 to t1 in adaptive Runge-Kutta-Fehlberg steps (y is
+    updated), return 1 if the right-hand side evaluation budget is exceeded. The step
+    control follows odespy's RKF45 but has not been checked against it.
+    """
+
+    dt = t1 - t0
+    min_step = min(min_step, dt)
+    if max_step <= 0.:
+        max_step = dt
+    h = min(dt, max_step)
+    t = t0
+    while abs(t - t0) < abs(dt):
+        for m in range(c.shape[0]):
+            _stage(a, k, m, y, h, ytmp)
+            _rhs(alpha, epsilon, ytmp, k[m])
+            clock[6] += 1.
+            if maxRHS > 0 and clock[6] > maxRHS:
+                return 1
+        norm = _update(b, berr, k, y, h, ynew, rtol, atol)
+        if norm <= 1. or h <= min_step or h >= max_step:
+            clock[9] += 1.
+            for j in range(y.shape[0]):
+                y[j] = ynew[j]
+            t = t + h
+            if t1 - t <= 0.:
+                break
+
+        # Next step from the error norm, within 0.1 and 4 times the current step
+        if norm > 0.:
+            s = min(max(0.84*norm**-.25, .1), 4.)
+        else:
+            s = 4.
+        h = min(max(h*s, min_step), max_step, t1 - t)
+
+    return 0
+
+@_jit
+def _factor(value, x, trap, env):
+    """
+    Production factor of a species for a forcing value (enviForce.getSea, getSed, getFlow).
+    """
+
+    n = x.shape[0]
+    if value < x[0]:
+        if env[1] == env[0]:
+            return 1.
+        return 0.
+    if value > x[n-1]:
+        if env[2] == env[3]:
+            return 1.
+        return 0.
+
+    # First grid value above the forcing value (enviForce._extract_enviParam)
+    lo = 0
+    hi = n - 1
+    while lo < hi:
+        mid = (lo + hi)//2
+        if x[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    if x[lo] == value:
+        return trap[lo]
+    slope = (trap[lo] - trap[lo-1]) / (x[lo] - x[lo-1])
+
+    return slope * (value - x[lo-1]) + trap[lo-1]
+
+@_jit
+def _level(spec, tvalue, elev):
+    """
+    Sediment input or flow velocity of a carbonate time step.
+    """
+
+    mode = int(spec[1])
+    if mode == CONSTANT:
+        return spec[2]
+    if mode == TABLE:
+        return tvalue
+
+    if spec[4] < elev or spec[3] > elev:
+        value = 0.
+    elif mode == DECAY:
+        value = spec[5]*math.exp(-spec[6]*elev) + spec[7]
+    else:
+        value = (elev - spec[6])/spec[5]
+    if value < 0.:
+        value = 0.
+
+    return value
+
+@_jit
+def _run(nsteps, tEnd, N, tStart, tCarb, laytime, clock, index, spec, tvals, grids, traps,
+         envs, facs, malthus, alpha, pop0, prod, maxpop, population, accspace, thickness,
+         coralH, sealevel, sedinput, waterflow, c, a, b, berr, rtol, atol, min_step, max_step,
+         maxRHS):
+    """
+    Carbonate time loop of SimulationState.advance, for at most nsteps steps. The time
+    state (tNow, tCoral, tLayer, topH, previous sea level, right-hand side evaluations,
+    sediment and flow levels, accepted RKF steps) is kept in clock and the iteration and
+    layer indices in index. Return 1 if the right-hand side evaluation budget is exceeded.
+    """
+
+    n = malthus.shape[0]
+    nprod = prod.shape[0]
+    k = numpy.zeros((c.shape[0], n))
+    y = numpy.zeros(n)
+    ytmp = numpy.zeros(n)
+    ynew = numpy.zeros(n)
+    fac = numpy.zeros(n)
+    eps = numpy.zeros(n)
+    production = numpy.zeros(nprod)
+
+    tNow = clock[0]
+    tCoral = clock[1]
+    tLayer = clock[2]
+    topH = clock[3]
+    it = index[0]
+    lay = index[1]
+    done = 0
+    while tNow < tEnd and done < nsteps and it + 1 < population.shape[1]:
+        # Initial coral population
+        if tNow == tStart:
+            for s in range(n):
+                population[s,it] = pop0[s]
+
+        # Store accomodation space through time
+        accspace[it] = max(topH, 0.)
+
+        # Sea-level and depth production factors
+        if spec[0,0] > 0.:
+            if int(spec[0,1]) == TABLE:
+                sea = tvals[0,it]
+            else:
+                sea = spec[0,2]
+            if clock[5] > 0.:
+                topH = topH + (sea - clock[4])
+            clock[4] = sea
+            clock[5] = 1.
+            for s in range(n):
+                facs[0,s] = _factor(topH, grids[0], traps[0,s], envs[0,s])
+            if tNow == tStart:
+                sealevel[lay] = sea
+            else:
+                sealevel[lay+1] = sea
+
+        # Sediment input
+        sedh = 0.
+        if spec[1,0] > 0.:
+            sedh = _level(spec[1], tvals[1,it], topH)
+            for s in range(n):
+                facs[1,s] = _factor(sedh, grids[1], traps[1,s], envs[1,s])
+            sedinput[lay] = sedh
+            clock[7] = sedh
+
+        # Flow velocity
+        if spec[2,0] > 0.:
+            flow = _level(spec[2], tvals[2,it], topH)
+            for s in range(n):
+                facs[2,s] = _factor(flow, grids[2], traps[2,s], envs[2,s])
+            waterflow[lay] = flow
+            clock[8] = flow
+
+        # Limit species activity from environmental forces
+        for s in range(n):
+            fac[s] = min(facs[2,s], min(facs[0,s], facs[1,s]))
+            eps[s] = malthus[s] * fac[s]
+            y[s] = population[s,it]
+
+        # Solve the Generalized Lotka-Volterra equation on N time intervals
+        tCoral += tCarb
+        step = (tCoral - tNow)/N
+        for i in range(N):
+            t0 = i*step + tNow
+            t1 = tCoral
+            if i < N - 1:
+                t1 = (i+1)*step + tNow
+            if _rkf45(y, t0, t1, alpha, eps, c, a, b, berr, rtol, atol, min_step, max_step,
+                      maxRHS, clock, k, ytmp, ynew) > 0:
+                clock[0] = tNow
+                clock[3] = topH
+                return 1
+
+        # Update coral population
+        it += 1
+        for s in range(n):
+            pop = y[s]
+            if pop > 100.:
+                pop = 100.
+            if eps[s] == 0.:
+                pop = 0.
+            if fac[s] >= 0.5 and pop == 0.:
+                pop = 1.
+            population[s,it] = pop
+
+        # In case there is no accomodation space
+        if topH <= 0.:
+            for s in range(n):
+                population[s,it] = 0.
+
+        # Carbonate production (coreData.coralProduction)
+        total = 0.
+        for s in range(nprod):
+            production[s] = 0.
+            if eps[s] > 0.:
+                production[s] = prod[s] * population[s,it] * tCarb / maxpop
+            if production[s] > prod[s] * tCarb:
+                production[s] = prod[s] * tCarb
+            total += production[s]
+        sh = sedh * tCarb
+        toth = total + sh
+        if topH < 0.:
+            pass
+        elif topH > 0. and topH - sh < 0.:
+            coralH[nprod,lay] += topH
+            thickness[lay] += topH
+            topH = 0.
+        elif topH > 0.:
+            if topH - toth < 0:
+                frac = (topH - sh)/total
+                total = 0.
+                for s in range(nprod):
+                    production[s] *= frac
+                    total += production[s]
+                toth = total + sh
+            for s in range(nprod):
+                coralH[s,lay] += production[s]
+            coralH[nprod,lay] += sh
+            thickness[lay] += toth
+            topH -= toth
+
+        # Update time step and stratigraphic layer
+        tNow = tCoral
+        if tLayer <= tNow:
+            tLayer += laytime
+            lay += 1
+        done += 1
+
+        clock[0] = tNow
+        clock[1] = tCoral
+        clock[2] = tLayer
+        clock[3] = topH
+        index[0] = it
+        index[1] = lay
+
+    return 0
+
+def _forcing(force, input, times):
+    """
+    Return the forcing specifications (on, mode, constant value, depth range and function
+    parameters) and the values of the time tables at the carbonate time steps.
+    """
+
+    spec = numpy.zeros((3,8))
+    tvals = numpy.zeros((3,len(times)))
+    tables = [(force.seaFunc, force.seatime), (force.sedFunc, force.sedtime),
+              (force.flowFunc, force.flowtime)]
+    for f, on in enumerate([input.seaOn, input.sedOn, input.flowOn]):
+        spec[f,0] = float(on)
+    spec[0,2] = force.sea0
+    spec[1,2] = force.sed0
+    spec[2,2] = force.flow0
+
+    fcts = [(False, None, None, None), (force.sedfct, force.plotsedx, force.sedopt, force.sedlin),
+            (force.flowfct, force.plotflowx, force.flowopt, force.flowlin)]
+    for f in range(3):
+        fct, x, opt, lin = fcts[f]
+        func, ftime = tables[f]
+        if fct:
+            spec[f,3] = x.min()
+            spec[f,4] = x.max()
+            if lin is None:
+                spec[f,1] = DECAY
+                spec[f,5:8] = opt
+            else:
+                spec[f,1] = LINEAR
+                spec[f,5:7] = lin
+        elif f == 0 and force.seafile is not None or f > 0 and func is not None:
+            spec[f,1] = TABLE
+            if len(times) > 0:
+                tvals[f] = func(numpy.clip(times, ftime.min(), ftime.max()))
+
+    return spec, tvals
+
+def _curves(force, n):
+    """
+    Return the grids, trapezoidal production curves and parameters of the depth, sediment
+    and flow forcing.
+    """
+
+    size = max([len(x) for x in [force.xd, force.xs, force.xf] if x is not None] + [1])
+    grids = numpy.zeros((3,size))
+    traps = numpy.zeros((3,n,size))
+    envs = numpy.zeros((3,n,4))
+    for f, (x, trap, env) in enumerate([(force.xd, force.dtrap, force.edepth),
+                                        (force.xs, force.strap, force.esed),
+                                        (force.xf, force.ftrap, force.eflow)]):
+        if x is None:
+            continue
+        grids[f,:len(x)] = x
+        traps[f,:,:len(x)] = numpy.asarray(trap)[:n]
+        envs[f] = env[:n]
+        if len(x) < size:
+            # Constant extension beyond the grid, never reached by the factors
+            grids[f,len(x):] = x[-1]
+            traps[f,:,len(x):] = traps[f,:,len(x)-1:len(x)]
+
+    return grids, traps, envs
+
+def advance(state, tEnd, N, chunk=16):
+    """
+    Run the carbonate time loop of a SimulationState to tEnd with the kernel.
+
+    Parameters
+    ----------
+
+    variable : state
+        SimulationState (or Model) after setup and start.
+
+    float : tEnd
+        Simulation time to reach.
+
+    integer : N
+        Number of ODE steps of each carbonate time interval.
+
+    integer : chunk
+        Number of carbonate time steps run between two checks of the wall-clock budget.
+    """
+
+    input = state.input
+    force = state.force
+    core = state.core
+    coral = state.coral
+    n = input.speciesNb
+
+    # Carbonate time steps which remain to be run
+    nt = coral.population.shape[1]
+    times = numpy.zeros(nt)
+    t = state.tCoral
+    for k in range(state.iter, nt):
+        times[k] = t
+        t += input.tCarb
+    spec, tvals = _forcing(force, input, times)
+    grids, traps, envs = _curves(force, n)
+
+    clock = numpy.zeros(10)
+    clock[:4] = [state.tNow, state.tCoral, state.tLayer, core.topH]
+    if force.sealevel is not None:
+        clock[4] = force.sealevel
+        clock[5] = 1.
+    clock[6] = coral.nrhs
+    index = numpy.array([state.iter, state.layID], dtype=numpy.int64)
+    facs = numpy.ones((3,n))
+    maxRHS = coral.maxRHS if coral.maxRHS is not None else -1
+    max_step = coral.max_step if coral.max_step is not None else -1.
+
+    nsteps = nt
+    if coral.deadline is not None:
+        nsteps = chunk
+    malthus = numpy.ascontiguousarray(input.malthusParam, dtype=float)
+    alpha = numpy.ascontiguousarray(input.communityMatrix, dtype=float)
+    pop0 = numpy.ascontiguousarray(input.speciesPopulation, dtype=float)
+    prod = numpy.ascontiguousarray(core.prod, dtype=float)
+
+    t0 = time.time()
+    status = 0
+    while state.tNow < tEnd:
+        if coral.deadline is not None and time.time() > coral.deadline:
+            state.counters.add('aborted', 1)
+            raise coralGLV.budgetExceeded('Simulation exceeded its time budget at %s [yr].' %state.tNow)
+        iter0 = index[0]
+        status = _run(nsteps, tEnd, N, input.tStart, input.tCarb, input.laytime, clock, index,
+                      spec, tvals, grids, traps, envs, facs, malthus, alpha, pop0, prod,
+                      float(core.maxpop), coral.population, coral.accspace, core.thickness,
+                      core.coralH, core.sealevel, core.sedinput, core.waterflow, _c, _a, _b,
+                      _berr, coral.rtol, coral.atol, coral.min_step, max_step, maxRHS)
+        state.counters.add('ode_steps', int(clock[9]))
+        clock[9] = 0.
+        state.tNow, state.tCoral, state.tLayer, core.topH = [float(v) for v in clock[:4]]
+        state.iter, state.layID = int(index[0]), int(index[1])
+        coral.nrhs = int(clock[6])
+        if clock[5] > 0.:
+            force.sealevel = clock[4]
+        if input.sedOn:
+            force.sedlevel = clock[7]
+        if input.flowOn:
+            force.flowlevel = clock[8]
+        if status > 0 or index[0] == iter0:
+            break
+    coral.epsilon = input.malthusParam * numpy.minimum(facs[2], numpy.minimum(facs[0], facs[1]))
+    state.dt = input.tCarb/N
+    state.counters.add('ode_time', time.time()-t0)
+
+    if status > 0:
+        state.counters.add('aborted', 1)
+        raise coralGLV.budgetExceeded('GLV solver exceeded its budget of right-hand side evaluations.')
+
+    return
@@ -10,13 +10,8 @@
 Here we set plotting functions used to visualise pyReef dataset.
 """
 
-import matplotlib
+import time
 import numpy as np
-import pandas as pd
-from matplotlib import gridspec
-import matplotlib.pyplot as plt
-
-from scipy.ndimage.filters import gaussian_filter
 
 import warnings
 warnings.simplefilter(action = "ignore", category = FutureWarning)
@@ -44,6 +39,8 @@ class modelPlot():
         self.sealevel = None
         self.sedinput = None
         self.waterflow = None
+        # Model phase counters
+        self.counters = None
 
         return
 
@@ -70,6 +67,9 @@ class modelPlot():
             Save PNG filename.
         """
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         # Define figure size
@@ -120,6 +120,9 @@ class modelPlot():
             Save PNG filename.
         """
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         # Define figure size
@@ -172,6 +175,9 @@ class modelPlot():
             Save PNG filename.
         """
 
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         matplotlib.rcParams.update({'font.size': font})
 
         # Define figure size
@@ -279,6 +285,7 @@ class modelPlot():
         return propn_asmb_time.T, self.timeLay
 
     def core_timetodepth(self, communities, core_depths):
+        t0 = time.time()
         ids = np.where(self.depth[:-1]>0)[0]
         p2 = np.zeros((self.sedH.shape))
         p2[:,ids] = self.sedH[:,ids]/self.depth[ids]
@@ -304,7 +311,8 @@ class modelPlot():
 
 
         for i in range (0,len(core_depths)):
-            if not ((np.sum(p2[:,i]) == 0) and (depth_incrementor == -0.1)): 
+            # coarse layer intervals can produce less layers than core depths
+            if not ((i < p2.shape[1]) and (np.sum(p2[:,i]) == 0) and (depth_incrementor == -0.1)): 
             # as long as there is growth and the core is not filled
             # if not ((np.sum(p2[0:communities,i]) == 0) and (p2[communities,i] == 1)):
                 idx = (np.abs(d-depth_incrementor)).argmin()
@@ -320,6 +328,8 @@ class modelPlot():
                     depth_incrementor -= depth_increment
                     # print 'next depth', depth_incrementor, 'm \n\n'
                     id_prev=idx
+        if self.counters is not None:
+            self.counters.add('depth_time', time.time()-t0)
         return output_core
 
     # def getTimePlotParameters(self, colors=None):
@@ -369,6 +379,11 @@ class modelPlot():
         variable : sep
             Separator used in the CSV file.
         """
+        import matplotlib
+        import pandas as pd
+        from matplotlib import gridspec
+        import matplotlib.pyplot as plt
+
         label_size = 11
         matplotlib.rcParams['xtick.labelsize'] = label_size 
         matplotlib.rcParams['ytick.labelsize'] = label_size 
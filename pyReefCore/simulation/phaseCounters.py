@@ -0,0 +1,117 @@
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+##                                                                                   ##
+##  This file forms part of the pyReefCore synthetic coral reef core model app.      ##
+##                                                                                   ##
+##  For full license and copyright information, please refer to the LICENSE.md file  ##
+##  located at the project root, or contact the authors.                             ##
+##                                                                                   ##
+##~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~#~##
+"""
+This module accumulates the always-on counters of the pyReefCore simulation phases for
+the current run and across all runs of a model.
+"""
+
+class phaseCounters:
+    """
+    This class records the number of RKF steps (accepted steps of the forward kernel, steps
+    including rejected ones from the six evaluations per step of odespy) and right-hand
+    side evaluations of the GLV equation and the time (in seconds) spent in each phase of
+    a simulation:
+
+        xml_time         XmL input file and forcing files loading
+        sea_time         sea-level forcing (getSea)
+        sed_time         sediment forcing (getSed)
+        flow_time        flow forcing (getFlow)
+        ode_time         GLV equation solver
+        production_time  carbonate production (coralProduction)
+        depth_time       time to depth conversion of the core (core_timetodepth)
+        run_time         whole time loop (run_to_time)
+
+    and the number of runs aborted because they exceeded their budget (see
+    Model.set_budget).
+    """
+
+    keys = ['runs', 'ode_steps', 'rhs_calls', 'xml_time', 'sea_time', 'sed_time', 'flow_time',
+            'ode_time', 'production_time', 'depth_time', 'run_time', 'aborted']
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+
+        self.current = dict([(key, 0) for key in self.keys])
+        self.totals = dict([(key, 0) for key in self.keys])
+
+        return
+
+    def start_run(self):
+        """
+        Reset the counters of the current run.
+        """
+
+        self.current = dict([(key, 0) for key in self.keys])
+        self.add('runs', 1)
+
+        return
+
+    def add(self, key, value):
+        """
+        Increment a counter for the current run and across runs.
+
+        Parameters
+        ----------
+
+        variable : key
+            Counter name.
+
+        variable : value
+            Increment.
+        """
+
+        self.current[key] += value
+        self.totals[key] += value
+
+        return
+
+    def reset(self):
+        """
+        Reset all counters.
+        """
+
+        self.current = dict([(key, 0) for key in self.keys])
+        self.totals = dict([(key, 0) for key in self.keys])
+
+        return
+
+    def run(self):
+        """
+        Return the counters of the current run.
+        """
+
+        return dict(self.current)
+
+    def total(self):
+        """
+        Return the counters accumulated across runs.
+        """
+
+        return dict(self.totals)
+
+    def summary(self):
+        """
+        Return the counters averaged per run and the share of the run time taken by each
+        phase of the time loop.
+        """
+
+        runs = max(self.totals['runs'], 1)
+        mean = dict([(key, float(self.totals[key])/runs) for key in self.keys
+                     if key not in ['runs', 'aborted']])
+        mean['runs'] = self.totals['runs']
+        mean['aborted'] = self.totals['aborted']
+        share = {}
+        if self.totals['run_time'] > 0.:
+            for key in ['sea_time', 'sed_time', 'flow_time', 'ode_time', 'production_time']:
+                share[key] = self.totals[key]/self.totals['run_time']
+        mean['share'] = share
+
+        return mean
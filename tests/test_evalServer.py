@@ -0,0 +1,148 @@
+"""
+Tests of the socket evaluation service (pyReefCore.evalServer) on localhost, with a stub
+worker pool in place of RemoteModel so that no forward model is run. Run from the
+repository root with: python -m unittest discover -s tests
+"""
+import time
+import threading
+import unittest
+
+import numpy as np
+
+from pyReefCore.remote import RemoteError, RemoteTimeout
+from pyReefCore.evalServer import evalServer, evalClient
+
+class stubRemote(object):
+    """
+    Worker pool answering each parameter vector with a fixed core: the rows of the core
+    are depths and the dominant column of every depth is int(v[0]). Vectors whose second
+    value is negative exceed their budget (RemoteTimeout), NaN ones fail (RemoteError).
+    """
+
+    def __init__(self, depths=5, ncols=4, delay=0.):
+
+        self._setup = ('stub.xml', ncols-1, np.arange(depths), 100., True, False)
+        self.depths = depths
+        self.ncols = ncols
+        self.delay = delay
+        self.nruns = 0
+        self.nfailed = 0
+        self.ntimeout = 0
+        self._lock = threading.Lock()
+
+    def ncpus(self):
+
+        return 2
+
+    def imap(self, vectors):
+
+        # Answer in reverse order to check that clients reorder the results
+        for index in reversed(range(len(vectors))):
+            v = vectors[index]
+            time.sleep(self.delay)
+            with self._lock:
+                self.nruns += 1
+            if np.isnan(v[0]):
+                with self._lock:
+                    self.nfailed += 1
+                yield index, RemoteError('Forward model failed.')
+            elif v[1] < 0.:
+                with self._lock:
+                    self.ntimeout += 1
+                yield index, RemoteTimeout('Forward model exceeded 1 s.')
+            else:
+                core = np.zeros((self.depths, self.ncols))
+                core[:, int(v[0])] = 1.
+                yield index, core
+
+def score(core):
+    """Log-likelihood and difference score of a stub core (one row per depth)."""
+
+    return [-float(np.argmax(core[0])), core, 0.5]
+
+class evalServerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.remote = stubRemote()
+        self.server = evalServer(self.remote, score, '127.0.0.1:0')
+        self.thread = self.server.start()
+        self.address = '%s:%d' % self.server.address
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.thread.join(5.)
+
+    def test_ping_info(self):
+
+        with evalClient(self.address, timeout=10.) as client:
+            self.assertTrue(client.ping())
+            info = client.info()
+        self.assertEqual(info['xml'], 'stub.xml')
+        self.assertEqual(info['communities'], 3)
+        self.assertEqual(info['depths'], 5)
+        self.assertEqual(info['workers'], 2)
+
+    def test_evaluate_order(self):
+
+        vectors = [[k % 4, 1.] for k in range(10)]
+        with evalClient(self.address, timeout=10.) as client:
+            results = client.evaluate(vectors)
+        self.assertEqual(len(results), 10)
+        for k, (loglik, diff, codes) in enumerate(results):
+            self.assertEqual(loglik, -float(k % 4))
+            self.assertEqual(diff, 0.5)
+            self.assertEqual(codes.dtype, np.uint8)
+            self.assertTrue(np.all(codes == k % 4 + 1))
+
+    def test_concurrent_clients(self):
+
+        self.remote.delay = 0.001
+        nclients = 5
+        nvectors = 50
+        results = [None] * nclients
+        errors = []
+
+        def run(c):
+            try:
+                with evalClient(self.address, timeout=30.) as client:
+                    vectors = [[(c + k) % 4, 1.] for k in range(nvectors)]
+                    results[c] = [r[0] for r in client.evaluate(vectors)]
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(c,)) for c in range(nclients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60.)
+
+        self.assertEqual(errors, [])
+        for c in range(nclients):
+            self.assertEqual(results[c], [-float((c + k) % 4) for k in range(nvectors)])
+        self.assertEqual(self.remote.nruns, nclients*nvectors)
+
+    def test_timeout_propagation(self):
+
+        vectors = [[1, 1.], [2, -1.], [3, 1.]]
+        with evalClient(self.address, timeout=10.) as client:
+            self.assertRaises(RemoteTimeout, client.evaluate, vectors)
+            results = client.evaluate(vectors, errors='return')
+            # The connection remains usable after failed evaluations
+            self.assertTrue(client.ping())
+        self.assertEqual(results[0][0], -1.)
+        self.assertTrue(isinstance(results[1], RemoteTimeout))
+        self.assertEqual(results[2][0], -3.)
+        self.assertEqual(self.remote.ntimeout, 2)
+
+    def test_failure_propagation(self):
+
+        with evalClient(self.address, timeout=10.) as client:
+            results = client.evaluate([[np.nan, 1.], [1, 1.]], errors='return')
+        self.assertTrue(isinstance(results[0], RemoteError))
+        self.assertFalse(isinstance(results[0], RemoteTimeout))
+        self.assertEqual(results[1][0], -1.)
+
+if __name__ == '__main__':
+    unittest.main()